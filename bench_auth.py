@@ -0,0 +1,46 @@
+"""Накладные расходы token_required на один запрос: без кеша пользователей и с кешем.
+
+Создает временную SQLite-базу с администратором и выполняет запросы к /api/auth/me
+через тестовый клиент Flask, меняя USER_CACHE_TTL.
+
+Запуск: python bench_auth.py [количество запросов]
+"""
+import os
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_auth.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{DB_PATH}"
+
+from server import app, init_db, user_cache
+
+
+def measure(client, headers, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get('/api/auth/me', headers=headers)
+        assert response.status_code == 200, response.get_json()
+    return (time.perf_counter() - started) / count
+
+
+def main(count):
+    init_db()
+    client = app.test_client()
+    client.post('/api/auth/init', json={'username': 'admin', 'password': 'admin'})
+    token = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin'}).get_json()['token']
+    headers = {'Authorization': f"Bearer {token}"}
+
+    results = {}
+    for label, ttl in (('без кеша', 0), ('с кешем', 60)):
+        app.config['USER_CACHE_TTL'] = ttl
+        user_cache.clear()
+        measure(client, headers, 50)  # прогрев
+        results[label] = min(measure(client, headers, count) for _ in range(3))
+        print(f"{label:>10}: {results[label] * 1e6:8.1f} мкс на запрос")
+
+    print(f"Экономия: {(results['без кеша'] - results['с кешем']) * 1e6:.1f} мкс на запрос")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
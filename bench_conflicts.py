@@ -0,0 +1,121 @@
+"""Сравнение поиска накладок: старый попарный перебор против заметающей прямой.
+
+Запуск: python bench_conflicts.py [количество занятий]
+"""
+import random
+import sys
+import time
+from datetime import date, datetime
+
+from server import find_schedule_conflicts, time_to_minutes, CONFLICT_RESOURCES
+
+SLOTS = [('08:00', '09:20'), ('09:30', '10:50'), ('11:00', '12:20'), ('12:40', '14:00'),
+         ('14:10', '15:30'), ('15:40', '17:00'), ('17:10', '18:30'), ('18:40', '20:00'),
+         ('09:00', '10:20'), ('13:00', '14:20')]
+
+
+class BenchLesson:
+    """Занятие с тем же набором полей в to_dict(), что и у модели Schedule."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'semester': 1,
+            'week_number': 1,
+            'group_name': self.group_name,
+            'subject': self.subject,
+            'date': self.date.strftime('%Y-%m-%d'),
+            'time_start': self.time_start,
+            'time_end': self.time_end,
+            'weekday': self.weekday,
+            'teacher_name': self.teacher_name,
+            'auditory': self.auditory,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'updated_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+
+def make_lessons(count, teachers=40, groups=60, auditories=50, seed=1):
+    rnd = random.Random(seed)
+    lessons = []
+    for lesson_id in range(1, count + 1):
+        time_start, time_end = rnd.choice(SLOTS)
+        weekday = rnd.randint(1, 6)
+        lesson = BenchLesson(
+            id=lesson_id,
+            weekday=weekday,
+            date=date(2024, 9, 1 + weekday),
+            time_start=time_start,
+            time_end=time_end,
+            start_min=time_to_minutes(time_start),
+            end_min=time_to_minutes(time_end),
+            teacher_name=f"Преподаватель {rnd.randrange(teachers)}",
+            group_name=f"Группа {rnd.randrange(groups)}",
+            auditory=f"{rnd.randrange(auditories)}.101",
+            subject='Дисциплина',
+            created_at=datetime(2024, 9, 1, 12, 0)
+        )
+        lessons.append(lesson)
+    return lessons
+
+
+def legacy_conflicts(lessons):
+    """Прежняя реализация get_all_conflicts: попарный перебор внутри каждого ресурса."""
+    conflicts = []
+    for conflict_type, attribute in CONFLICT_RESOURCES:
+        buckets = {}
+        for lesson in lessons:
+            value = getattr(lesson, attribute)
+            if value:
+                buckets.setdefault(value, []).append(
+                    [lesson.weekday, lesson.time_start, lesson.time_end, lesson.id, lesson]
+                )
+
+        for value, schedule in buckets.items():
+            for i in range(len(schedule)):
+                for j in range(i + 1, len(schedule)):
+                    if (schedule[i][0] == schedule[j][0] and
+                            schedule[i][1] < schedule[j][2] and schedule[i][2] > schedule[j][1]):
+                        conflicts.append({
+                            'conflict_type': conflict_type,
+                            'conflict_value': value,
+                            'lesson1_id': schedule[i][3],
+                            'lesson2_id': schedule[j][3],
+                            'lesson1': schedule[i][4].to_dict(),
+                            'lesson2': schedule[j][4].to_dict()
+                        })
+    return conflicts
+
+
+def measure(func, lessons, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(lessons)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def pair_set(conflicts):
+    return {(c['conflict_type'], frozenset((c['lesson1_id'], c['lesson2_id']))) for c in conflicts}
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500, 2000, 8000]
+
+    for size in sizes:
+        lessons = make_lessons(size)
+        legacy_time, legacy_result = measure(legacy_conflicts, lessons)
+        sweep_time, sweep_result = measure(find_schedule_conflicts, lessons)
+
+        assert pair_set(legacy_result) == pair_set(sweep_result), 'Результаты не совпадают!'
+
+        print(f"{size:>6} занятий, {len(sweep_result):>6} конфликтов: "
+              f"перебор {legacy_time * 1000:8.1f} мс, "
+              f"заметающая прямая {sweep_time * 1000:8.1f} мс, "
+              f"ускорение x{legacy_time / sweep_time:.1f}")
@@ -0,0 +1,216 @@
+"""Сравнение раскладки недели для экспорта: прежний код export_schedule против WeekGridLayout.
+
+Недели генерируются с большим числом нестандартного времени занятий. Сначала обе реализации
+пишут в лист-заглушку, который запоминает итоговое содержимое ячеек и высоты строк:
+результаты сверяются между собой, а замер показывает стоимость самой раскладки без xlsx.
+Затем замеряется полная сборка книги xlsxwriter в памяти - то, что платит запрос экспорта.
+Замеры чередуются, берется медиана.
+
+Запуск: python bench_grid.py [количество занятий в неделе ...]
+"""
+import io
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import xlsxwriter
+
+from server import (write_export_week, ExportFormats, EXPORT_WEEKDAYS, DEFAULT_EXPORT_TIMES,
+                    format_lesson_cell, estimate_row_height, setup_export_sheet)
+
+LESSON_TYPES = ['лек.', 'пр.', 'лаб.', 'сем.', 'конс.']
+LESSON_COLORS = {'лек.': '#E9F0FC', 'пр.': '#E3F9E5', 'лаб.': '#FFF8E8', 'сем.': '#F2E8F7', 'конс.': None}
+DATES = {day: f"2024-09-{day + 1:02d}" for day in range(1, 7)}
+
+
+class BenchLesson:
+    """Занятие с полями, которые читает экспорт."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class RecordingWorkbook:
+    def add_format(self, properties):
+        return dict(properties)
+
+
+class RecordingSheet:
+    """Лист, хранящий только итоговое состояние: значение и формат ячеек, высоты строк."""
+
+    def __init__(self):
+        self.cells = {}
+        self.heights = {}
+        self.writes = 0
+
+    def write(self, row, col, value, cell_format=None):
+        self.writes += 1
+        self.cells[(row, col)] = (value, tuple(sorted(cell_format.items())) if cell_format else None)
+
+    def merge_range(self, first_row, first_col, last_row, last_col, value, cell_format=None):
+        self.write(first_row, first_col, value, cell_format)
+
+    def set_row(self, row, height):
+        self.heights[row] = height
+
+
+def make_week(count, irregular_share=0.8, seed=1):
+    """Неделя группы, в которой большая часть занятий идет не по стандартным слотам"""
+    rnd = random.Random(seed)
+    lessons = []
+    for index in range(count):
+        if rnd.random() < irregular_share:
+            hour, minute = rnd.randint(8, 19), rnd.randrange(0, 60, 5)
+            time_start, time_end = f"{hour:02d}:{minute:02d}", f"{hour + 1:02d}:{minute:02d}"
+        else:
+            time_start, time_end = rnd.choice(DEFAULT_EXPORT_TIMES)
+        lessons.append(BenchLesson(
+            weekday=rnd.randint(1, 6),
+            time_start=time_start,
+            time_end=time_end,
+            slot_id=None,
+            subject=f"Дисциплина {index % 40}",
+            group_name='2411-0101.1',
+            teacher_name=f"Преподаватель {rnd.randrange(30)}",
+            auditory=f"{rnd.randint(1, 9)}.{rnd.randrange(400):03d}",
+            lesson_type=rnd.choice(LESSON_TYPES),
+            subgroup=rnd.choice([0, 0, 1, 2])
+        ))
+    lessons.sort(key=lambda item: (item.weekday, item.time_start))
+    return lessons
+
+
+def base_times():
+    return [{'key': f"{time_start}-{time_end}", 'time_start': time_start, 'time_end': time_end}
+            for time_start, time_end in DEFAULT_EXPORT_TIMES]
+
+
+def legacy_write_week(worksheet, formats, title, dates, times, schedule_items, view_type):
+    """Прежняя раскладка из export_schedule: пустая сетка, затем матрица занятий и перезапись ячеек."""
+    header_format = formats.header
+    cell_format = formats.cell
+
+    worksheet.merge_range(0, 0, 0, 6, title, header_format)
+    for col, day in enumerate(EXPORT_WEEKDAYS):
+        worksheet.write(1, col, day, header_format)
+    row_index = 2
+    for i in range(1, 7):
+        if i in dates:
+            worksheet.write(row_index, i, datetime.strptime(dates[i], '%Y-%m-%d').strftime('%d.%m.%Y'), cell_format)
+    row_index += 1
+
+    slot_keys = set(time_slot['key'] for time_slot in times)
+
+    def get_time_key(item):
+        if item.slot_id in slot_keys:
+            return item.slot_id
+        return f"{item.time_start}-{item.time_end}"
+
+    for item in schedule_items:
+        time_key = get_time_key(item)
+        if time_key not in slot_keys:
+            slot_keys.add(time_key)
+            times.append({'key': time_key, 'time_start': item.time_start, 'time_end': item.time_end})
+    times.sort(key=lambda x: x['time_start'])
+
+    time_map = {}
+    for idx, time_slot in enumerate(times):
+        time_map[time_slot['key']] = idx
+        worksheet.write(row_index + idx, 0, f"{time_slot['time_start']}-{time_slot['time_end']}", cell_format)
+        for day in range(1, 7):
+            worksheet.write(row_index + idx, day, "", cell_format)
+
+    schedule_matrix = {}
+    for item in schedule_items:
+        time_key = get_time_key(item)
+        if time_key not in time_map:
+            times.append({'key': time_key, 'time_start': item.time_start, 'time_end': item.time_end})
+            times.sort(key=lambda x: x['time_start'])
+            time_map = {}
+            for idx, time_slot in enumerate(times):
+                time_map[time_slot['key']] = idx
+                worksheet.write(row_index + idx, 0, f"{time_slot['time_start']}-{time_slot['time_end']}", cell_format)
+                for day in range(1, 7):
+                    worksheet.write(row_index + idx, day, "", cell_format)
+        schedule_matrix.setdefault((item.weekday, time_key), []).append(item)
+
+    row_heights = {time_idx: 60 for time_idx in range(len(times))}
+    for (day, time_key), items in schedule_matrix.items():
+        if not (1 <= day <= 6):
+            continue
+        time_idx = time_map[time_key]
+        if len(items) > 1:
+            combined_text = "\n---\n".join(format_lesson_cell(item, view_type) for item in items)
+            row_heights[time_idx] = max(row_heights[time_idx], estimate_row_height(combined_text, chars_per_line=30))
+            worksheet.write(row_index + time_idx, day, combined_text, cell_format)
+        else:
+            lesson_text = format_lesson_cell(items[0], view_type)
+            row_heights[time_idx] = max(row_heights[time_idx], estimate_row_height(lesson_text, chars_per_line=30))
+            worksheet.write(row_index + time_idx, day, lesson_text, formats.lesson(items[0].lesson_type))
+
+    for idx, height in row_heights.items():
+        worksheet.set_row(row_index + idx, height)
+
+
+def run_legacy(lessons):
+    sheet = RecordingSheet()
+    legacy_write_week(sheet, ExportFormats(RecordingWorkbook(), LESSON_COLORS), 'Неделя', DATES, base_times(),
+                      lessons, 'group')
+    return sheet
+
+
+def run_layout(lessons):
+    sheet = RecordingSheet()
+    write_export_week(sheet, ExportFormats(RecordingWorkbook(), LESSON_COLORS), 0, 'Неделя', DATES, base_times(),
+                      lessons, 'group')
+    return sheet
+
+
+def run_legacy_xlsx(lessons):
+    workbook = xlsxwriter.Workbook(io.BytesIO())
+    worksheet = workbook.add_worksheet()
+    setup_export_sheet(worksheet)
+    legacy_write_week(worksheet, ExportFormats(workbook, LESSON_COLORS), 'Неделя', DATES, base_times(),
+                      lessons, 'group')
+    workbook.close()
+
+
+def run_layout_xlsx(lessons):
+    workbook = xlsxwriter.Workbook(io.BytesIO())
+    worksheet = workbook.add_worksheet()
+    setup_export_sheet(worksheet)
+    write_export_week(worksheet, ExportFormats(workbook, LESSON_COLORS), 0, 'Неделя', DATES, base_times(),
+                      lessons, 'group')
+    workbook.close()
+
+
+def measure(funcs, lessons, repeat):
+    """Медианы времени функций; вызовы чередуются, чтобы фоновая нагрузка делилась поровну"""
+    timings = [[] for _ in funcs]
+    results = [None] * len(funcs)
+    for _ in range(repeat):
+        for index, func in enumerate(funcs):
+            started = time.perf_counter()
+            results[index] = func(lessons)
+            timings[index].append(time.perf_counter() - started)
+    return [statistics.median(values) for values in timings], results
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [50, 200, 1000, 5000]
+
+    for size in sizes:
+        lessons = make_week(size)
+        (legacy_time, layout_time), (legacy_sheet, layout_sheet) = measure([run_legacy, run_layout], lessons, 100)
+        (legacy_xlsx, layout_xlsx), _ = measure([run_legacy_xlsx, run_layout_xlsx], lessons, 20)
+
+        assert legacy_sheet.cells == layout_sheet.cells, 'Ячейки не совпадают!'
+        assert legacy_sheet.heights == layout_sheet.heights, 'Высоты строк не совпадают!'
+
+        rows = len(layout_sheet.heights)
+        print(f"{size:>6} занятий, {rows:>5} строк времени: "
+              f"раскладка {legacy_time * 1000:7.2f} -> {layout_time * 1000:7.2f} мс "
+              f"({legacy_sheet.writes} -> {layout_sheet.writes} записей, x{legacy_time / layout_time:.2f}), "
+              f"книга xlsx {legacy_xlsx * 1000:7.2f} -> {layout_xlsx * 1000:7.2f} мс (x{legacy_xlsx / layout_xlsx:.2f})")
@@ -0,0 +1,77 @@
+"""Регрессионная проверка планов запросов к таблице schedule.
+
+Создает временную SQLite-базу, заполняет ее тестовым расписанием и выполняет
+EXPLAIN QUERY PLAN для запросов нагруженных эндпоинтов (hot_schedule_queries).
+Завершается с кодом 1, если хотя бы один запрос читает таблицу полным сканированием.
+
+Запуск: python check_query_plans.py [количество занятий]
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'query_plans.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{DB_PATH}"
+
+from server import app, db, init_db, Schedule, hot_schedule_queries, explain_query_plan
+
+TIMES = [('08:00', '09:20'), ('09:30', '10:50'), ('11:00', '12:20'), ('12:40', '14:00'), ('14:10', '15:30')]
+
+
+def seed(count):
+    rnd = random.Random(1)
+    monday = date(2024, 9, 2)
+    for _ in range(count):
+        week_number = rnd.randint(1, 18)
+        weekday = rnd.randint(1, 6)
+        time_start, time_end = rnd.choice(TIMES)
+        db.session.add(Schedule(
+            semester=rnd.randint(1, 2),
+            week_number=week_number,
+            group_name=f"2411-{rnd.randrange(200):04d}.1",
+            course=rnd.randint(1, 5),
+            faculty='Технический факультет',
+            subject=f"Дисциплина {rnd.randrange(300)}",
+            lesson_type=rnd.choice(['лек.', 'пр.', 'лаб.']),
+            date=monday + timedelta(weeks=week_number - 1, days=weekday - 1),
+            time_start=time_start,
+            time_end=time_end,
+            weekday=weekday,
+            teacher_name=f"Преподаватель {rnd.randrange(150)}",
+            auditory=f"{rnd.randint(1, 9)}.{rnd.randrange(400):03d}"
+        ))
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+
+
+def main(count):
+    init_db()
+
+    with app.app_context():
+        seed(count)
+
+        queries = hot_schedule_queries(
+            semester=1, week_number=3, group_name='2411-0001.1', teacher_name='Преподаватель 1',
+            auditory='1.001', date=date(2024, 9, 16), time_start='08:00', time_end='09:20'
+        )
+
+        failed = []
+        for name, query in queries.items():
+            plan = explain_query_plan(query)
+            full_scan = any(step.startswith('SCAN schedule') for step in plan)
+            print(f"{'FAIL' if full_scan else 'OK  '} {name}: {' | '.join(plan)}")
+            if full_scan:
+                failed.append(name)
+
+    if failed:
+        print(f"\nПолное сканирование таблицы schedule в запросах: {', '.join(failed)}")
+        return 1
+
+    print(f"\nВсе {len(queries)} запросов используют индексы.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
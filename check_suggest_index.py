@@ -0,0 +1,133 @@
+"""Проверка согласованности индекса подсказок (/api/search/suggest) со справочниками.
+
+Создает временную SQLite-базу, записывает занятия через API и ScheduleBulkWriter,
+затем удаляет и изменяет их. После каждого шага подсказки сравниваются со списками
+/api/groups, /api/teachers и /api/auditories: в подсказках должны быть только названия,
+у которых есть занятия, с актуальными курсом и факультетом группы.
+Завершается с кодом 1, если хотя бы одна проверка не прошла.
+
+Запуск: python check_suggest_index.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'suggest_index.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{DB_PATH}"
+
+from server import app, db, init_db, ScheduleBulkWriter
+
+LIST_ENDPOINTS = {
+    'group': ('/api/groups', 'group_name'),
+    'teacher': ('/api/teachers', 'teacher_name'),
+    'auditory': ('/api/auditories', 'auditory'),
+}
+
+
+def lesson(**fields):
+    values = dict(semester=1, week_number=1, group_name='Г-1', course=1, faculty='Технический факультет',
+                  subject='Дискретная математика', lesson_type='пр.', subgroup=0, date='2024-09-02',
+                  time_start='08:00', time_end='09:20', weekday=1, teacher_name='Иванов И.И.', auditory='7.201')
+    values.update(fields)
+    return values
+
+
+class SuggestChecker:
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+        self.failed = []
+
+    def add(self, **fields):
+        response = self.client.post('/api/quick_add_schedule', json=lesson(**fields))
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['id']
+
+    def suggest(self, query, kind):
+        response = self.client.get('/api/search/suggest', query_string={'q': query, 'types': kind, 'limit': 50})
+        return {item['name']: item for item in response.get_json()}
+
+    def listed(self, kind):
+        path, field = LIST_ENDPOINTS[kind]
+        return {item[field]: item for item in self.client.get(path).get_json()}
+
+    def check(self, step, kind, query, expected):
+        """Подсказки по запросу совпадают с ожидаемыми названиями и со списком справочника"""
+        suggested = self.suggest(query, kind)
+        listed = {name: item for name, item in self.listed(kind).items() if name in suggested or name in expected}
+        ok = set(suggested) == set(expected) == set(listed)
+        print(f"{'OK  ' if ok else 'FAIL'} {step}: {kind} '{query}' -> {sorted(suggested)}, список {sorted(listed)}")
+        if not ok:
+            self.failed.append(step)
+        return suggested
+
+    def check_group_fields(self, step, name, course, faculty):
+        item = self.suggest(name, 'group').get(name, {})
+        listed = self.listed('group').get(name, {})
+        ok = (item.get('course'), item.get('faculty')) == (listed.get('course'), listed.get('faculty')) \
+            == (course, faculty)
+        print(f"{'OK  ' if ok else 'FAIL'} {step}: {name} курс/факультет "
+              f"{item.get('course')}/{item.get('faculty')}, список {listed.get('course')}/{listed.get('faculty')}")
+        if not ok:
+            self.failed.append(step)
+
+
+def main():
+    init_db()
+    client = app.test_client()
+    client.post('/api/auth/init', json={'username': 'admin', 'password': 'admin'})
+    token = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin'}).get_json()['token']
+    checker = SuggestChecker(client, {'Authorization': f"Bearer {token}"})
+
+    group_lessons = [checker.add(group_name='Г-2', weekday=day, date=f"2024-09-0{day + 1}") for day in (1, 2)]
+    checker.add(group_name='Г-1', teacher_name='Петров П.П.', auditory='7.202')
+    checker.check('начальное построение', 'group', 'Г-', ['Г-1', 'Г-2'])
+
+    # Удаление всех занятий группы по одному
+    for lesson_id in group_lessons:
+        client.delete(f'/api/schedule/{lesson_id}', headers=checker.headers)
+    checker.check('удаление всех занятий группы', 'group', 'Г-', ['Г-1'])
+
+    # Название снова появляется вместе с занятием
+    checker.add(group_name='Г-2', week_number=2, date='2024-09-09', teacher_name='Сидоров С.С.', auditory='1.101')
+    checker.check('повторное добавление', 'group', 'Г-', ['Г-1', 'Г-2'])
+
+    # Удаление недели целиком
+    client.delete('/api/schedule/week', query_string={'semester': 1, 'week_number': 2}, headers=checker.headers)
+    checker.check('удаление недели: группа', 'group', 'Г-', ['Г-1'])
+    checker.check('удаление недели: преподаватель', 'teacher', 'Сидоров', [])
+    checker.check('удаление недели: аудитория', 'auditory', '1.101', [])
+
+    # Переименование преподавателя и аудитории в занятии, смена курса и факультета группы
+    lesson_id = checker.add(group_name='Г-3', teacher_name='Кузнецов К.К.', auditory='3.301')
+    client.put(f'/api/schedule/{lesson_id}', headers=checker.headers, json={
+        'teacher_name': 'Кузнецова К.К.', 'auditory': '3.302', 'course': 2, 'faculty': 'Экономический факультет'
+    })
+    checker.check('переименование: прежний преподаватель', 'teacher', 'Кузнецов К', ['Кузнецова К.К.'])
+    checker.check('переименование: прежняя аудитория', 'auditory', '3.30', ['3.302'])
+    checker.check_group_fields('изменение курса и факультета', 'Г-3', 2, 'Экономический факультет')
+
+    # Замена занятий группы при импорте (ScheduleBulkWriter): прежние названия без занятий уходят
+    with app.app_context():
+        writer = ScheduleBulkWriter()
+        writer.replace_group_week(1, 1, 'Г-3')
+        writer.add(**lesson(group_name='Г-3', course=3, date=date(2024, 9, 2), teacher_name='Орлов О.О.',
+                           auditory='4.401'))
+        writer.flush()
+        db.session.commit()
+    checker.check('импорт: прежний преподаватель', 'teacher', 'Кузнецов', [])
+    checker.check('импорт: прежняя аудитория', 'auditory', '3.30', [])
+    checker.check('импорт: новый преподаватель', 'teacher', 'Орлов', ['Орлов О.О.'])
+    checker.check_group_fields('импорт: курс группы', 'Г-3', 3, 'Технический факультет')
+
+    if checker.failed:
+        print(f"\nНе пройдено проверок: {len(checker.failed)}")
+        return 1
+
+    print("\nПодсказки совпадают со списками справочников.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,39 @@
 import os
 import json
 import datetime
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import io
+import pickle
+import zipfile
+import queue
+import shutil
+import tempfile
+import multiprocessing
+import codecs
+import csv
+import re
+import secrets
+import hashlib
+import heapq
+import bisect
+import threading
+import time
+from collections import namedtuple, OrderedDict, Counter
+from operator import itemgetter
+from itertools import chain, groupby
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import xlsxwriter
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, event, text, bindparam, inspect as sa_inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.dialects import postgresql, sqlite
 
 # Инициализация приложения
 app = Flask(__name__)
@@ -20,6 +43,23 @@ CORS(app)  # Разрешаем CORS для всех маршрутов
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///schedule.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Максимальный объем кеша ответов публичных представлений расписания, байт
+app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Время жизни записей кеша пользователей в token_required, секунд (0 - без кеша)
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 60))
+# Размер пачки строк при массовой записи импортированного расписания
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 2000))
+# Число процессов для разбора файлов импорта и сборки книг массового экспорта (1 - работа в потоке запроса)
+app.config['IMPORT_WORKERS'] = int(os.environ.get('IMPORT_WORKERS', os.cpu_count() or 1))
+# Разобранные при анализе файлы ждут импорта в IMPORT_STAGING_DIR не дольше IMPORT_STAGING_TTL секунд
+app.config['IMPORT_STAGING_DIR'] = os.environ.get(
+    'IMPORT_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'schedule_import_staging'))
+app.config['IMPORT_STAGING_TTL'] = int(os.environ.get('IMPORT_STAGING_TTL', 3600))
+# Фоновые импорты: число потоков-исполнителей и сколько секунд хранить завершенные задачи
+app.config['IMPORT_JOB_WORKERS'] = int(os.environ.get('IMPORT_JOB_WORKERS', 1))
+app.config['IMPORT_JOB_KEEP_SECONDS'] = int(os.environ.get('IMPORT_JOB_KEEP_SECONDS', 3600))
+# Сколько строк расписания получать из курсора за раз при многонедельном экспорте
+app.config['EXPORT_YIELD_PER'] = int(os.environ.get('EXPORT_YIELD_PER', 1000))
 
 # Инициализация базы данных
 db = SQLAlchemy(app)
@@ -45,6 +85,15 @@ class Schedule(db.Model):
     time_start = db.Column(db.String(5), nullable=False)
     time_end = db.Column(db.String(5), nullable=False)
     weekday = db.Column(db.Integer, nullable=False)
+    # Время в минутах от начала суток и слот - для сравнения интервалов целыми числами
+    start_min = db.Column(db.Integer)
+    end_min = db.Column(db.Integer)
+    slot_id = db.Column(db.Integer, db.ForeignKey('time_slot.id', ondelete='SET NULL'), nullable=True)
+
+    # Ссылки на справочники групп, преподавателей и аудиторий
+    group_id = db.Column(db.Integer, db.ForeignKey('study_group.id'), index=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), index=True)
+    auditory_id = db.Column(db.Integer, db.ForeignKey('auditory.id'), index=True)
 
     # Место проведения и преподаватель
     teacher_name = db.Column(db.String(100), server_default='')
@@ -54,6 +103,15 @@ class Schedule(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Составные индексы под основные пути доступа (см. hot_schedule_queries и check_query_plans.py)
+    __table_args__ = (
+        db.Index('ix_schedule_group_week', 'group_name', 'semester', 'week_number', 'weekday', 'time_start'),
+        db.Index('ix_schedule_teacher_week', 'teacher_name', 'semester', 'week_number', 'weekday', 'time_start'),
+        db.Index('ix_schedule_auditory_week', 'auditory', 'semester', 'week_number', 'weekday', 'time_start'),
+        db.Index('ix_schedule_semester_week', 'semester', 'week_number', 'group_name'),
+        db.Index('ix_schedule_date_time', 'date', 'start_min', 'end_min'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -70,6 +128,7 @@ class Schedule(db.Model):
             'time_start': self.time_start,
             'time_end': self.time_end,
             'weekday': self.weekday,
+            'slot_id': self.slot_id,
             'teacher_name': self.teacher_name,
             'auditory': self.auditory,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
@@ -77,6 +136,24 @@ class Schedule(db.Model):
         }
 
 
+# Справочники, заполняемые при импорте и редактировании расписания
+class StudyGroup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(20), nullable=False, unique=True)
+    course = db.Column(db.Integer)
+    faculty = db.Column(db.String(100))
+
+
+class Teacher(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+
+class Auditory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(256), nullable=False, unique=True)
+
+
 class TimeSlot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     slot_number = db.Column(db.Integer, nullable=False)  # For ordering
@@ -122,11 +199,8 @@ class LessonType(db.Model):
 
     # Helper method to check if a DB value matches this lesson type
     def matches_db_value(self, value):
-        if not value:
-            return False
-
-        db_values_list = json.loads(self.db_values)
-        return value.lower() in [v.lower() for v in db_values_list if v]
+        lesson_type = find_lesson_type(value)
+        return lesson_type is not None and lesson_type.id == self.id
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -152,7 +226,113 @@ class User(db.Model):
         }
 
 
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Журнал анализа и импорта файлов расписания с найденными проблемами
+class ImportRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # analyze или upload
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), index=True)
+    semester = db.Column(db.Integer)
+    files_count = db.Column(db.Integer, default=0)
+    imported_count = db.Column(db.Integer, default=0)
+    failed_count = db.Column(db.Integer, default=0)
+    problems_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'semester': self.semester,
+            'files_count': self.files_count,
+            'imported_count': self.imported_count,
+            'failed_count': self.failed_count,
+            'problems_count': self.problems_count,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None
+        }
+
+
+class ImportProblem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('import_run.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Значения берутся из файла как есть, поэтому поля шире, чем в schedule
+    file = db.Column(db.String(256))
+    week_number = db.Column(db.Integer)
+    group_name = db.Column(db.String(100))
+    subject = db.Column(db.Text)
+    date = db.Column(db.String(50))
+    time = db.Column(db.String(50))
+    error = db.Column(db.Text, nullable=False)
+    is_file_error = db.Column(db.Boolean, default=False)
+    raw_data = db.Column(db.Text)  # JSON исходной записи
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'file': self.file,
+            'week': self.week_number,
+            'group': self.group_name,
+            'subject': self.subject,
+            'date': self.date,
+            'time': self.time,
+            'error': self.error,
+            'is_file_error': self.is_file_error,
+            'raw_data': json.loads(self.raw_data) if self.raw_data else None
+        }
+
+
 # Вспомогательные функции
+class UserCache:
+    """Кеш пользователей для token_required с ограниченным временем жизни.
+
+    Хранит значения полей, а не ORM-объекты: каждый запрос получает свою
+    копию User, не привязанную к сессии.
+    """
+
+    FIELDS = ('id', 'username', 'password_hash', 'role', 'full_name', 'created_at')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}  # id -> (момент истечения, значения полей)
+        self._generation = 0  # растет при сбросе, чтобы не сохранить прочитанное до изменения
+
+    def get(self, user_id):
+        ttl = app.config['USER_CACHE_TTL']
+        if ttl > 0:
+            with self._lock:
+                cached = self._users.get(user_id)
+                generation = self._generation
+            if cached is not None and cached[0] > time.monotonic():
+                return User(**cached[1])
+
+        user = db.session.get(User, user_id)
+        if user is not None and ttl > 0:
+            values = {field: getattr(user, field) for field in self.FIELDS}
+            with self._lock:
+                if generation == self._generation:
+                    self._users[user_id] = (time.monotonic() + ttl, values)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._generation += 1
+
+
+user_cache = UserCache()
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -168,7 +348,7 @@ def token_required(f):
 
         try:
             data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            current_user = user_cache.get(data['user_id'])
 
             if not current_user:
                 return jsonify({'message': 'Пользователь не найден!'}), 401
@@ -215,6 +395,1443 @@ def get_dates_for_week(year, week_number):
     return dates
 
 
+def get_semester_year(semester):
+    """Год, от которого считаются недели семестра (относительно текущей даты)"""
+    current_date = datetime.now()
+    year = current_date.year
+
+    if semester == 2 and current_date.month < 8:
+        # Второй семестр текущего учебного года (весна)
+        pass
+    elif semester == 1 and current_date.month >= 8:
+        # Первый семестр текущего учебного года (осень)
+        pass
+    else:
+        # Корректируем год
+        year = year - 1 if semester == 1 else year
+
+    return year
+
+
+def time_to_minutes(value):
+    """Преобразует время 'ЧЧ:ММ' в количество минут от начала суток (None, если формат неверный)"""
+    try:
+        hours, minutes = str(value).split(':')
+        return int(hours) * 60 + int(minutes)
+    except (TypeError, ValueError):
+        return None
+
+
+# Кеш соответствия (начало, конец) в минутах -> id активного временного слота
+_time_slot_lookup = None
+_time_slot_lookup_lock = threading.Lock()
+
+
+def build_time_slot_lookup():
+    """Соответствие (начало, конец) в минутах -> id активного слота по данным текущей сессии"""
+    slots = db.session.query(TimeSlot.id, TimeSlot.time_start, TimeSlot.time_end).filter(
+        TimeSlot.is_active == True
+    ).order_by(TimeSlot.slot_number).all()
+    lookup = {}
+    for slot in slots:
+        lookup.setdefault((time_to_minutes(slot.time_start), time_to_minutes(slot.time_end)), slot.id)
+    return lookup
+
+
+def get_time_slot_lookup():
+    global _time_slot_lookup
+    with _time_slot_lookup_lock:
+        if _time_slot_lookup is None:
+            _time_slot_lookup = build_time_slot_lookup()
+        return _time_slot_lookup
+
+
+def reset_time_slot_lookup():
+    global _time_slot_lookup
+    with _time_slot_lookup_lock:
+        _time_slot_lookup = None
+
+
+def refresh_schedule_slot_ids():
+    """Пересчитывает Schedule.slot_id после изменения временных слотов.
+
+    Соответствие строится по незафиксированным данным сессии только для перепривязки;
+    общий кеш сбрасывается после commit, чтобы в нем не оказались слоты откатившейся транзакции.
+    """
+    db.session.info['time_slots_changed'] = True
+    register_all_schedule_weeks_changed()
+    Schedule.query.filter(Schedule.slot_id.isnot(None)).update({'slot_id': None}, synchronize_session=False)
+    for (start_min, end_min), slot_id in build_time_slot_lookup().items():
+        Schedule.query.filter(
+            Schedule.start_min == start_min,
+            Schedule.end_min == end_min
+        ).update({'slot_id': slot_id}, synchronize_session=False)
+
+
+@event.listens_for(Session, 'after_commit')
+def _reset_time_slot_lookup(session):
+    if session.info.pop('time_slots_changed', False):
+        reset_time_slot_lookup()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_time_slot_changes(session):
+    session.info.pop('time_slots_changed', None)
+
+
+# Реестр типов занятий: нормализованное обозначение в БД -> тип
+LessonTypeInfo = namedtuple('LessonTypeInfo', 'id type_name full_name hours_multiplier color')
+
+# Академических часов на занятие, если тип не настроен
+DEFAULT_LESSON_HOURS = 2
+
+_lesson_type_registry = None
+_lesson_type_registry_lock = threading.Lock()
+
+
+def normalize_lesson_type(value):
+    return value.strip().lower() if value else ''
+
+
+def get_lesson_type_registry():
+    global _lesson_type_registry
+    with _lesson_type_registry_lock:
+        if _lesson_type_registry is None:
+            registry = {}
+            for lesson_type in LessonType.query.order_by(LessonType.id).all():
+                info = LessonTypeInfo(lesson_type.id, lesson_type.type_name, lesson_type.full_name,
+                                      lesson_type.hours_multiplier or DEFAULT_LESSON_HOURS, lesson_type.color)
+                for db_value in json.loads(lesson_type.db_values):
+                    # При совпадении обозначений у нескольких типов побеждает созданный раньше
+                    registry.setdefault(normalize_lesson_type(db_value), info)
+            registry.pop('', None)
+            _lesson_type_registry = registry
+        return _lesson_type_registry
+
+
+def reset_lesson_type_registry():
+    """Вызывается после изменения таблицы типов занятий; реестр пересоберется при следующем обращении"""
+    global _lesson_type_registry
+    with _lesson_type_registry_lock:
+        _lesson_type_registry = None
+
+
+def find_lesson_type(value):
+    """Тип занятия по значению Schedule.lesson_type или None"""
+    if not value:
+        return None
+    return get_lesson_type_registry().get(normalize_lesson_type(value))
+
+
+def lesson_hours(value):
+    lesson_type = find_lesson_type(value)
+    return lesson_type.hours_multiplier if lesson_type else DEFAULT_LESSON_HOURS
+
+
+# Запросы расписания, общие для нескольких эндпоинтов
+SCHEDULE_VIEW_COLUMNS = {
+    'group': Schedule.group_name,
+    'teacher': Schedule.teacher_name,
+    'auditory': Schedule.auditory,
+}
+
+
+def schedule_week_query(view_type, value, semester, week_number):
+    """Занятия группы, преподавателя или аудитории за неделю в порядке вывода"""
+    return Schedule.query.filter(
+        SCHEDULE_VIEW_COLUMNS[view_type] == value,
+        Schedule.semester == semester,
+        Schedule.week_number == week_number
+    ).order_by(Schedule.weekday, Schedule.time_start)
+
+
+def hot_schedule_queries(semester, week_number, group_name, teacher_name, auditory, date, time_start, time_end):
+    """Запросы нагруженных эндпоинтов для проверки планов выполнения (check_query_plans.py)"""
+    return {
+        'get_group_schedule': schedule_week_query('group', group_name, semester, week_number),
+        'get_teacher_schedule': schedule_week_query('teacher', teacher_name, semester, week_number),
+        'get_auditory_schedule': schedule_week_query('auditory', auditory, semester, week_number),
+        'get_schedule_by_date': Schedule.query.filter_by(date=date),
+        'get_conflicts': Schedule.query.filter(
+            Schedule.date == date,
+            Schedule.start_min == time_to_minutes(time_start),
+            Schedule.end_min == time_to_minutes(time_end)
+        ),
+        'get_all_conflicts': Schedule.query.filter_by(semester=semester, week_number=week_number),
+        'get_all_schedule': Schedule.query.filter_by(
+            semester=semester, week_number=week_number
+        ).order_by(Schedule.weekday, Schedule.time_start),
+        'usage_stats_teachers': db.session.query(
+            Schedule.teacher_name, db.func.count(Schedule.id)
+        ).filter(
+            Schedule.semester == semester,
+            Schedule.week_number == week_number,
+            Schedule.teacher_name != ''
+        ).group_by(Schedule.teacher_name),
+        'upload_delete_group_week': Schedule.query.filter_by(
+            semester=semester, week_number=week_number, group_name=group_name
+        ),
+        'analyze_week_count': Schedule.query.filter_by(semester=semester, week_number=week_number),
+        'get_groups': StudyGroup.query.filter(
+            db.session.query(Schedule.id).filter(Schedule.group_id == StudyGroup.id).exists()
+        ),
+        'get_teachers': Teacher.query.filter(
+            db.session.query(Schedule.id).filter(Schedule.teacher_id == Teacher.id).exists()
+        ),
+    }
+
+
+def explain_query_plan(query):
+    """Возвращает строки EXPLAIN QUERY PLAN (SQLite) для запроса"""
+    statement = query.statement if hasattr(query, 'statement') else query
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()]
+
+
+# Поиск накладок в расписании
+def lesson_minutes(lesson):
+    """Интервал занятия в минутах; занятия с нераспознанным временем ни с чем не пересекаются"""
+    start = lesson.start_min if lesson.start_min is not None else time_to_minutes(lesson.time_start)
+    end = lesson.end_min if lesson.end_min is not None else time_to_minutes(lesson.time_end)
+    if start is None or end is None:
+        return 0, 0
+    return start, end
+
+
+# Ресурсы, по которым ищутся конфликты: тип конфликта -> атрибут занятия
+CONFLICT_RESOURCES = (
+    ('teacher', 'teacher_name'),
+    ('group', 'group_name'),
+    ('auditory', 'auditory'),
+)
+
+
+def sweep_overlaps(entries):
+    """Находит все пары пересекающихся интервалов за O(n log n + k).
+
+    entries - список кортежей (weekday, start, end, payload). Интервалы сортируются
+    по (weekday, start) и обходятся «заметающей прямой»: в куче хранятся только
+    занятия, которые ещё идут в момент начала текущего.
+    """
+    pairs = []
+    active = []  # куча (end, порядковый номер, entry)
+    current_day = None
+
+    for order, entry in enumerate(sorted(entries, key=lambda e: (e[0], e[1]))):
+        weekday, start, end = entry[0], entry[1], entry[2]
+
+        if weekday != current_day:
+            active = []
+            current_day = weekday
+
+        # Убираем занятия, закончившиеся до начала текущего
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+
+        for _, _, other in active:
+            pairs.append((other, entry))
+
+        heapq.heappush(active, (end, order, entry))
+
+    return pairs
+
+
+def find_schedule_conflicts(lessons, resources=CONFLICT_RESOURCES):
+    """Возвращает список конфликтов между занятиями по преподавателям, группам и аудиториям.
+
+    Каждое занятие сериализуется через to_dict() не более одного раза.
+    """
+    serialized = {}
+
+    def lesson_dict(lesson):
+        if lesson.id not in serialized:
+            serialized[lesson.id] = lesson.to_dict()
+        return serialized[lesson.id]
+
+    conflicts = []
+
+    for conflict_type, attribute in resources:
+        # Раскладываем занятия по ресурсам: значение -> [(weekday, start, end, lesson), ...]
+        buckets = {}
+        for lesson in lessons:
+            value = getattr(lesson, attribute)
+            if value:
+                start, end = lesson_minutes(lesson)
+                buckets.setdefault(value, []).append((lesson.weekday, start, end, lesson))
+
+        for value, entries in buckets.items():
+            if len(entries) < 2:
+                continue
+
+            for first, second in sweep_overlaps(entries):
+                conflicts.append({
+                    'conflict_type': conflict_type,
+                    'conflict_value': value,
+                    'weekday': first[0],
+                    'time1_start': first[3].time_start,
+                    'time1_end': first[3].time_end,
+                    'time2_start': second[3].time_start,
+                    'time2_end': second[3].time_end,
+                    'lesson1_id': first[3].id,
+                    'lesson2_id': second[3].id,
+                    'lesson1': lesson_dict(first[3]),
+                    'lesson2': lesson_dict(second[3])
+                })
+
+    return conflicts
+
+
+# Индекс интервалов занятий в памяти
+# Снимок занятия, достаточный для проверки конфликтов без обращения к БД
+IndexedLesson = namedtuple('IndexedLesson', [
+    'start', 'end', 'id', 'semester', 'week_number', 'weekday', 'date',
+    'time_start', 'time_end', 'subject', 'group_name', 'teacher_name', 'auditory'
+])
+
+
+def indexed_lesson_from(lesson):
+    """Создает снимок занятия (объекта Schedule или строки запроса) для индекса"""
+    start, end = lesson_minutes(lesson)
+    return IndexedLesson(
+        start=start,
+        end=end,
+        id=lesson.id,
+        semester=lesson.semester,
+        week_number=lesson.week_number,
+        weekday=lesson.weekday,
+        date=lesson.date,
+        time_start=lesson.time_start,
+        time_end=lesson.time_end,
+        subject=lesson.subject,
+        group_name=lesson.group_name,
+        teacher_name=lesson.teacher_name,
+        auditory=lesson.auditory
+    )
+
+
+class IntervalBucket:
+    """Занятия одного ресурса за один день, отсортированные по началу"""
+
+    def __init__(self):
+        self.keys = []  # (start, id) для бинарного поиска
+        self.entries = []
+
+    def add(self, entry):
+        position = bisect.bisect_left(self.keys, (entry.start, entry.id))
+        self.keys.insert(position, (entry.start, entry.id))
+        self.entries.insert(position, entry)
+
+    def remove(self, entry):
+        position = bisect.bisect_left(self.keys, (entry.start, entry.id))
+        if position < len(self.keys) and self.keys[position] == (entry.start, entry.id):
+            del self.keys[position]
+            del self.entries[position]
+
+    def overlapping(self, start, end):
+        # Кандидаты - все занятия, начинающиеся раньше конца интервала
+        limit = bisect.bisect_left(self.keys, (end,))
+        return [entry for entry in self.entries[:limit] if entry.end > start]
+
+
+class WeekIntervalIndex:
+    """Занятия одной недели семестра, разложенные по ресурсам"""
+
+    def __init__(self):
+        self.entries = {}  # id -> IndexedLesson
+        self.by_weekday = {}  # (тип ресурса, значение) -> {weekday: IntervalBucket}
+        self.by_date = {}  # (тип ресурса, значение) -> {date: IntervalBucket}
+
+    def add(self, entry):
+        self.entries[entry.id] = entry
+        for resource_type, attribute in CONFLICT_RESOURCES:
+            value = getattr(entry, attribute)
+            if not value:
+                continue
+            key = (resource_type, value)
+            self.by_weekday.setdefault(key, {}).setdefault(entry.weekday, IntervalBucket()).add(entry)
+            self.by_date.setdefault(key, {}).setdefault(entry.date, IntervalBucket()).add(entry)
+
+    def remove(self, lesson_id):
+        entry = self.entries.pop(lesson_id, None)
+        if entry is None:
+            return
+        for resource_type, attribute in CONFLICT_RESOURCES:
+            value = getattr(entry, attribute)
+            if not value:
+                continue
+            key = (resource_type, value)
+            self.by_weekday[key][entry.weekday].remove(entry)
+            self.by_date[key][entry.date].remove(entry)
+
+
+class ScheduleIntervalIndex:
+    """Индекс интервалов по (семестр, неделя) для проверки конфликтов при записи.
+
+    Неделя загружается из БД одним запросом при первом обращении, а затем
+    поддерживается в актуальном состоянии событиями сессии: изменения применяются
+    после успешного commit. Проверка конфликта - поиск в словаре и бинарный поиск.
+
+    Проверка по дате просматривает все недели, где на эту дату есть занятия: дата
+    занятия может не совпадать с его неделей. Список таких недель тоже кешируется.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._weeks = {}  # (semester, week_number) -> WeekIntervalIndex
+        self._locations = {}  # id занятия -> (semester, week_number)
+        self._generations = {}  # (semester, week_number) -> счетчик изменений
+        self._date_weeks = {}  # дата -> {(semester, week_number)} недель с занятиями на эту дату
+        self._date_generation = 0
+
+    def _weeks_on(self, date):
+        """Недели, в которых есть занятия на дату (возможно, с лишними)"""
+        with self._lock:
+            keys = self._date_weeks.get(date)
+            if keys is not None:
+                return set(keys)
+            generation = self._date_generation
+
+        keys = {(int(semester), int(week_number)) for semester, week_number in
+                db.session.query(Schedule.semester, Schedule.week_number).filter(Schedule.date == date).distinct()}
+
+        with self._lock:
+            if self._date_generation == generation:
+                self._date_weeks[date] = set(keys)
+        return keys
+
+    def _week(self, semester, week_number):
+        key = (int(semester), int(week_number))
+
+        with self._lock:
+            week = self._weeks.get(key)
+            if week is not None:
+                return week
+            generation = self._generations.get(key, 0)
+
+        rows = db.session.query(
+            Schedule.id, Schedule.semester, Schedule.week_number, Schedule.weekday, Schedule.date,
+            Schedule.time_start, Schedule.time_end, Schedule.start_min, Schedule.end_min,
+            Schedule.subject, Schedule.group_name,
+            Schedule.teacher_name, Schedule.auditory
+        ).filter(
+            Schedule.semester == semester,
+            Schedule.week_number == week_number
+        ).all()
+
+        week = WeekIntervalIndex()
+        for row in rows:
+            week.add(indexed_lesson_from(row))
+
+        with self._lock:
+            # Пока шел запрос, неделя могла измениться - тогда не кешируем устаревший снимок
+            if key not in self._weeks and self._generations.get(key, 0) == generation:
+                self._weeks[key] = week
+                for lesson_id in week.entries:
+                    self._locations[lesson_id] = key
+        return week
+
+    def lessons_for(self, semester, week_number, resource_type, value, exclude_ids=()):
+        """Все занятия ресурса за неделю, отсортированные по дню и времени"""
+        week = self._week(semester, week_number)
+        with self._lock:
+            days = week.by_weekday.get((resource_type, value), {})
+            return [entry for weekday in sorted(days) for entry in days[weekday].entries
+                    if entry.id not in exclude_ids]
+
+    def find_overlaps(self, semester, week_number, resource_type, value, time_start, time_end,
+                      weekday=None, date=None, exclude_ids=()):
+        """Занятия ресурса, пересекающиеся с интервалом в указанный день недели или дату"""
+        start, end = time_to_minutes(time_start), time_to_minutes(time_end)
+        if not value or start is None or end is None:
+            return []
+
+        if date is None:
+            week = self._week(semester, week_number)
+            with self._lock:
+                bucket = week.by_weekday.get((resource_type, value), {}).get(weekday)
+                if bucket is None:
+                    return []
+                return [entry for entry in bucket.overlapping(start, end) if entry.id not in exclude_ids]
+
+        # По дате, как и прежний запрос к БД, ищем во всех неделях и семестрах
+        overlaps = []
+        for key in sorted(self._weeks_on(date)):
+            week = self._week(*key)
+            with self._lock:
+                bucket = week.by_date.get((resource_type, value), {}).get(date)
+                if bucket is not None:
+                    overlaps.extend(entry for entry in bucket.overlapping(start, end)
+                                    if entry.id not in exclude_ids)
+        return overlaps
+
+    def apply_changes(self, upserts, deleted_ids, stale_weeks, touched_weeks=()):
+        """Применяет зафиксированные изменения: upserts - снимки, deleted_ids - id удаленных.
+
+        touched_weeks - все недели, где что-то поменялось: их счетчик растет, даже если неделя
+        еще не в кеше, чтобы параллельная загрузка недели не сохранила снимок до изменения.
+        """
+        with self._lock:
+            for key in touched_weeks:
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+            # Массовые операции не сообщают даты занятий, поэтому карта дат сбрасывается целиком
+            if upserts or stale_weeks:
+                self._date_generation += 1
+            if stale_weeks:
+                self._date_weeks.clear()
+
+            for key in stale_weeks:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                week = self._weeks.pop(key, None)
+                if week is not None:
+                    for lesson_id in week.entries:
+                        self._locations.pop(lesson_id, None)
+
+            for lesson_id in deleted_ids:
+                self._remove(lesson_id)
+
+            for entry in upserts:
+                self._remove(entry.id)
+                key = (int(entry.semester), int(entry.week_number))
+                self._generations[key] = self._generations.get(key, 0) + 1
+                if entry.date in self._date_weeks:
+                    self._date_weeks[entry.date].add(key)
+                week = self._weeks.get(key)
+                if week is not None:
+                    week.add(entry)
+                    self._locations[entry.id] = key
+
+    def _remove(self, lesson_id):
+        key = self._locations.pop(lesson_id, None)
+        if key is None:
+            return
+        self._generations[key] = self._generations.get(key, 0) + 1
+        week = self._weeks.get(key)
+        if week is not None:
+            week.remove(lesson_id)
+
+    def clear(self):
+        with self._lock:
+            for key in self._weeks:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._weeks.clear()
+            self._locations.clear()
+            self._date_weeks.clear()
+            self._date_generation += 1
+
+
+schedule_index = ScheduleIntervalIndex()
+
+
+# Битовые карты занятости недели
+class WeekOccupancy:
+    """Занятость преподавателей, групп и аудиторий по ячейкам (день недели, слот).
+
+    Ячейка (weekday, i) соответствует биту (weekday - 1) * len(slots) + i, поэтому
+    свободные для всех ресурсов ячейки находятся одной операцией OR над масками.
+    """
+
+    WEEKDAYS = range(1, 7)  # Пн-Сб
+
+    def __init__(self, lessons, slots):
+        self.slots = slots
+        self.slot_minutes = [(time_to_minutes(slot.time_start), time_to_minutes(slot.time_end)) for slot in slots]
+        self.full_mask = (1 << (len(self.WEEKDAYS) * len(slots))) - 1
+        self.bitmaps = {}  # (тип ресурса, значение) -> int
+        self.cell_lessons = {}  # (тип ресурса, значение) -> {бит: [занятия]}
+        self.lesson_cells = {}  # id занятия -> маска ячеек, которые оно занимает
+
+        for lesson in lessons:
+            cells = self.cells_for(lesson.weekday, *lesson_minutes(lesson))
+            self.lesson_cells[lesson.id] = cells
+            if not cells:
+                continue
+
+            for resource_type, attribute in CONFLICT_RESOURCES:
+                value = getattr(lesson, attribute)
+                if not value:
+                    continue
+                key = (resource_type, value)
+                self.bitmaps[key] = self.bitmaps.get(key, 0) | cells
+                by_cell = self.cell_lessons.setdefault(key, {})
+                for bit in self.iter_bits(cells):
+                    by_cell.setdefault(bit, []).append(lesson)
+
+    def cell_bit(self, weekday, slot_index):
+        return (weekday - 1) * len(self.slots) + slot_index
+
+    def cells_for(self, weekday, start_min, end_min):
+        """Маска ячеек слотов, с которыми пересекается интервал (в минутах)"""
+        if weekday not in self.WEEKDAYS:
+            return 0
+        mask = 0
+        for slot_index, (slot_start, slot_end) in enumerate(self.slot_minutes):
+            if slot_start is not None and slot_end is not None and slot_start < end_min and slot_end > start_min:
+                mask |= 1 << self.cell_bit(weekday, slot_index)
+        return mask
+
+    @staticmethod
+    def iter_bits(mask):
+        while mask:
+            low_bit = mask & -mask
+            yield low_bit.bit_length() - 1
+            mask ^= low_bit
+
+    def resource_mask(self, resource_type, value, exclude_id=None):
+        """Маска занятых ячеек ресурса без учета самого занятия exclude_id"""
+        key = (resource_type, value)
+        mask = self.bitmaps.get(key, 0)
+        own_cells = mask & self.lesson_cells.get(exclude_id, 0)
+
+        for bit in self.iter_bits(own_cells):
+            if all(lesson.id == exclude_id for lesson in self.cell_lessons[key][bit]):
+                mask &= ~(1 << bit)
+        return mask
+
+    def conflicts_at(self, resource_type, value, bit, exclude_id=None):
+        lessons = self.cell_lessons.get((resource_type, value), {}).get(bit, [])
+        return [lesson for lesson in lessons if lesson.id != exclude_id]
+
+
+# Справочники: тип -> (модель, атрибут Schedule с названием, атрибут Schedule со ссылкой)
+DIMENSIONS = {
+    'group': (StudyGroup, 'group_name', 'group_id'),
+    'teacher': (Teacher, 'teacher_name', 'teacher_id'),
+    'auditory': (Auditory, 'auditory', 'auditory_id'),
+}
+
+# Диалекты с INSERT ... ON CONFLICT DO NOTHING для создания записей справочников
+DIMENSION_UPSERT_DIALECTS = {'sqlite': sqlite, 'postgresql': postgresql}
+
+# Кеш id справочников: тип -> {название: id}; пополняется только после commit
+_dimension_ids = {kind: {} for kind in DIMENSIONS}
+_dimension_ids_lock = threading.Lock()
+
+
+def resolve_dimension_id(session, kind, name, **fields):
+    """Возвращает id записи справочника по названию, создавая ее при необходимости"""
+    if not name:
+        return None
+
+    with _dimension_ids_lock:
+        dimension_id = _dimension_ids[kind].get(name)
+    if dimension_id is not None:
+        refresh_dimension_fields(session, kind, dimension_id, name, fields)
+        return dimension_id
+
+    pending = session.info.setdefault('new_dimensions', {})
+    if (kind, name) in pending:
+        return pending[(kind, name)][0]
+
+    model = DIMENSIONS[kind][0]
+    select_id = db.select(model.id).where(model.name == name)
+    dimension_id = session.execute(select_id).scalar()
+
+    if dimension_id is None:
+        # Core insert не запускает flush, поэтому безопасен внутри before_flush.
+        # Ту же запись может одновременно создавать другой запрос: при конфликте по name
+        # вставка ничего не делает, и id берется из записи, созданной параллельно
+        dialect = DIMENSION_UPSERT_DIALECTS.get(session.get_bind().dialect.name)
+        if dialect is None:
+            dimension_id = session.execute(
+                model.__table__.insert().values(name=name, **fields)
+            ).inserted_primary_key[0]
+        else:
+            dimension_id = session.execute(
+                dialect.insert(model.__table__).values(name=name, **fields)
+                .on_conflict_do_nothing(index_elements=['name']).returning(model.id)
+            ).scalar()
+            if dimension_id is None:
+                dimension_id = session.execute(select_id).scalar_one()
+                refresh_dimension_fields(session, kind, dimension_id, name, fields)
+    else:
+        refresh_dimension_fields(session, kind, dimension_id, name, fields)
+
+    pending[(kind, name)] = (dimension_id, fields)
+    return dimension_id
+
+
+def refresh_dimension_fields(session, kind, dimension_id, name, fields):
+    """Переносит в существующую запись справочника поля из записываемого занятия (курс и факультет группы)"""
+    if not fields:
+        return
+
+    # Одна проверка на название за транзакцию, пока поля не меняются
+    applied = session.info.setdefault('dimension_fields', {})
+    if applied.get((kind, name)) == fields:
+        return
+    applied[(kind, name)] = fields
+
+    table = DIMENSIONS[kind][0].__table__
+    session.execute(table.update().where(
+        table.c.id == dimension_id,
+        or_(*[table.c[field].is_distinct_from(value) for field, value in fields.items()])
+    ).values(**fields))
+
+
+def fill_schedule_dimension_ids(session, item):
+    item.group_id = resolve_dimension_id(session, 'group', item.group_name,
+                                         course=item.course, faculty=item.faculty)
+    item.teacher_id = resolve_dimension_id(session, 'teacher', item.teacher_name)
+    item.auditory_id = resolve_dimension_id(session, 'auditory', item.auditory)
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_dimension_ids(session):
+    session.info.pop('dimension_fields', None)
+    pending = session.info.pop('new_dimensions', None)
+    if not pending:
+        return
+
+    with _dimension_ids_lock:
+        for (kind, name), (dimension_id, fields) in pending.items():
+            _dimension_ids[kind][name] = dimension_id
+
+    for (kind, name), (dimension_id, fields) in pending.items():
+        suggest_index.add(kind, name, fields)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_dimension_ids(session):
+    session.info.pop('dimension_fields', None)
+    session.info.pop('new_dimensions', None)
+
+
+# Индекс подсказок поиска по группам, преподавателям и аудиториям
+def normalize_search_text(value):
+    """Нижний регистр, е вместо ё и одиночные пробелы"""
+    return ' '.join(value.lower().replace('ё', 'е').split())
+
+
+SuggestEntry = namedtuple('SuggestEntry', 'kind name normalized fields')
+
+# Дополнительные поля справочника, возвращаемые в подсказках
+SUGGEST_FIELDS = {'group': ('course', 'faculty')}
+
+
+class SuggestIndex:
+    """Префиксное дерево и триграммы по названиям из справочников.
+
+    Совпадения ранжируются так: точное, префикс названия, префикс слова,
+    подстрока, нечеткое (по доле триграмм запроса, найденных в названии).
+    """
+
+    TRIE_DEPTH = 12  # глубже префиксы проверяются через startswith
+    FUZZY_THRESHOLD = 0.5  # доля триграмм запроса, найденных в названии
+    WORD_SEPARATORS = re.compile(r'[\s.,\-/()]+')
+    MATCH_TYPES = ('exact', 'prefix', 'word_prefix', 'substring', 'fuzzy')
+    REFRESH_CHUNK_SIZE = 500  # названий в одном IN (...) при перепроверке
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._entries = []
+        self._ids = {}  # (тип, название) -> номер записи
+        self._trie = {}  # символ -> узел; под ключом '' - номера записей с этим префиксом
+        self._trigrams = {}  # триграмма -> номера записей
+        self._stale = set()  # (тип, название), чьи занятия менялись после построения
+
+    @staticmethod
+    def trigrams(text):
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @classmethod
+    def word_starts(cls, normalized):
+        """Начало названия и начала всех его слов"""
+        return {0} | {m.end() for m in cls.WORD_SEPARATORS.finditer(normalized) if m.end() < len(normalized)}
+
+    @staticmethod
+    def with_lessons(kind):
+        """Записи справочника, у которых есть занятия, как в /api/groups и аналогах"""
+        model, attribute, fk_attribute = DIMENSIONS[kind]
+        return model.query.filter(
+            db.session.query(Schedule.id).filter(getattr(Schedule, fk_attribute) == model.id).exists()
+        )
+
+    @staticmethod
+    def entry_fields(kind, row):
+        return {field: getattr(row, field) for field in SUGGEST_FIELDS.get(kind, ())}
+
+    def _ensure_built(self):
+        if self._built:
+            return
+
+        with self._lock:
+            if self._built:
+                return
+
+            for kind in DIMENSIONS:
+                for row in self.with_lessons(kind).all():
+                    self.add(kind, row.name, self.entry_fields(kind, row))
+
+            self._built = True
+
+    def invalidate(self, names):
+        """Помечает названия (тип, название), чьи занятия изменились; они перепроверяются перед поиском"""
+        with self._lock:
+            self._stale.update((kind, name) for kind, name in names if name)
+
+    def _refresh_stale(self):
+        """Сверяет помеченные названия с базой: без занятий - удаляются, остальные добавляются с новыми полями"""
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        if not stale:
+            return
+
+        names_by_kind = {}
+        for kind, name in stale:
+            names_by_kind.setdefault(kind, []).append(name)
+
+        for kind, names in names_by_kind.items():
+            model = DIMENSIONS[kind][0]
+            present = {}
+            for start in range(0, len(names), self.REFRESH_CHUNK_SIZE):
+                rows = self.with_lessons(kind).filter(
+                    model.name.in_(names[start:start + self.REFRESH_CHUNK_SIZE])
+                ).all()
+                present.update((row.name, self.entry_fields(kind, row)) for row in rows)
+
+            with self._lock:
+                for name in names:
+                    if name in present:
+                        self.add(kind, name, present[name])
+                    else:
+                        self.remove(kind, name)
+
+    def add(self, kind, name, fields=None):
+        normalized = normalize_search_text(name or '')
+        if not normalized:
+            return
+
+        fields = {field: (fields or {}).get(field) for field in SUGGEST_FIELDS.get(kind, ())}
+
+        with self._lock:
+            entry_id = self._ids.get((kind, name))
+            if entry_id is not None:
+                # Название уже в индексе: обновляются только поля (курс и факультет группы)
+                self._entries[entry_id] = self._entries[entry_id]._replace(fields=fields)
+                return
+
+            entry_id = len(self._entries)
+            self._entries.append(SuggestEntry(kind, name, normalized, fields))
+            self._ids[(kind, name)] = entry_id
+
+            # В дерево попадает название целиком и каждый его хвост, начинающийся со слова
+            for start in self.word_starts(normalized):
+                node = self._trie
+                for char in normalized[start:start + self.TRIE_DEPTH]:
+                    node = node.setdefault(char, {})
+                    node.setdefault('', set()).add(entry_id)
+
+            for gram in self.trigrams(normalized):
+                self._trigrams.setdefault(gram, set()).add(entry_id)
+
+    def remove(self, kind, name):
+        with self._lock:
+            entry_id = self._ids.pop((kind, name), None)
+            if entry_id is None:
+                return
+
+            # Номер записи не переиспользуется: убирается из дерева и триграмм, место в списке пустеет
+            normalized = self._entries[entry_id].normalized
+            self._entries[entry_id] = None
+            for start in self.word_starts(normalized):
+                node = self._trie
+                for char in normalized[start:start + self.TRIE_DEPTH]:
+                    node = node[char]
+                    node[''].discard(entry_id)
+
+            for gram in self.trigrams(normalized):
+                self._trigrams[gram].discard(entry_id)
+
+    def clear(self):
+        with self._lock:
+            self._built = False
+            self._entries = []
+            self._ids = {}
+            self._trie = {}
+            self._trigrams = {}
+            self._stale = set()
+
+    def search(self, query, kinds=None, limit=20):
+        normalized_query = normalize_search_text(query or '')
+        if not normalized_query:
+            return []
+
+        self._ensure_built()
+        self._refresh_stale()
+
+        with self._lock:
+            matches = {}  # номер записи -> (ранг, -сходство)
+
+            def accept(entry_id):
+                return not kinds or self._entries[entry_id].kind in kinds
+
+            # Префиксы названий и слов - по дереву
+            node = self._trie
+            for char in normalized_query[:self.TRIE_DEPTH]:
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                for entry_id in node.get('', ()):
+                    if not accept(entry_id):
+                        continue
+                    normalized = self._entries[entry_id].normalized
+                    if normalized == normalized_query:
+                        matches[entry_id] = (0, -1.0)
+                    elif normalized.startswith(normalized_query):
+                        matches[entry_id] = (1, -1.0)
+                    elif len(normalized_query) <= self.TRIE_DEPTH or normalized_query in normalized:
+                        matches[entry_id] = (2, -1.0)
+
+            if len(normalized_query) >= 3:
+                query_grams = sorted(
+                    {normalized_query[i:i + 3] for i in range(len(normalized_query) - 2)},
+                    key=lambda gram: len(self._trigrams.get(gram, ()))
+                )
+
+                # Подстрока: кандидаты содержат все триграммы запроса
+                candidates = set(self._trigrams.get(query_grams[0], ()))
+                for gram in query_grams[1:]:
+                    candidates &= self._trigrams.get(gram, set())
+                for entry_id in candidates:
+                    if (entry_id not in matches and accept(entry_id)
+                            and normalized_query in self._entries[entry_id].normalized):
+                        matches[entry_id] = (3, -1.0)
+
+                # Нечеткий поиск (опечатки) нужен, только если точных совпадений не хватает
+                if len(matches) < limit:
+                    shared = Counter()
+                    for gram in query_grams:
+                        shared.update(self._trigrams.get(gram, ()))
+
+                    for entry_id, count in shared.items():
+                        similarity = count / len(query_grams)
+                        if similarity >= self.FUZZY_THRESHOLD and entry_id not in matches and accept(entry_id):
+                            matches[entry_id] = (4, -similarity)
+
+            best = heapq.nsmallest(
+                limit, matches.items(),
+                key=lambda item: (item[1], len(self._entries[item[0]].name), self._entries[item[0]].name)
+            )
+            entries = [(self._entries[entry_id], rank, -negative_similarity)
+                       for entry_id, (rank, negative_similarity) in best]
+
+        return [
+            dict(type=entry.kind, name=entry.name, match=self.MATCH_TYPES[rank], score=round(similarity, 3),
+                 **entry.fields)
+            for entry, rank, similarity in entries
+        ]
+
+
+suggest_index = SuggestIndex()
+
+
+# Версии недель расписания
+class ScheduleVersions:
+    """Счетчики изменений по (семестр, неделя) и по семестрам.
+
+    Версия недели или семестра - пара (эпоха, счетчик): эпоха растет при изменениях,
+    затрагивающих все недели сразу (например, перепривязка занятий к временным слотам).
+    Для семестра также запоминается время последнего изменения (Last-Modified);
+    до первого изменения им считается время запуска процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._weeks = {}  # (semester, week_number) -> счетчик
+        self._semesters = {}  # semester -> счетчик
+        self._global = 0  # растет при любом изменении расписания
+        self._started_at = datetime.now(timezone.utc)
+        self._epoch_changed_at = self._started_at
+        self._semester_changed_at = {}
+
+    def week_version(self, semester, week_number):
+        with self._lock:
+            return self._epoch, self._weeks.get((int(semester), int(week_number)), 0)
+
+    def semester_version(self, semester):
+        with self._lock:
+            return self._epoch, self._semesters.get(int(semester), 0)
+
+    def semester_modified(self, semester):
+        with self._lock:
+            return max(self._epoch_changed_at, self._semester_changed_at.get(int(semester), self._started_at))
+
+    def global_version(self):
+        with self._lock:
+            return self._epoch, self._global
+
+    def bump(self, weeks):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for key in weeks:
+                self._weeks[key] = self._weeks.get(key, 0) + 1
+            for semester in set(semester for semester, _ in weeks):
+                self._semesters[semester] = self._semesters.get(semester, 0) + 1
+                self._semester_changed_at[semester] = now
+            self._global += 1
+
+    def bump_all(self):
+        with self._lock:
+            self._epoch += 1
+            self._epoch_changed_at = datetime.now(timezone.utc)
+            self._global += 1
+
+
+schedule_versions = ScheduleVersions()
+
+
+# Кеш ответов публичных представлений расписания
+class ResponseCache:
+    """LRU-кеш готовых тел JSON-ответов с ограничением по занимаемой памяти"""
+
+    ENTRY_OVERHEAD = 200  # примерный размер ключа и служебных структур, байт
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # ключ -> bytes
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        entry_size = len(body) + self.ENTRY_OVERHEAD
+        if entry_size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous) + self.ENTRY_OVERHEAD
+
+            self._entries[key] = body
+            self._size += entry_size
+
+            # Вытесняем давно не использованные записи (в том числе устаревших версий)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted) + self.ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            requests_count = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / requests_count, 4) if requests_count else 0
+            }
+
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+
+# Токен запуска процесса: версии изменений хранятся в памяти и обнуляются при перезапуске,
+# поэтому ETag, выданные до перезапуска, не должны совпасть с новыми
+SERVER_BOOT_TOKEN = os.urandom(8).hex()
+
+
+def schedule_etag(*parts):
+    """Сильный ETag по версии данных и параметрам запроса"""
+    return hashlib.sha1(repr((SERVER_BOOT_TOKEN,) + parts).encode('utf-8')).hexdigest()
+
+
+def conditional_response(etag, build_response, cache_control='no-cache', last_modified=None):
+    """Отвечает 304 Not Modified при совпадении If-None-Match, не выполняя build_response().
+
+    build_response() возвращает (response, status); ETag проставляется только успешным ответам.
+    Если задан last_modified, для запросов без If-None-Match проверяется If-Modified-Since.
+    """
+    if last_modified is not None:
+        # В HTTP-датах нет долей секунды
+        last_modified = last_modified.replace(microsecond=0)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (last_modified is not None and request.if_modified_since is not None
+                        and request.if_modified_since >= last_modified)
+
+    if not_modified:
+        response = app.response_class(status=304)
+    else:
+        response, status = build_response()
+        if status != 200:
+            return response, status
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response, response.status_code
+
+
+def cached_week_view(view_type, value, semester, week_number, year, build_response):
+    """Отдает ответ из кеша по (тип, id, семестр, неделя) и текущей версии недели.
+
+    build_response() возвращает (response, status); кешируются только успешные ответы.
+    Совпадение If-None-Match с текущей версией недели дает 304 без обращения к кешу и БД.
+    """
+    key = (view_type, value, semester, week_number, year, schedule_versions.week_version(semester, week_number))
+
+    def build_cached_response():
+        body = response_cache.get(key)
+        if body is not None:
+            return app.response_class(body, mimetype='application/json'), 200
+
+        response, status = build_response()
+        if status == 200:
+            response_cache.set(key, response.get_data())
+        return response, status
+
+    return conditional_response(schedule_etag(*key), build_cached_response)
+
+
+# Отслеживание изменений расписания в рамках транзакции
+def _pending_schedule_changes(session):
+    return session.info.setdefault('schedule_changes', {
+        'upserts': {},  # id -> IndexedLesson
+        'deleted': set(),
+        'weeks': set(),  # (semester, week_number), затронутые массовыми операциями
+        'touched_weeks': set(),  # все недели, в которых что-то поменялось
+        'dimension_names': set(),  # (тип, название) справочников до и после изменения занятий
+        'all_weeks': False
+    })
+
+
+def register_schedule_week_change(semester, week_number, session=None):
+    """Помечает неделю измененной массовой операцией (query.delete(), Core insert и т.п.)"""
+    session = session or db.session()
+    _pending_schedule_changes(session)['weeks'].add((int(semester), int(week_number)))
+
+
+def register_all_schedule_weeks_changed(session=None):
+    """Помечает измененными все недели сразу (массовые UPDATE без фильтра по неделе)"""
+    session = session or db.session()
+    _pending_schedule_changes(session)['all_weeks'] = True
+
+
+def schedule_dimension_names(values):
+    """Пары (тип, название) групп, преподавателей и аудиторий занятия по словарю полей schedule"""
+    return {(kind, values[attribute]) for kind, (model, attribute, fk_attribute) in DIMENSIONS.items()}
+
+
+def register_schedule_dimension_names(names, session=None):
+    """Помечает названия, чьи занятия изменились массовой операцией; после commit их перепроверит индекс подсказок"""
+    session = session or db.session()
+    _pending_schedule_changes(session)['dimension_names'].update(names)
+
+
+def _schedule_dimension_names_of(target):
+    """Названия справочников занятия до и после изменения"""
+    state = sa_inspect(target)
+    names = set()
+    for kind, (model, attribute, fk_attribute) in DIMENSIONS.items():
+        names.add((kind, getattr(target, attribute)))
+        names.update((kind, name) for name in getattr(state.attrs, attribute).history.deleted)
+    return names
+
+
+def _schedule_weeks_of(target):
+    """Недели занятия до и после изменения"""
+    state = sa_inspect(target)
+    semesters = {target.semester, *state.attrs.semester.history.deleted}
+    week_numbers = {target.week_number, *state.attrs.week_number.history.deleted}
+    return {(int(semester), int(week_number)) for semester in semesters for week_number in week_numbers
+            if semester is not None and week_number is not None}
+
+
+def fill_schedule_time_fields(item):
+    """Заполняет start_min/end_min и slot_id по строковому времени занятия"""
+    item.start_min = time_to_minutes(item.time_start)
+    item.end_min = time_to_minutes(item.time_end)
+    item.slot_id = get_time_slot_lookup().get((item.start_min, item.end_min))
+
+
+@event.listens_for(Session, 'before_flush')
+def _prepare_schedule_rows(session, flush_context, instances):
+    for item in list(session.new) + list(session.dirty):
+        if isinstance(item, Schedule):
+            fill_schedule_time_fields(item)
+            fill_schedule_dimension_ids(session, item)
+
+
+@event.listens_for(Schedule, 'after_insert')
+@event.listens_for(Schedule, 'after_update')
+def _track_schedule_upsert(mapper, connection, target):
+    changes = _pending_schedule_changes(object_session(target))
+    changes['deleted'].discard(target.id)
+    changes['upserts'][target.id] = indexed_lesson_from(target)
+    changes['touched_weeks'].update(_schedule_weeks_of(target))
+    changes['dimension_names'].update(_schedule_dimension_names_of(target))
+
+
+@event.listens_for(Schedule, 'after_delete')
+def _track_schedule_delete(mapper, connection, target):
+    changes = _pending_schedule_changes(object_session(target))
+    changes['upserts'].pop(target.id, None)
+    changes['deleted'].add(target.id)
+    changes['touched_weeks'].update(_schedule_weeks_of(target))
+    changes['dimension_names'].update(_schedule_dimension_names_of(target))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_schedule_changes(session):
+    changes = session.info.pop('schedule_changes', None)
+    if not changes:
+        return
+
+    schedule_index.apply_changes(changes['upserts'].values(), changes['deleted'], changes['weeks'],
+                                 changes['touched_weeks'])
+    suggest_index.invalidate(changes['dimension_names'])
+
+    if changes['all_weeks']:
+        schedule_versions.bump_all()
+    else:
+        schedule_versions.bump(changes['touched_weeks'] | changes['weeks'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_schedule_changes(session):
+    session.info.pop('schedule_changes', None)
+
+
+# Массовая запись занятий при импорте
+def schedule_row_values(session, values):
+    """Дополняет значения строки schedule для Core insert теми же полями, что before_flush для ORM"""
+    now = datetime.utcnow()
+    row = dict(values)
+    row['start_min'] = time_to_minutes(row['time_start'])
+    row['end_min'] = time_to_minutes(row['time_end'])
+    row['slot_id'] = get_time_slot_lookup().get((row['start_min'], row['end_min']))
+    row['group_id'] = resolve_dimension_id(session, 'group', row['group_name'],
+                                           course=row['course'], faculty=row['faculty'])
+    row['teacher_id'] = resolve_dimension_id(session, 'teacher', row['teacher_name'])
+    row['auditory_id'] = resolve_dimension_id(session, 'auditory', row['auditory'])
+    row['created_at'] = now
+    row['updated_at'] = now
+    register_schedule_dimension_names(schedule_dimension_names(row), session)
+    return row
+
+
+class ScheduleBulkWriter:
+    """Пакетная запись занятий в обход ORM.
+
+    Занятия заменяемых групп (replace_group_week) не удаляются целиком, а
+    сравниваются с уже сохраненными: по естественному ключу LESSON_KEY_FIELDS
+    находится прежняя запись, и если поля LESSON_CONTENT_FIELDS совпадают,
+    запись остается нетронутой. Выполняются только вставки, обновления и
+    удаления, а недели без изменений не сбрасывают кеши. Если группа
+    встречается на неделе повторно, остаются занятия из последнего вхождения.
+
+    Строки без replace_group_week просто вставляются. Запись идет пачками
+    примерно по IMPORT_BATCH_SIZE строк; группа в пачке не разрывается.
+    """
+
+    DELETE_CHUNK_SIZE = 500  # названий групп или id в одном IN (...)
+    LESSON_KEY_FIELDS = ('group_name', 'date', 'time_start', 'subgroup', 'subject')
+    LESSON_CONTENT_FIELDS = ('course', 'faculty', 'lesson_type', 'time_end', 'weekday', 'teacher_name', 'auditory')
+
+    def __init__(self, session=None, batch_size=None):
+        self.session = session or db.session()
+        self.batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+        self.inserted_count = 0
+        self.updated_count = 0
+        self.deleted_count = 0
+        self.unchanged_count = 0
+        self.write_seconds = 0.0  # время в SELECT/DELETE/UPDATE/INSERT
+        self.week_changes = {}  # (семестр, неделя) -> счетчики изменений
+        self._rows = []  # строки для простой вставки
+        self._groups = OrderedDict()  # (семестр, неделя, группа) -> значения новых занятий
+        self._group_rows_count = 0
+        self._started_at = time.perf_counter()
+
+    def replace_group_week(self, semester, week_number, group_name):
+        if self._group_rows_count >= self.batch_size:
+            self.flush()
+
+        key = (semester, week_number, group_name)
+        # Повторное вхождение отбрасывает еще не записанные строки прошлого,
+        # а уже записанные будут сравнены с новыми при следующей записи
+        self._group_rows_count -= len(self._groups.pop(key, ()))
+        self._groups[key] = []
+
+    def add(self, **values):
+        group_rows = self._groups.get((values['semester'], values['week_number'], values['group_name']))
+        if group_rows is not None:
+            group_rows.append(values)
+            self._group_rows_count += 1
+            return
+
+        self._rows.append(schedule_row_values(self.session, values))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def _week_counter(self, semester, week_number):
+        return self.week_changes.setdefault((semester, week_number), Counter())
+
+    def _diff_week(self, semester, week_number, group_names, incoming):
+        """Сравнивает новые занятия групп недели с сохраненными: (обновления, вставки, id на удаление)"""
+        table = Schedule.__table__
+        key_columns = [table.c[name] for name in self.LESSON_KEY_FIELDS]
+        content_columns = [table.c[name] for name in self.LESSON_CONTENT_FIELDS]
+        key_size = len(key_columns)
+
+        # Сохраненные занятия: ключ -> [(id, содержимое)]
+        stored = {}
+        group_names = sorted(group_names)
+        for start in range(0, len(group_names), self.DELETE_CHUNK_SIZE):
+            result = self.session.execute(
+                db.select(table.c.id, *key_columns, *content_columns).where(
+                    table.c.semester == semester,
+                    table.c.week_number == week_number,
+                    table.c.group_name.in_(group_names[start:start + self.DELETE_CHUNK_SIZE])
+                )
+            )
+            for row in result:
+                stored.setdefault(tuple(row[1:key_size + 1]), []).append((row[0], tuple(row[key_size + 1:])))
+
+        # Сначала совпадения с тем же содержимым, затем оставшиеся по ключу становятся обновлениями
+        changed = []
+        unchanged = 0
+        for values in incoming:
+            key = tuple(values[name] for name in self.LESSON_KEY_FIELDS)
+            content = tuple(values[name] for name in self.LESSON_CONTENT_FIELDS)
+            candidates = stored.get(key, ())
+            for index, (_, stored_content) in enumerate(candidates):
+                if stored_content == content:
+                    del candidates[index]
+                    unchanged += 1
+                    break
+            else:
+                changed.append((key, values))
+
+        # Прежние значения обновляемых и удаляемых занятий - для перепроверки их названий
+        replaced = []
+        updates = []
+        inserts = []
+        for key, values in changed:
+            candidates = stored.get(key)
+            if candidates:
+                row_id, stored_content = candidates.pop()
+                updates.append((row_id, values))
+                replaced.append((key, stored_content))
+            else:
+                inserts.append(values)
+
+        delete_ids = []
+        for key, candidates in stored.items():
+            for row_id, stored_content in candidates:
+                delete_ids.append(row_id)
+                replaced.append((key, stored_content))
+
+        for key, stored_content in replaced:
+            register_schedule_dimension_names(schedule_dimension_names({
+                **dict(zip(self.LESSON_KEY_FIELDS, key)), **dict(zip(self.LESSON_CONTENT_FIELDS, stored_content))
+            }), self.session)
+
+        self.unchanged_count += unchanged
+        self._week_counter(semester, week_number)['unchanged'] += unchanged
+        return updates, inserts, delete_ids
+
+    def flush(self):
+        flush_started_at = time.perf_counter()
+        table = Schedule.__table__
+        changed_weeks = set()
+
+        weeks = OrderedDict()
+        for (semester, week_number, group_name), group_rows in self._groups.items():
+            week = weeks.setdefault((semester, week_number), ([], []))
+            week[0].append(group_name)
+            week[1].extend(group_rows)
+        self._groups = OrderedDict()
+        self._group_rows_count = 0
+
+        for (semester, week_number), (group_names, incoming) in weeks.items():
+            updates, inserts, delete_ids = self._diff_week(semester, week_number, group_names, incoming)
+            counter = self._week_counter(semester, week_number)
+
+            for start in range(0, len(delete_ids), self.DELETE_CHUNK_SIZE):
+                self.session.execute(table.delete().where(
+                    table.c.id.in_(delete_ids[start:start + self.DELETE_CHUNK_SIZE])
+                ))
+
+            if updates:
+                update_rows = []
+                for row_id, values in updates:
+                    row = schedule_row_values(self.session, values)
+                    del row['created_at']
+                    row['_id'] = row_id
+                    update_rows.append(row)
+                self.session.execute(table.update().where(table.c.id == bindparam('_id')), update_rows)
+
+            self._rows.extend(schedule_row_values(self.session, values) for values in inserts)
+
+            self.deleted_count += len(delete_ids)
+            self.updated_count += len(updates)
+            counter['deleted'] += len(delete_ids)
+            counter['updated'] += len(updates)
+            if delete_ids or updates:
+                changed_weeks.add((semester, week_number))
+
+        if self._rows:
+            self.session.execute(table.insert(), self._rows)
+            for row in self._rows:
+                self._week_counter(row['semester'], row['week_number'])['inserted'] += 1
+                changed_weeks.add((row['semester'], row['week_number']))
+            self.inserted_count += len(self._rows)
+            self._rows = []
+
+        for semester, week_number in changed_weeks:
+            register_schedule_week_change(semester, week_number, self.session)
+
+        self.write_seconds += time.perf_counter() - flush_started_at
+
+    def stats(self):
+        """Счетчики записи; rows_per_second - по полному времени импорта, включая разбор"""
+        elapsed = time.perf_counter() - self._started_at
+        rows_count = self.inserted_count + self.updated_count + self.unchanged_count
+        return {
+            'inserted_count': self.inserted_count,
+            'updated_count': self.updated_count,
+            'deleted_count': self.deleted_count,
+            'unchanged_count': self.unchanged_count,
+            'weeks': [
+                {'semester': semester, 'week_number': week_number, 'inserted': counter['inserted'],
+                 'updated': counter['updated'], 'deleted': counter['deleted'], 'unchanged': counter['unchanged']}
+                for (semester, week_number), counter in sorted(self.week_changes.items())
+            ],
+            'seconds': round(elapsed, 3),
+            'write_seconds': round(self.write_seconds, 3),
+            'rows_per_second': int(rows_count / elapsed) if elapsed > 0 else rows_count
+        }
+
+
 # API маршруты
 
 # Инициализация первого администратора
@@ -284,20 +1901,22 @@ def get_current_user(current_user):
 def get_groups():
     search = request.args.get('search', '')
 
-    # Получаем уникальные группы из расписания
-    query = db.session.query(Schedule.group_name, Schedule.course, Schedule.faculty).distinct()
+    # Получаем группы из справочника (только те, у которых есть занятия)
+    query = StudyGroup.query.filter(
+        db.session.query(Schedule.id).filter(Schedule.group_id == StudyGroup.id).exists()
+    )
 
     if search:
-        query = query.filter(Schedule.group_name.ilike(f'%{search}%'))
+        query = query.filter(StudyGroup.name.ilike(f'%{search}%'))
 
-    groups = query.all()
+    groups = query.order_by(StudyGroup.name).all()
 
     result = []
     for group in groups:
         result.append({
-            'group_name': group[0],
-            'course': group[1],
-            'faculty': group[2]
+            'group_name': group.name,
+            'course': group.course,
+            'faculty': group.faculty
         })
 
     return jsonify(result), 200
@@ -308,18 +1927,20 @@ def get_groups():
 def get_teachers():
     search = request.args.get('search', '')
 
-    # Получаем уникальных преподавателей из расписания
-    query = db.session.query(Schedule.teacher_name).distinct().filter(Schedule.teacher_name != '')
+    # Получаем преподавателей из справочника (только тех, у кого есть занятия)
+    query = Teacher.query.filter(
+        db.session.query(Schedule.id).filter(Schedule.teacher_id == Teacher.id).exists()
+    )
 
     if search:
-        query = query.filter(Schedule.teacher_name.ilike(f'%{search}%'))
+        query = query.filter(Teacher.name.ilike(f'%{search}%'))
 
-    teachers = query.all()
+    teachers = query.order_by(Teacher.name).all()
 
     result = []
     for teacher in teachers:
         result.append({
-            'teacher_name': teacher[0]
+            'teacher_name': teacher.name
         })
 
     return jsonify(result), 200
@@ -356,6 +1977,8 @@ def create_time_slot(current_user):
     )
 
     db.session.add(new_slot)
+    # Re-link lessons to time slots
+    refresh_schedule_slot_ids()
     db.session.commit()
 
     return jsonify(new_slot.to_dict()), 201
@@ -377,6 +2000,8 @@ def update_time_slot(current_user, id):
     if 'slot_number' in data:
         slot.slot_number = data['slot_number']
 
+    # Re-link lessons to time slots
+    refresh_schedule_slot_ids()
     db.session.commit()
 
     return jsonify(slot.to_dict()), 200
@@ -389,6 +2014,8 @@ def delete_time_slot(current_user, id):
     slot = TimeSlot.query.get_or_404(id)
 
     db.session.delete(slot)
+    # Re-link lessons to time slots (also clears references to the deleted slot)
+    refresh_schedule_slot_ids()
     db.session.commit()
 
     return jsonify({'message': 'Временной слот успешно удален!'}), 200
@@ -410,6 +2037,8 @@ def reorder_time_slots(current_user):
             if slot:
                 slot.slot_number = item['slot_number']
 
+    # Re-link lessons to time slots
+    refresh_schedule_slot_ids()
     db.session.commit()
 
     return jsonify({'message': 'Порядок временных слотов обновлен!'}), 200
@@ -439,6 +2068,8 @@ def init_time_slots(current_user):
         slot = TimeSlot(**slot_data)
         db.session.add(slot)
 
+    # Re-link lessons to time slots
+    refresh_schedule_slot_ids()
     db.session.commit()
 
     return jsonify({'message': 'Временные слоты успешно инициализированы!'}), 201
@@ -448,23 +2079,40 @@ def init_time_slots(current_user):
 def get_auditories():
     search = request.args.get('search', '')
 
-    # Получаем уникальные аудитории из расписания
-    query = db.session.query(Schedule.auditory).distinct().filter(Schedule.auditory != '')
+    # Получаем аудитории из справочника (только те, в которых есть занятия)
+    query = Auditory.query.filter(
+        db.session.query(Schedule.id).filter(Schedule.auditory_id == Auditory.id).exists()
+    )
 
     if search:
-        query = query.filter(Schedule.auditory.ilike(f'%{search}%'))
+        query = query.filter(Auditory.name.ilike(f'%{search}%'))
 
-    auditories = query.all()
+    auditories = query.order_by(Auditory.name).all()
 
     result = []
     for auditory in auditories:
         result.append({
-            'auditory': auditory[0]
+            'auditory': auditory.name
         })
 
     return jsonify(result), 200
 
 
+# Единые подсказки поиска по группам, преподавателям и аудиториям
+@app.route('/api/search/suggest', methods=['GET'])
+def search_suggest():
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+
+    types = request.args.get('types', '')
+    kinds = {kind.strip() for kind in types.split(',') if kind.strip()}
+    unknown = kinds - set(DIMENSIONS)
+    if unknown:
+        return jsonify({'message': f"Неизвестные типы: {', '.join(sorted(unknown))}"}), 400
+
+    return jsonify(suggest_index.search(query, kinds, limit)), 200
+
+
 # API для работы с расписанием группы
 # API для работы с расписанием группы
 @app.route('/api/schedule/group/<string:group_name>', methods=['GET'])
@@ -475,62 +2123,39 @@ def get_group_schedule(group_name):
         week = request.args.get('week', 1, type=int)
 
         # Определяем год в зависимости от семестра
-        current_date = datetime.now()
-        year = current_date.year
-
-        # Логика определения года для семестра
-        if semester == 2 and current_date.month < 8:
-            # Второй семестр текущего учебного года (весна)
-            pass
-        elif semester == 1 and current_date.month >= 8:
-            # Первый семестр текущего учебного года (осень)
-            pass
-        else:
-            # Корректируем год
-            year = year - 1 if semester == 1 else year
+        year = get_semester_year(semester)
 
-        # Получаем расписание для группы на указанную неделю и семестр
-        try:
-            schedule_items = Schedule.query.filter_by(
-                group_name=group_name,
-                semester=semester,
-                week_number=week
-            ).order_by(Schedule.weekday, Schedule.time_start).all()
-        except Exception as e:
-            # Расширенная обработка ошибок запроса
-            app.logger.error(f"Ошибка запроса расписания: {str(e)}")
-            return jsonify({'message': 'Ошибка при получении расписания', 'error': str(e)}), 500
-
-        # Получаем даты для недели
-        try:
-            dates = get_dates_for_week(year, week)
-        except Exception as e:
-            app.logger.error(f"Ошибка получения дат недели: {str(e)}")
-            return jsonify({'message': 'Ошибка при определении дат недели', 'error': str(e)}), 500
-
-        # Преобразуем расписание в словари
-        schedule_data = []
-        for item in schedule_items:
-            item_dict = item.to_dict()
-
-            # Добавляем дополнительную проверку даты
+        def build_response():
+            # Получаем расписание для группы на указанную неделю и семестр
             try:
-                # Убеждаемся, что дата корректна и соответствует неделе
-                item_date = datetime.strptime(item_dict['date'], '%Y-%m-%d').date()
-                weekday = item_date.weekday() + 1  # Приводим к формату где пн=1
+                schedule_items = schedule_week_query('group', group_name, semester, week).all()
+            except Exception as e:
+                # Расширенная обработка ошибок запроса
+                app.logger.error(f"Ошибка запроса расписания: {str(e)}")
+                return jsonify({'message': 'Ошибка при получении расписания', 'error': str(e)}), 500
 
-                # Проверяем соответствие дня недели
-                if weekday != item.weekday:
-                    app.logger.warning(f"Несоответствие дня недели для записи {item.id}")
+            # Получаем даты для недели
+            try:
+                dates = get_dates_for_week(year, week)
             except Exception as e:
-                app.logger.error(f"Ошибка проверки даты для записи {item.id}: {str(e)}")
+                app.logger.error(f"Ошибка получения дат недели: {str(e)}")
+                return jsonify({'message': 'Ошибка при определении дат недели', 'error': str(e)}), 500
+
+            # Преобразуем расписание в словари
+            schedule_data = []
+            for item in schedule_items:
+                # Проверяем соответствие дня недели дате занятия (пн=1)
+                if item.date and item.date.isoweekday() != item.weekday:
+                    app.logger.warning(f"Несоответствие дня недели для записи {item.id}")
 
-            schedule_data.append(item_dict)
+                schedule_data.append(item.to_dict())
 
-        return jsonify({
-            'schedule': schedule_data,
-            'dates': dates
-        }), 200
+            return jsonify({
+                'schedule': schedule_data,
+                'dates': dates
+            }), 200
+
+        return cached_week_view('group', group_name, semester, week, year, build_response)
 
     except Exception as e:
         # Глобальный обработчик непредвиденных ошибок
@@ -546,35 +2171,21 @@ def get_group_schedule(group_name):
 def get_teacher_schedule(teacher_name):
     semester = request.args.get('semester', 1, type=int)
     week = request.args.get('week', 1, type=int)
+    year = get_semester_year(semester)
 
-    # Получаем расписание для преподавателя на указанную неделю и семестр
-    schedule_items = Schedule.query.filter_by(
-        teacher_name=teacher_name,
-        semester=semester,
-        week_number=week
-    ).order_by(Schedule.weekday, Schedule.time_start).all()
+    def build_response():
+        # Получаем расписание для преподавателя на указанную неделю и семестр
+        schedule_items = schedule_week_query('teacher', teacher_name, semester, week).all()
 
-    # Получаем даты для недели
-    year = datetime.now().year
-    if semester == 2 and datetime.now().month < 8:
-        # Второй семестр текущего учебного года (весна)
-        pass
-    elif semester == 1 and datetime.now().month >= 8:
-        # Первый семестр текущего учебного года (осень)
-        pass
-    else:
-        # В другом случае используем предыдущий или следующий год
-        if semester == 1:
-            year = year - 1
-        else:
-            year = year
+        # Получаем даты для недели
+        dates = get_dates_for_week(year, week)
 
-    dates = get_dates_for_week(year, week)
+        return jsonify({
+            'schedule': [item.to_dict() for item in schedule_items],
+            'dates': dates
+        }), 200
 
-    return jsonify({
-        'schedule': [item.to_dict() for item in schedule_items],
-        'dates': dates
-    }), 200
+    return cached_week_view('teacher', teacher_name, semester, week, year, build_response)
 
 
 # API для работы с расписанием аудитории
@@ -582,363 +2193,407 @@ def get_teacher_schedule(teacher_name):
 def get_auditory_schedule(auditory):
     semester = request.args.get('semester', 1, type=int)
     week = request.args.get('week', 1, type=int)
+    year = get_semester_year(semester)
 
-    # Получаем расписание для аудитории на указанную неделю и семестр
-    schedule_items = Schedule.query.filter_by(
-        auditory=auditory,
-        semester=semester,
-        week_number=week
-    ).order_by(Schedule.weekday, Schedule.time_start).all()
+    def build_response():
+        # Получаем расписание для аудитории на указанную неделю и семестр
+        schedule_items = schedule_week_query('auditory', auditory, semester, week).all()
 
-    # Получаем даты для недели
-    year = datetime.now().year
-    if semester == 2 and datetime.now().month < 8:
-        # Второй семестр текущего учебного года (весна)
-        pass
-    elif semester == 1 and datetime.now().month >= 8:
-        # Первый семестр текущего учебного года (осень)
-        pass
-    else:
-        # В другом случае используем предыдущий или следующий год
-        if semester == 1:
-            year = year - 1
-        else:
-            year = year
+        # Получаем даты для недели
+        dates = get_dates_for_week(year, week)
 
-    dates = get_dates_for_week(year, week)
+        return jsonify({
+            'schedule': [item.to_dict() for item in schedule_items],
+            'dates': dates
+        }), 200
 
-    return jsonify({
-        'schedule': [item.to_dict() for item in schedule_items],
-        'dates': dates
-    }), 200
+    return cached_week_view('auditory', auditory, semester, week, year, build_response)
 
 
-# Экспорт расписания в Excel
-# Экспорт расписания в Excel
-@app.route('/api/schedule/<string:type>/<string:id>/export', methods=['GET'])
-def export_schedule(type, id):
-    try:
-        # Получаем параметры запроса
-        semester = request.args.get('semester', 1, type=int)
-        week = request.args.get('week', 1, type=int)
+# Подписка на расписание в формате iCalendar (RFC 5545)
+ICAL_MIMETYPE = 'text/calendar'
 
-        # Проверка корректности типа
-        if type not in ['group', 'teacher', 'auditory']:
-            return jsonify({'message': 'Неизвестный тип расписания!'}), 400
+ICAL_COLUMNS = (
+    Schedule.id, Schedule.date, Schedule.time_start, Schedule.time_end, Schedule.subject, Schedule.lesson_type,
+    Schedule.subgroup, Schedule.group_name, Schedule.teacher_name, Schedule.auditory, Schedule.updated_at
+)
 
-        # Получаем расписание в зависимости от типа
-        if type == 'group':
-            schedule_items = Schedule.query.filter_by(
-                group_name=id,
-                semester=semester,
-                week_number=week
-            ).order_by(Schedule.weekday, Schedule.time_start).all()
-            name = f"Расписание группы {id}"
-        elif type == 'teacher':
-            schedule_items = Schedule.query.filter_by(
-                teacher_name=id,
-                semester=semester,
-                week_number=week
-            ).order_by(Schedule.weekday, Schedule.time_start).all()
-            name = f"Расписание преподавателя {id}"
-        elif type == 'auditory':
-            schedule_items = Schedule.query.filter_by(
-                auditory=id,
-                semester=semester,
-                week_number=week
-            ).order_by(Schedule.weekday, Schedule.time_start).all()
-            name = f"Расписание аудитории {id}"
+ICAL_ESCAPES = str.maketrans({'\\': '\\\\', ';': '\\;', ',': '\\,', '\n': '\\n'})
 
-        # Проверяем, есть ли данные для экспорта
-        if not schedule_items:
-            return jsonify({'message': f'Нет данных для экспорта по заданным параметрам'}), 404
 
-        # Определяем год для семестра
-        current_date = datetime.now()
-        year = current_date.year
-
-        # Логика определения года в зависимости от семестра
-        if semester == 2 and current_date.month < 8:
-            # Второй семестр текущего учебного года (весна)
-            pass
-        elif semester == 1 and current_date.month >= 8:
-            # Первый семестр текущего учебного года (осень)
-            pass
-        else:
-            # Корректируем год
-            year = year - 1 if semester == 1 else year
+def ical_text(value):
+    return str(value or '').translate(ICAL_ESCAPES)
 
-        # Получаем даты для недели
-        dates = get_dates_for_week(year, week)
 
-        # Получаем актуальные временные слоты
-        time_slots = TimeSlot.query.filter_by(is_active=True).order_by(TimeSlot.slot_number).all()
+def ical_line(line):
+    """Строка свойства, свернутая по 75 октетов (продолжение начинается с пробела)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
 
-        # Функция для форматирования текста ячейки
-        def format_lesson_cell(item, type):
-            cell_text = f"{item.subject}\n"
+    parts = []
+    start = 0
+    limit = 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Не разрезаем многобайтовый символ UTF-8
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start = end
+        limit = 74
+    return '\r\n '.join(parts) + '\r\n'
 
-            if type != 'group':
-                cell_text += f"Группа: {item.group_name}\n"
 
-            if type != 'teacher' and item.teacher_name:
-                cell_text += f"Преп.: {item.teacher_name}\n"
+def ical_datetime(day, time_value):
+    """Локальное ("плавающее") время занятия: календарь показывает его в часовом поясе устройства"""
+    hours, minutes = time_value.split(':')[:2]
+    return f"{day.strftime('%Y%m%d')}T{int(hours):02d}{int(minutes):02d}00"
 
-            if type != 'auditory' and item.auditory:
-                cell_text += f"Ауд.: {item.auditory}\n"
 
-            if item.lesson_type:
-                cell_text += f"Тип: {item.lesson_type}"
+def build_ical_feed(view_type, value, semester):
+    """Календарь всех занятий группы, преподавателя или аудитории за семестр"""
+    rows = db.session.query(*ICAL_COLUMNS).filter(
+        SCHEDULE_VIEW_COLUMNS[view_type] == value,
+        Schedule.semester == semester
+    ).order_by(Schedule.date, Schedule.time_start).all()
 
-            if item.subgroup > 0:
-                cell_text += f" (п/г {item.subgroup})"
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Schedule//Timetable feed//RU',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{ical_text(f'{EXPORT_TITLES[view_type]} {value}, {semester} семестр')}"
+    ]
+    for row in rows:
+        if not row.date or not row.time_start or not row.time_end:
+            continue
 
-            return cell_text
+        summary = row.subject
+        if row.lesson_type:
+            summary += f" ({row.lesson_type})"
+        # Описание - текст ячейки экспорта без первой строки с названием дисциплины
+        description = format_lesson_cell(row, view_type).split('\n', 1)[-1].strip()
+
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:schedule-{row.id}@timetable",
+            f"DTSTAMP:{row.updated_at.strftime('%Y%m%dT%H%M%SZ') if row.updated_at else stamp}",
+            f"DTSTART:{ical_datetime(row.date, row.time_start)}",
+            f"DTEND:{ical_datetime(row.date, row.time_end)}",
+            f"SUMMARY:{ical_text(summary)}"
+        ]
+        if description:
+            lines.append(f"DESCRIPTION:{ical_text(description)}")
+        if row.auditory:
+            lines.append(f"LOCATION:{ical_text(row.auditory)}")
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+
+    return ''.join(ical_line(line) for line in lines).encode('utf-8')
+
+
+@app.route('/api/schedule/<string:type>/<string:id>/calendar.ics', methods=['GET'])
+def get_schedule_calendar(type, id):
+    """Календарь на семестр; собирается один раз на версию семестра и отдается из кеша ответов.
+
+    Клиенты, периодически опрашивающие ленту, получают 304 по If-None-Match или If-Modified-Since.
+    """
+    if type not in SCHEDULE_VIEW_COLUMNS:
+        return jsonify({'message': 'Неизвестный тип расписания!'}), 400
+    semester = request.args.get('semester', 1, type=int)
 
-        # Функция для оценки количества строк текста в ячейке
-        def estimate_row_height(text, chars_per_line=25):
-            # Подсчитываем количество строк по явным переносам
-            explicit_lines = text.count('\n') + 1
+    key = ('ics', type, id, semester, schedule_versions.semester_version(semester))
 
-            # Оцениваем, сколько строк будет из-за переноса текста по ширине
-            total_chars = len(text.replace('\n', ''))
-            wrapped_lines = total_chars / chars_per_line
+    def build_response():
+        body = response_cache.get(key)
+        if body is None:
+            body = build_ical_feed(type, id, semester)
+            response_cache.set(key, body)
+        response = app.response_class(body, mimetype=ICAL_MIMETYPE)
+        response.headers['Content-Disposition'] = f'inline; filename="{type}_{semester}.ics"'
+        return response, 200
 
-            # Берем максимум из двух оценок и добавляем запас для межстрочных интервалов
-            estimated_lines = max(explicit_lines, wrapped_lines) * 1.2
+    return conditional_response(schedule_etag(*key), build_response,
+                                last_modified=schedule_versions.semester_modified(semester))
 
-            # Базовая высота одной строки в пикселях
-            line_height = 15
 
-            # Рассчитываем высоту в пикселях (минимум 60)
-            return max(60, int(estimated_lines * line_height))
+# Экспорт расписания в Excel
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-        # Создаем Excel файл
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output)
-        worksheet = workbook.add_worksheet()
+EXPORT_TITLES = {
+    'group': 'Расписание группы',
+    'teacher': 'Расписание преподавателя',
+    'auditory': 'Расписание аудитории'
+}
 
-        # Настройка форматов для Excel
-        header_format = workbook.add_format({
-            'bold': True,
-            'align': 'center',
-            'valign': 'vcenter',
-            'bg_color': '#D8D8D8',
-            'border': 1
-        })
+# Заголовки столбцов
+EXPORT_WEEKDAYS = ['Время', 'Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
 
-        cell_format = workbook.add_format({
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1,
-            'text_wrap': True  # Перенос текста для лучшей читаемости
-        })
+# Время пар, если временные слоты не настроены
+DEFAULT_EXPORT_TIMES = (
+    ('08:00', '09:20'), ('09:30', '10:50'), ('11:00', '12:20'), ('12:40', '14:00'),
+    ('14:10', '15:30'), ('15:40', '17:00'), ('17:10', '18:30'), ('18:40', '20:00')
+)
 
-        # Форматы для разных типов занятий
-        lecture_format = workbook.add_format({
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1,
-            'text_wrap': True,
-            'bg_color': '#E9F0FC'  # Голубой для лекций
-        })
+# Цвета для типов занятий, не настроенных в справочнике
+DEFAULT_LESSON_COLORS = (
+    ('лек', '#E9F0FC'),  # Голубой для лекций
+    ('пр', '#E3F9E5'),  # Зеленый для практик
+    ('лаб', '#FFF8E8'),  # Желтый для лабораторных
+    ('сем', '#F2E8F7'),  # Фиолетовый для семинаров
+)
+
+# Поля занятия, нужные для сетки экспорта
+EXPORT_COLUMNS = (
+    Schedule.week_number, Schedule.weekday, Schedule.time_start, Schedule.time_end, Schedule.slot_id,
+    Schedule.subject, Schedule.group_name, Schedule.teacher_name, Schedule.auditory,
+    Schedule.lesson_type, Schedule.subgroup
+)
+ExportLesson = namedtuple('ExportLesson', [column.key for column in EXPORT_COLUMNS])
 
-        practice_format = workbook.add_format({
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1,
-            'text_wrap': True,
-            'bg_color': '#E3F9E5'  # Зеленый для практик
-        })
 
-        lab_format = workbook.add_format({
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1,
-            'text_wrap': True,
-            'bg_color': '#FFF8E8'  # Желтый для лабораторных
-        })
+def format_lesson_cell(item, view_type):
+    """Текст ячейки занятия; поле самого представления (группа, преподаватель, аудитория) не выводится"""
+    cell_text = f"{item.subject}\n"
+
+    if view_type != 'group':
+        cell_text += f"Группа: {item.group_name}\n"
+
+    if view_type != 'teacher' and item.teacher_name:
+        cell_text += f"Преп.: {item.teacher_name}\n"
+
+    if view_type != 'auditory' and item.auditory:
+        cell_text += f"Ауд.: {item.auditory}\n"
 
-        seminar_format = workbook.add_format({
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1,
-            'text_wrap': True,
-            'bg_color': '#F2E8F7'  # Фиолетовый для семинаров
-        })
+    if item.lesson_type:
+        cell_text += f"Тип: {item.lesson_type}"
 
-        # Функция для определения формата ячейки в зависимости от типа занятия
-        def get_lesson_format(lesson_type):
-            if not lesson_type:
-                return cell_format
-
-            lesson_type_lower = lesson_type.lower()
-
-            if 'лек' in lesson_type_lower:
-                return lecture_format
-            elif 'пр' in lesson_type_lower:
-                return practice_format
-            elif 'лаб' in lesson_type_lower:
-                return lab_format
-            elif 'сем' in lesson_type_lower:
-                return seminar_format
-
-            return cell_format
-
-        # Заголовки столбцов
-        weekdays = ['Время', 'Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
-
-        # Заголовок листа
-        worksheet.merge_range('A1:G1', f"{name} - {semester} семестр, {week} неделя", header_format)
-
-        # Установка ширины колонок
-        worksheet.set_column(0, 0, 15)  # Колонка времени
-        worksheet.set_column(1, 6, 30)  # Колонки дней недели - увеличиваем до 30 для лучшей читаемости
-
-        # Заголовки дней недели (со 2й строки)
-        for col, day in enumerate(weekdays):
-            worksheet.write(1, col, day, header_format)
-
-        # Даты под днями недели
-        row_index = 2  # Третья строка для дат
-        for i in range(1, 7):
-            if i in dates:
-                date_obj = datetime.strptime(dates[i], '%Y-%m-%d')
-                formatted_date = date_obj.strftime('%d.%m.%Y')
-                worksheet.write(row_index, i, formatted_date, cell_format)
-
-        row_index += 1  # Переходим к строке времени занятий
-
-        # Если нет временных слотов, создаем стандартный набор
-        if not time_slots:
-            default_times = [
-                {'time_start': '08:00', 'time_end': '09:20'},
-                {'time_start': '09:30', 'time_end': '10:50'},
-                {'time_start': '11:00', 'time_end': '12:20'},
-                {'time_start': '12:40', 'time_end': '14:00'},
-                {'time_start': '14:10', 'time_end': '15:30'},
-                {'time_start': '15:40', 'time_end': '17:00'},
-                {'time_start': '17:10', 'time_end': '18:30'},
-                {'time_start': '18:40', 'time_end': '20:00'}
-            ]
+    if item.subgroup and item.subgroup > 0:
+        cell_text += f" (п/г {item.subgroup})"
+
+    return cell_text
 
-            times = default_times
-        else:
-            # Извлекаем информацию о времени из временных слотов
-            times = [{'time_start': slot.time_start, 'time_end': slot.time_end} for slot in time_slots]
-
-        # Получаем все уникальные комбинации времени из расписания
-        unique_times = set()
-        for item in schedule_items:
-            unique_times.add(f"{item.time_start}-{item.time_end}")
-
-        # Добавляем времена из расписания, которых нет в стандартных слотах
-        standard_time_keys = set(f"{t['time_start']}-{t['time_end']}" for t in times)
-        for time_key in unique_times:
-            if time_key not in standard_time_keys:
-                start, end = time_key.split('-')
-                times.append({'time_start': start, 'time_end': end})
-
-        # Сортируем времена по времени начала
-        times.sort(key=lambda x: x['time_start'])
-
-        # Заголовки строк (время пар) и подготовка матрицы расписания
-        time_map = {}  # Карта для хранения индексов времен
-        for idx, time_slot in enumerate(times):
-            time_key = f"{time_slot['time_start']}-{time_slot['time_end']}"
-            time_map[time_key] = idx
-
-            # Записываем ячейку времени
-            time_str = f"{time_slot['time_start']}-{time_slot['time_end']}"
-            worksheet.write(row_index + idx, 0, time_str, cell_format)
-
-            # Инициализируем пустые ячейки для всех дней недели
-            for day in range(1, 7):
-                worksheet.write(row_index + idx, day, "", cell_format)
-
-        # Создаем матрицу для хранения содержимого ячеек
-        # (день недели, временной слот) -> [занятия]
-        schedule_matrix = {}
-
-        # Заполняем матрицу данными
-        for item in schedule_items:
-            time_key = f"{item.time_start}-{item.time_end}"
-
-            # Если этого времени нет в карте, добавляем его
-            if time_key not in time_map:
-                times.append({'time_start': item.time_start, 'time_end': item.time_end})
-                times.sort(key=lambda x: x['time_start'])
-
-                # Пересоздаем карту и пустые ячейки
-                time_map = {}
-                for idx, time_slot in enumerate(times):
-                    new_time_key = f"{time_slot['time_start']}-{time_slot['time_end']}"
-                    time_map[new_time_key] = idx
-
-                    # Перезаписываем ячейку времени
-                    time_str = f"{time_slot['time_start']}-{time_slot['time_end']}"
-                    worksheet.write(row_index + idx, 0, time_str, cell_format)
-
-                    # Перезаписываем пустые ячейки
-                    for day in range(1, 7):
-                        worksheet.write(row_index + idx, day, "", cell_format)
-
-            # Записываем занятие в матрицу
-            matrix_key = (item.weekday, time_key)
-
-            if matrix_key not in schedule_matrix:
-                schedule_matrix[matrix_key] = []
-
-            schedule_matrix[matrix_key].append(item)
-
-        # Словарь для отслеживания наибольшей высоты для каждого временного слота
-        row_heights = {}
-        for time_idx in range(len(times)):
-            row_heights[time_idx] = 60  # Минимальная высота 60 пикселей
-
-        # Заполняем таблицу из матрицы
-        for (day, time_key), items in schedule_matrix.items():
-            if not (1 <= day <= 6):  # Проверка валидности дня недели
-                continue
 
-            # Получаем индекс строки для этого времени
-            time_idx = time_map[time_key]
+def estimate_row_height(text, chars_per_line=25):
+    """Оценка высоты строки в пикселях по количеству строк текста в ячейке"""
+    # Подсчитываем количество строк по явным переносам
+    explicit_lines = text.count('\n') + 1
 
-            # Если несколько занятий в одной ячейке, объединяем их
-            if len(items) > 1:
-                combined_text = ""
-                for item in items:
-                    # Добавляем разделитель между занятиями
-                    if combined_text:
-                        combined_text += "\n---\n"
+    # Оцениваем, сколько строк будет из-за переноса текста по ширине
+    total_chars = len(text.replace('\n', ''))
+    wrapped_lines = total_chars / chars_per_line
 
-                    combined_text += format_lesson_cell(item, type)
+    # Берем максимум из двух оценок и добавляем запас для межстрочных интервалов
+    estimated_lines = max(explicit_lines, wrapped_lines) * 1.2
 
-                # Оцениваем необходимую высоту на основе текста
-                cell_height = estimate_row_height(combined_text,
-                                                  chars_per_line=30)  # 30 символов на строку для ширины колонки 30
+    # Базовая высота одной строки в пикселях
+    line_height = 15
+
+    # Рассчитываем высоту в пикселях (минимум 60)
+    return max(60, int(estimated_lines * line_height))
+
+
+def lesson_export_color(lesson_type):
+    """Цвет ячейки типа занятия: из справочника, по ключевому слову или None"""
+    if not lesson_type:
+        return None
+
+    configured_type = find_lesson_type(lesson_type)
+    if configured_type and configured_type.color:
+        return configured_type.color
+
+    lesson_type_lower = lesson_type.lower()
+    return next((color for keyword, color in DEFAULT_LESSON_COLORS if keyword in lesson_type_lower), None)
+
+
+# Свойства форматов ячеек; объекты Format принадлежат книге, поэтому общими остаются только описания
+EXPORT_HEADER_FORMAT = {
+    'bold': True,
+    'align': 'center',
+    'valign': 'vcenter',
+    'bg_color': '#D8D8D8',
+    'border': 1
+}
+EXPORT_CELL_FORMAT = {
+    'align': 'center',
+    'valign': 'vcenter',
+    'border': 1,
+    'text_wrap': True  # Перенос текста для лучшей читаемости
+}
+
+
+class ExportFormats:
+    """Форматы ячеек одной книги; цветные форматы типов занятий создаются по одному на цвет.
+
+    lesson_colors - заранее вычисленные цвета типов занятий для процессов без доступа к БД.
+    """
+
+    def __init__(self, workbook, lesson_colors=None):
+        self._workbook = workbook
+        self._lesson_colors = {} if lesson_colors is None else dict(lesson_colors)
+        self._resolve_colors = lesson_colors is None
+        self.header = workbook.add_format(EXPORT_HEADER_FORMAT)
+        self.cell = workbook.add_format(EXPORT_CELL_FORMAT)
+        self._colors = {}
+
+    def lesson(self, lesson_type):
+        """Формат ячейки в зависимости от типа занятия"""
+        if self._resolve_colors and lesson_type not in self._lesson_colors:
+            self._lesson_colors[lesson_type] = lesson_export_color(lesson_type)
+        color = self._lesson_colors.get(lesson_type)
+        if color is None:
+            return self.cell
+
+        if color not in self._colors:
+            self._colors[color] = self._workbook.add_format(dict(EXPORT_CELL_FORMAT, bg_color=color))
+        return self._colors[color]
 
-                # Обновляем максимальную высоту для данного временного слота
-                row_heights[time_idx] = max(row_heights[time_idx], cell_height)
 
-                worksheet.write(row_index + time_idx, day, combined_text, cell_format)
+def export_base_times():
+    """Строки времени по активным слотам (или стандартный набор); ключ строки - id слота или "начало-конец\""""
+    time_slots = TimeSlot.query.filter_by(is_active=True).order_by(TimeSlot.slot_number).all()
+    if time_slots:
+        # Строки слотов группируются по id слота
+        return [{'key': slot.id, 'time_start': slot.time_start, 'time_end': slot.time_end}
+                for slot in time_slots]
+    return [{'key': f"{time_start}-{time_end}", 'time_start': time_start, 'time_end': time_end}
+            for time_start, time_end in DEFAULT_EXPORT_TIMES]
+
+
+def setup_export_sheet(worksheet):
+    # Колонка времени и колонки дней недели
+    worksheet.set_column(0, 0, 15)
+    worksheet.set_column(1, 6, 30)
+
+
+GridRow = namedtuple('GridRow', 'label height cells')
+GridCell = namedtuple('GridCell', 'text lessons')
+EMPTY_GRID_ROW = (None,) * 6
+
+
+class WeekGridLayout:
+    """Раскладка недели по сетке "время x день недели", общая для всех форм экспорта.
+
+    Строится за один проход по занятиям: строки - активные слоты и нестандартное время
+    занятий, упорядоченные по началу; в ячейках - занятия дня с готовым текстом;
+    высота строки оценивается по самому длинному тексту. Сетка начинается с трех строк
+    шапки (заголовок на всю ширину, дни недели, даты).
+    """
+
+    HEADER_ROWS = 3
+    MIN_ROW_HEIGHT = 60
+    title_range = (0, 0, 0, len(EXPORT_WEEKDAYS) - 1)
+
+    def __init__(self, base_times, items, view_type, chars_per_line=30):
+        times = {time_slot['key']: time_slot for time_slot in base_times}
+        # Занятия по строкам времени: ключ строки -> шесть списков занятий по дням недели
+        cells = {}
+        for item in items:
+            # Ключ строки занятия: id слота, а для нестандартного времени - строка "начало-конец"
+            time_key = item.slot_id if item.slot_id in times else f"{item.time_start}-{item.time_end}"
+            if time_key not in times:
+                times[time_key] = {'key': time_key, 'time_start': item.time_start, 'time_end': item.time_end}
+            if 1 <= item.weekday <= 6:
+                row_cells = cells.get(time_key)
+                if row_cells is None:
+                    row_cells = cells[time_key] = [None] * 6
+                if row_cells[item.weekday - 1] is None:
+                    row_cells[item.weekday - 1] = [item]
+                else:
+                    row_cells[item.weekday - 1].append(item)
+
+        self.rows = []
+        for time_slot in sorted(times.values(), key=itemgetter('time_start')):
+            label = f"{time_slot['time_start']}-{time_slot['time_end']}"
+            height = self.MIN_ROW_HEIGHT
+            row_cells = cells.get(time_slot['key'])
+            if row_cells is None:
+                # Строка без занятий: шесть пустых ячеек, текст и высоту считать не нужно
+                self.rows.append(GridRow(label, height, EMPTY_GRID_ROW))
+                continue
+            for day, lessons in enumerate(row_cells):
+                if lessons is None:
+                    continue
+                if len(lessons) == 1:
+                    text = format_lesson_cell(lessons[0], view_type)
+                else:
+                    # Несколько занятий в одной ячейке объединяются
+                    text = "\n---\n".join(format_lesson_cell(item, view_type) for item in lessons)
+                height = max(height, estimate_row_height(text, chars_per_line=chars_per_line))
+                row_cells[day] = GridCell(text, lessons)
+            self.rows.append(GridRow(label, height, row_cells))
+
+
+def write_export_week(worksheet, formats, start_row, title, dates, base_times, items, view_type):
+    """Записывает сетку одной недели, начиная со строки start_row; возвращает следующую свободную строку.
+
+    Строки листа пишутся строго по возрастанию, а высота строки задается до ее записи -
+    этого требует режим constant_memory, в котором записанные строки сразу сбрасываются на диск.
+    """
+    layout = WeekGridLayout(base_times, items, view_type)
+
+    first_row, first_col, last_row, last_col = layout.title_range
+    worksheet.merge_range(start_row + first_row, first_col, start_row + last_row, last_col, title, formats.header)
+    for col, day in enumerate(EXPORT_WEEKDAYS):
+        worksheet.write(start_row + 1, col, day, formats.header)
+    for day in range(1, 7):
+        if day in dates:
+            worksheet.write(start_row + 2, day, datetime.strptime(dates[day], '%Y-%m-%d').strftime('%d.%m.%Y'),
+                            formats.cell)
+
+    cell_format = formats.cell
+    row = start_row + layout.HEADER_ROWS
+    for grid_row in layout.rows:
+        worksheet.set_row(row, grid_row.height)
+        worksheet.write(row, 0, grid_row.label, cell_format)
+        for day, cell in enumerate(grid_row.cells, start=1):
+            if cell is None:
+                worksheet.write(row, day, "", cell_format)
+            elif len(cell.lessons) > 1:
+                worksheet.write(row, day, cell.text, cell_format)
             else:
-                item = items[0]
-                lesson_text = format_lesson_cell(item, type)
-                lesson_format = get_lesson_format(item.lesson_type)
+                worksheet.write(row, day, cell.text, formats.lesson(cell.lessons[0].lesson_type))
+        row += 1
 
-                # Оцениваем необходимую высоту на основе текста
-                cell_height = estimate_row_height(lesson_text, chars_per_line=30)  # 30 символов на строку
+    return row
 
-                # Обновляем максимальную высоту для данного временного слота
-                row_heights[time_idx] = max(row_heights[time_idx], cell_height)
 
-                worksheet.write(row_index + time_idx, day, lesson_text, lesson_format)
+# Экспорт расписания в Excel
+@app.route('/api/schedule/<string:type>/<string:id>/export', methods=['GET'])
+def export_schedule(type, id):
+    try:
+        # Получаем параметры запроса
+        semester = request.args.get('semester', 1, type=int)
+        week = request.args.get('week', 1, type=int)
+
+        # Проверка корректности типа
+        if type not in ['group', 'teacher', 'auditory']:
+            return jsonify({'message': 'Неизвестный тип расписания!'}), 400
+
+        # Получаем расписание в зависимости от типа
+        schedule_items = schedule_week_query(type, id, semester, week).all()
+        name = f"{EXPORT_TITLES[type]} {id}"
+
+        # Проверяем, есть ли данные для экспорта
+        if not schedule_items:
+            return jsonify({'message': f'Нет данных для экспорта по заданным параметрам'}), 404
+
+        # Определяем год для семестра
+        year = get_semester_year(semester)
 
-        # Устанавливаем адаптивную высоту строк
-        for idx, height in row_heights.items():
-            worksheet.set_row(row_index + idx, height)
+        # Получаем даты для недели
+        dates = get_dates_for_week(year, week)
 
+        # Создаем Excel файл
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output)
+        worksheet = workbook.add_worksheet()
+        setup_export_sheet(worksheet)
+        write_export_week(worksheet, ExportFormats(workbook), 0, f"{name} - {semester} семестр, {week} неделя",
+                          dates, export_base_times(), schedule_items, type)
         workbook.close()
 
         # Подготавливаем файл для отправки
@@ -946,7 +2601,7 @@ def export_schedule(type, id):
 
         return send_file(
             output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            mimetype=XLSX_MIMETYPE,
             as_attachment=True,
             download_name=f"{type}_{id}_schedule_{semester}_{week}.xlsx"
         )
@@ -957,25 +2612,203 @@ def export_schedule(type, id):
         return jsonify({'message': f'Произошла ошибка при экспорте расписания: {str(e)}'}), 500
 
 
-# CRUD для расписания (требуется авторизация)
-@app.route('/api/schedule', methods=['GET'])
+# Экспорт диапазона недель: лист на неделю (layout=sheets) или все недели подряд на одном листе (layout=single)
+@app.route('/api/schedule/<string:type>/<string:id>/export/weeks', methods=['GET'])
+def export_schedule_weeks(type, id):
+    semester = request.args.get('semester', 1, type=int)
+    week_from = request.args.get('week_from', type=int)
+    week_to = request.args.get('week_to', type=int)
+    layout = request.args.get('layout', 'sheets')
+
+    if type not in SCHEDULE_VIEW_COLUMNS:
+        return jsonify({'message': 'Неизвестный тип расписания!'}), 400
+    if layout not in ('sheets', 'single'):
+        return jsonify({'message': 'Параметр layout должен быть sheets или single'}), 400
+    if week_from and week_to and week_from > week_to:
+        return jsonify({'message': 'Начальная неделя больше конечной'}), 400
+
+    # Один упорядоченный запрос по всему диапазону; строки читаются из курсора порциями,
+    # а в памяти держится только текущая неделя
+    query = db.session.query(*EXPORT_COLUMNS).filter(
+        SCHEDULE_VIEW_COLUMNS[type] == id,
+        Schedule.semester == semester
+    )
+    if week_from:
+        query = query.filter(Schedule.week_number >= week_from)
+    if week_to:
+        query = query.filter(Schedule.week_number <= week_to)
+    query = query.order_by(Schedule.week_number, Schedule.weekday, Schedule.time_start)
+
+    weeks = groupby(query.yield_per(app.config['EXPORT_YIELD_PER']), key=lambda item: item.week_number)
+    first_week = next(weeks, None)
+    if first_week is None:
+        return jsonify({'message': 'Нет данных для экспорта по заданным параметрам'}), 404
+
+    # Книга собирается во временном файле; в режиме constant_memory строки листов
+    # сбрасываются на диск по мере записи
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        formats = ExportFormats(workbook)
+        base_times = export_base_times()
+        year = get_semester_year(semester)
+        name = f"{EXPORT_TITLES[type]} {id}"
+
+        worksheet = None
+        row = 0
+        exported_weeks = []
+        for week_number, items in chain([first_week], weeks):
+            if layout == 'sheets' or worksheet is None:
+                worksheet = workbook.add_worksheet(f"Неделя {week_number}" if layout == 'sheets' else 'Расписание')
+                setup_export_sheet(worksheet)
+                row = 0
+            title = f"{name} - {semester} семестр, {week_number} неделя"
+            # Между неделями на одном листе - пустая строка
+            row = write_export_week(worksheet, formats, row, title, get_dates_for_week(year, week_number),
+                                    base_times, items, type) + 1
+            exported_weeks.append(week_number)
+
+        workbook.close()
+    except Exception as e:
+        output.close()
+        app.logger.error(f"Ошибка при экспорте расписания за несколько недель: {str(e)}")
+        return jsonify({'message': f'Произошла ошибка при экспорте расписания: {str(e)}'}), 500
+
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=f"{type}_{id}_schedule_{semester}_weeks_{exported_weeks[0]}-{exported_weeks[-1]}.xlsx"
+    )
+
+
+class ZipChunkBuffer:
+    """Несмещаемый приемник для zipfile: записанные байты забираются кусками для потокового ответа"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+EXPORT_FILENAME_UNSAFE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def render_export_workbook(title, view_type, dates, base_times, items, lesson_colors):
+    """Книга одной недели одной сущности; выполняется в пуле процессов и не обращается к БД"""
+    started = time.perf_counter()
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    worksheet = workbook.add_worksheet()
+    setup_export_sheet(worksheet)
+    write_export_week(worksheet, ExportFormats(workbook, lesson_colors), 0, title, dates, base_times, items, view_type)
+    workbook.close()
+    return output.getvalue(), time.perf_counter() - started
+
+
+def server_timing(stages):
+    """Значение заголовка Server-Timing из пар (этап, секунды)"""
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+
+# Массовый экспорт недели: книга на каждую группу, преподавателя или аудиторию в одном ZIP-архиве
+@app.route('/api/schedule/<string:type>/export/bulk', methods=['GET'])
 @token_required
-def get_all_schedule(current_user):
-    # Получаем параметры фильтрации
-    semester = request.args.get('semester')
-    week_number = request.args.get('week_number')
-    group_name = request.args.get('group_name')
-    teacher_name = request.args.get('teacher_name')
-    search = request.args.get('search')
+def export_schedule_bulk(current_user, type):
+    semester = request.args.get('semester', 1, type=int)
+    week = request.args.get('week', type=int)
+    faculty = request.args.get('faculty')
+    course = request.args.get('course', type=int)
+
+    if type not in SCHEDULE_VIEW_COLUMNS:
+        return jsonify({'message': 'Неизвестный тип расписания!'}), 400
+    if not week:
+        return jsonify({'message': 'Не указана неделя'}), 400
+
+    # Неделя загружается одним запросом и делится на сущности уже в памяти
+    started = time.perf_counter()
+    view_column = SCHEDULE_VIEW_COLUMNS[type]
+    query = db.session.query(*EXPORT_COLUMNS).filter(
+        Schedule.semester == semester,
+        Schedule.week_number == week,
+        view_column != ''
+    )
+    if faculty:
+        query = query.filter(Schedule.faculty == faculty)
+    if course:
+        query = query.filter(Schedule.course == course)
+    rows = query.order_by(Schedule.weekday, Schedule.time_start).all()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    entities = {}
+    for row in rows:
+        lesson = ExportLesson(*row)
+        entities.setdefault(getattr(lesson, view_column.key), []).append(lesson)
+    lesson_colors = {lesson_type: lesson_export_color(lesson_type)
+                     for lesson_type in set(row.lesson_type for row in rows)}
+    partition_seconds = time.perf_counter() - started
+
+    if not entities:
+        return jsonify({'message': 'Нет данных для экспорта по заданным параметрам'}), 404
+
+    dates = get_dates_for_week(get_semester_year(semester), week)
+    base_times = export_base_times()
+    names = sorted(entities)
+    jobs = [(f"{EXPORT_TITLES[type]} {name} - {semester} семестр, {week} неделя", type, dates, base_times,
+             entities[name], lesson_colors) for name in names]
+    del entities, rows
+
+    def generate():
+        render_started = time.perf_counter()
+        render_seconds = 0.0
+        buffer = ZipChunkBuffer()
+        used_names = set()
+        # Книги уже сжаты, поэтому в архив они кладутся без повторного сжатия
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for name, (content, seconds) in zip(names, run_in_process_pool(render_export_workbook, jobs)):
+                render_seconds += seconds
+                filename = EXPORT_FILENAME_UNSAFE.sub('_', str(name)).strip('_') or type
+                if filename in used_names:
+                    filename = f"{filename}_{len(used_names)}"
+                used_names.add(filename)
+                archive.writestr(f"{filename}.xlsx", content)
+                yield buffer.drain()
+        yield buffer.drain()
+
+        app.logger.info(
+            f"Массовый экспорт {type}, неделя {week}: {len(names)} книг; "
+            f"загрузка {load_seconds:.3f} с, разбиение {partition_seconds:.3f} с, "
+            f"сборка книг {render_seconds:.3f} с процессорного времени, "
+            f"всего {time.perf_counter() - render_started:.3f} с на сборку и архив"
+        )
 
-    query = Schedule.query
+    response = app.response_class(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{type}_schedule_{semester}_{week}.zip"'
+    # Время сборки книг известно только в конце потока и попадает в журнал
+    response.headers['Server-Timing'] = server_timing([('load', load_seconds), ('partition', partition_seconds)])
+    return response
 
-    # Применяем фильтры
+
+# CRUD для расписания (требуется авторизация)
+def filter_schedule_list(query, semester=None, week_number=None, group_name=None, teacher_name=None, search=None):
+    """Фильтры списка расписания: GET /api/schedule и потоковая выгрузка"""
     if semester:
-        query = query.filter_by(semester=int(semester))
+        query = query.filter(Schedule.semester == int(semester))
 
     if week_number:
-        query = query.filter_by(week_number=int(week_number))
+        query = query.filter(Schedule.week_number == int(week_number))
 
     if group_name:
         query = query.filter(Schedule.group_name.ilike(f'%{group_name}%'))
@@ -993,10 +2826,119 @@ def get_all_schedule(current_user):
             )
         )
 
-    # Сортируем по дню недели и времени
-    schedule_items = query.order_by(Schedule.weekday, Schedule.time_start).all()
+    return query
+
+
+@app.route('/api/schedule', methods=['GET'])
+@token_required
+def get_all_schedule(current_user):
+    # Получаем параметры фильтрации
+    semester = request.args.get('semester')
+    week_number = request.args.get('week_number')
+    group_name = request.args.get('group_name')
+    teacher_name = request.args.get('teacher_name')
+    search = request.args.get('search')
+
+    # Выборка по одной неделе зависит только от ее версии, иначе - от любых изменений
+    if semester and week_number:
+        version = schedule_versions.week_version(semester, week_number)
+    else:
+        version = schedule_versions.global_version()
+
+    def build_response():
+        query = filter_schedule_list(Schedule.query, semester, week_number, group_name, teacher_name, search)
+
+        # Сортируем по дню недели и времени
+        schedule_items = query.order_by(Schedule.weekday, Schedule.time_start).all()
+
+        return jsonify([item.to_dict() for item in schedule_items]), 200
+
+    etag = schedule_etag('schedule', semester, week_number, group_name, teacher_name, search, version)
+    return conditional_response(etag, build_response, cache_control='private, no-cache')
+
+
+# Потоковая выгрузка расписания в CSV или NDJSON
+STREAM_EXPORT_COLUMNS = (
+    Schedule.id, Schedule.semester, Schedule.week_number, Schedule.group_name, Schedule.course, Schedule.faculty,
+    Schedule.subject, Schedule.lesson_type, Schedule.subgroup, Schedule.date, Schedule.time_start,
+    Schedule.time_end, Schedule.weekday, Schedule.slot_id, Schedule.teacher_name, Schedule.auditory,
+    Schedule.created_at, Schedule.updated_at
+)
+STREAM_EXPORT_FIELDS = [column.key for column in STREAM_EXPORT_COLUMNS]
+STREAM_EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def stream_export_values(row):
+    """Значения строки выгрузки в порядке STREAM_EXPORT_FIELDS, отформатированные как в Schedule.to_dict"""
+    values = list(row)
+    values[9] = row.date.strftime('%Y-%m-%d') if row.date else None
+    values[16] = row.created_at.strftime('%Y-%m-%d %H:%M:%S') if row.created_at else None
+    values[17] = row.updated_at.strftime('%Y-%m-%d %H:%M:%S') if row.updated_at else None
+    return values
+
+
+@app.route('/api/schedule/export/stream', methods=['GET'])
+@token_required
+def stream_schedule_export(current_user):
+    """Выгрузка произвольного диапазона расписания без сборки всего результата в памяти.
+
+    Фильтры - как у GET /api/schedule, плюс week_from/week_to и date_from/date_to (ГГГГ-ММ-ДД);
+    format=csv (по умолчанию) или ndjson.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in STREAM_EXPORT_FORMATS:
+        return jsonify({'message': 'Параметр format должен быть csv или ndjson'}), 400
+
+    try:
+        semester = request.args.get('semester', type=int)
+        week_number = request.args.get('week_number', type=int)
+        week_from = request.args.get('week_from', type=int)
+        week_to = request.args.get('week_to', type=int)
+        date_from, date_to = (
+            datetime.strptime(request.args[name], '%Y-%m-%d').date() if request.args.get(name) else None
+            for name in ('date_from', 'date_to')
+        )
+    except ValueError:
+        return jsonify({'message': 'Некорректный формат даты. Используйте формат ГГГГ-ММ-ДД'}), 400
+
+    query = filter_schedule_list(db.session.query(*STREAM_EXPORT_COLUMNS), semester, week_number,
+                                 request.args.get('group_name'), request.args.get('teacher_name'),
+                                 request.args.get('search'))
+    if week_from:
+        query = query.filter(Schedule.week_number >= week_from)
+    if week_to:
+        query = query.filter(Schedule.week_number <= week_to)
+    if date_from:
+        query = query.filter(Schedule.date >= date_from)
+    if date_to:
+        query = query.filter(Schedule.date <= date_to)
+
+    # yield_per читает результат серверным курсором порциями, а не целиком
+    batch_size = app.config['EXPORT_YIELD_PER']
+    rows = query.order_by(Schedule.date, Schedule.time_start, Schedule.id).yield_per(batch_size)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if export_format == 'csv' else None
+        if writer:
+            writer.writerow(STREAM_EXPORT_FIELDS)
+
+        # Строки отправляются пачками по batch_size
+        for index, row in enumerate(rows, start=1):
+            values = stream_export_values(row)
+            if writer:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(STREAM_EXPORT_FIELDS, values)), ensure_ascii=False) + '\n')
+            if index % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
 
-    return jsonify([item.to_dict() for item in schedule_items]), 200
+    response = app.response_class(stream_with_context(generate()), mimetype=STREAM_EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="schedule.{export_format}"'
+    return response
 
 
 @app.route('/api/schedule', methods=['POST'])
@@ -1067,76 +3009,31 @@ def check_availability(current_user):
     occupied_slots = []
 
     try:
-        # Base query to find lessons that could conflict
-        base_query = Schedule.query.filter(
-            Schedule.id != lesson_id,  # Exclude the current lesson
-            Schedule.semester == semester,
-            Schedule.week_number == week_number
-        )
+        exclude_ids = {int(lesson_id)} if lesson_id else set()
+        slots_by_time = {}  # (weekday, time_start) -> first slot at this time
 
         # Find conflicts based on provided parameters
-        if auditory:
-            auditory_conflicts = base_query.filter(Schedule.auditory == auditory).all()
-            for lesson in auditory_conflicts:
-                occupied_slots.append({
-                    'weekday': lesson.weekday,
-                    'date': lesson.date.strftime('%Y-%m-%d') if lesson.date else None,
-                    'time_start': lesson.time_start,
-                    'time_end': lesson.time_end,
-                    'subject': lesson.subject,
-                    'group_name': lesson.group_name,
-                    'teacher_name': lesson.teacher_name,
-                    'conflict_type': 'auditory',
-                    'conflict_value': auditory
-                })
-
-        if teacher_name:
-            teacher_conflicts = base_query.filter(Schedule.teacher_name == teacher_name).all()
-            for lesson in teacher_conflicts:
-                # Add if not already added or if it's at the same time (to show multiple conflict types)
-                existing_conflict = next((slot for slot in occupied_slots
-                                          if slot['weekday'] == lesson.weekday and
-                                          slot['time_start'] == lesson.time_start), None)
-
-                if existing_conflict:
-                    # Add teacher conflict type to existing conflict
-                    if 'conflict_types' not in existing_conflict:
-                        existing_conflict['conflict_types'] = [existing_conflict['conflict_type']]
-                        existing_conflict['conflict_values'] = [existing_conflict['conflict_value']]
-
-                    existing_conflict['conflict_types'].append('teacher')
-                    existing_conflict['conflict_values'].append(teacher_name)
-                else:
-                    occupied_slots.append({
-                        'weekday': lesson.weekday,
-                        'date': lesson.date.strftime('%Y-%m-%d') if lesson.date else None,
-                        'time_start': lesson.time_start,
-                        'time_end': lesson.time_end,
-                        'subject': lesson.subject,
-                        'group_name': lesson.group_name,
-                        'teacher_name': lesson.teacher_name,
-                        'conflict_type': 'teacher',
-                        'conflict_value': teacher_name
-                    })
+        for conflict_type, conflict_value in (('auditory', auditory), ('teacher', teacher_name),
+                                              ('group', group_name)):
+            if not conflict_value:
+                continue
 
-        if group_name:
-            group_conflicts = base_query.filter(Schedule.group_name == group_name).all()
-            for lesson in group_conflicts:
-                # Add if not already added or if it's at the same time
-                existing_conflict = next((slot for slot in occupied_slots
-                                          if slot['weekday'] == lesson.weekday and
-                                          slot['time_start'] == lesson.time_start), None)
+            lessons = schedule_index.lessons_for(semester, week_number, conflict_type, conflict_value,
+                                                 exclude_ids)
+            for lesson in lessons:
+                slot_key = (lesson.weekday, lesson.time_start)
+                existing_conflict = slots_by_time.get(slot_key)
 
-                if existing_conflict:
-                    # Add group conflict type to existing conflict
+                # Add if not already added or if it's at the same time (to show multiple conflict types)
+                if existing_conflict and conflict_type != 'auditory':
                     if 'conflict_types' not in existing_conflict:
                         existing_conflict['conflict_types'] = [existing_conflict['conflict_type']]
                         existing_conflict['conflict_values'] = [existing_conflict['conflict_value']]
 
-                    existing_conflict['conflict_types'].append('group')
-                    existing_conflict['conflict_values'].append(group_name)
+                    existing_conflict['conflict_types'].append(conflict_type)
+                    existing_conflict['conflict_values'].append(conflict_value)
                 else:
-                    occupied_slots.append({
+                    slot = {
                         'weekday': lesson.weekday,
                         'date': lesson.date.strftime('%Y-%m-%d') if lesson.date else None,
                         'time_start': lesson.time_start,
@@ -1144,9 +3041,11 @@ def check_availability(current_user):
                         'subject': lesson.subject,
                         'group_name': lesson.group_name,
                         'teacher_name': lesson.teacher_name,
-                        'conflict_type': 'group',
-                        'conflict_value': group_name
-                    })
+                        'conflict_type': conflict_type,
+                        'conflict_value': conflict_value
+                    }
+                    occupied_slots.append(slot)
+                    slots_by_time.setdefault(slot_key, slot)
 
         # Return the list of occupied slots with conflict details
         return jsonify({
@@ -1200,80 +3099,28 @@ def move_group_schedule(current_user):
             conflicts = []
 
             for lesson in lessons:
-                # Проверка конфликтов для аудитории
-                if lesson.auditory:
-                    auditory_conflicts = Schedule.query.filter(
-                        Schedule.id != lesson.id,
-                        Schedule.semester == semester,
-                        Schedule.week_number == week_number,
-                        Schedule.weekday == target_weekday,
-                        Schedule.auditory == lesson.auditory,
-                        # Проверка пересечения времени
-                        ((Schedule.time_start <= target_time_start) & (Schedule.time_end > target_time_start)) |
-                        ((Schedule.time_start < target_time_end) & (Schedule.time_end >= target_time_end)) |
-                        ((Schedule.time_start >= target_time_start) & (Schedule.time_end <= target_time_end))
-                    ).all()
-
-                    for conflict in auditory_conflicts:
-                        conflicts.append({
-                            'lesson_id': lesson.id,
-                            'conflict_id': conflict.id,
-                            'conflict_type': 'auditory',
-                            'conflict_value': lesson.auditory,
-                            'subject': conflict.subject,
-                            'teacher_name': conflict.teacher_name,
-                            'group_name': conflict.group_name
-                        })
-
-                # Проверка конфликтов для преподавателя
-                if lesson.teacher_name:
-                    teacher_conflicts = Schedule.query.filter(
-                        Schedule.id != lesson.id,
-                        Schedule.semester == semester,
-                        Schedule.week_number == week_number,
-                        Schedule.weekday == target_weekday,
-                        Schedule.teacher_name == lesson.teacher_name,
-                        # Проверка пересечения времени
-                        ((Schedule.time_start <= target_time_start) & (Schedule.time_end > target_time_start)) |
-                        ((Schedule.time_start < target_time_end) & (Schedule.time_end >= target_time_end)) |
-                        ((Schedule.time_start >= target_time_start) & (Schedule.time_end <= target_time_end))
-                    ).all()
-
-                    for conflict in teacher_conflicts:
+                # Проверка конфликтов для аудитории, преподавателя и группы
+                # (группу проверяем на всякий случай, хотя тут перемещаем одну группу)
+                for conflict_type, conflict_value in (('auditory', lesson.auditory),
+                                                      ('teacher', lesson.teacher_name),
+                                                      ('group', group_name)):
+                    overlapping = schedule_index.find_overlaps(
+                        semester, week_number, conflict_type, conflict_value,
+                        target_time_start, target_time_end,
+                        weekday=target_weekday, exclude_ids={lesson.id}
+                    )
+
+                    for conflict in overlapping:
                         conflicts.append({
                             'lesson_id': lesson.id,
                             'conflict_id': conflict.id,
-                            'conflict_type': 'teacher',
-                            'conflict_value': lesson.teacher_name,
+                            'conflict_type': conflict_type,
+                            'conflict_value': conflict_value,
                             'subject': conflict.subject,
                             'teacher_name': conflict.teacher_name,
                             'group_name': conflict.group_name
                         })
 
-                # Проверка конфликтов для группы (на всякий случай, хотя тут перемещаем одну группу)
-                group_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson.id,
-                    Schedule.semester == semester,
-                    Schedule.week_number == week_number,
-                    Schedule.weekday == target_weekday,
-                    Schedule.group_name == group_name,
-                    # Проверка пересечения времени
-                    ((Schedule.time_start <= target_time_start) & (Schedule.time_end > target_time_start)) |
-                    ((Schedule.time_start < target_time_end) & (Schedule.time_end >= target_time_end)) |
-                    ((Schedule.time_start >= target_time_start) & (Schedule.time_end <= target_time_end))
-                ).all()
-
-                for conflict in group_conflicts:
-                    conflicts.append({
-                        'lesson_id': lesson.id,
-                        'conflict_id': conflict.id,
-                        'conflict_type': 'group',
-                        'conflict_value': group_name,
-                        'subject': conflict.subject,
-                        'teacher_name': conflict.teacher_name,
-                        'group_name': conflict.group_name
-                    })
-
             # Если есть конфликты, возвращаем их и прерываем операцию
             if conflicts:
                 return jsonify({
@@ -1332,24 +3179,30 @@ def get_usage_stats(current_user):
             week_number=week_number
         ).count()
 
+        # Количество занятий и часов по значению колонки; часы считаются по типам занятий
+        def lessons_and_hours(column, *filters):
+            rows = db.session.query(
+                column,
+                Schedule.lesson_type,
+                db.func.count(Schedule.id)
+            ).filter(
+                Schedule.semester == semester,
+                Schedule.week_number == week_number,
+                *filters
+            ).group_by(column, Schedule.lesson_type).order_by(column).all()
+
+            stats = {}
+            for value, lesson_type, lessons_count in rows:
+                totals = stats.setdefault(value, [0, 0])
+                totals[0] += lessons_count
+                totals[1] += lessons_count * lesson_hours(lesson_type)
+            return [(value, lessons_count, hours) for value, (lessons_count, hours) in stats.items()]
+
         # Статистика по преподавателям
-        teacher_stats = db.session.query(
-            Schedule.teacher_name,
-            db.func.count(Schedule.id).label('lessons_count')
-        ).filter(
-            Schedule.semester == semester,
-            Schedule.week_number == week_number,
-            Schedule.teacher_name != ''
-        ).group_by(Schedule.teacher_name).all()
+        teacher_stats = lessons_and_hours(Schedule.teacher_name, Schedule.teacher_name != '')
 
         # Статистика по группам
-        group_stats = db.session.query(
-            Schedule.group_name,
-            db.func.count(Schedule.id).label('lessons_count')
-        ).filter(
-            Schedule.semester == semester,
-            Schedule.week_number == week_number
-        ).group_by(Schedule.group_name).all()
+        group_stats = lessons_and_hours(Schedule.group_name)
 
         # Статистика по аудиториям
         auditory_stats = db.session.query(
@@ -1381,8 +3234,9 @@ def get_usage_stats(current_user):
 
         return jsonify({
             'total_lessons': total_lessons,
-            'teacher_stats': [{'teacher_name': t[0], 'lessons_count': t[1]} for t in teacher_stats],
-            'group_stats': [{'group_name': g[0], 'lessons_count': g[1]} for g in group_stats],
+            'total_hours': sum(g[2] for g in group_stats),
+            'teacher_stats': [{'teacher_name': t[0], 'lessons_count': t[1], 'hours': t[2]} for t in teacher_stats],
+            'group_stats': [{'group_name': g[0], 'lessons_count': g[1], 'hours': g[2]} for g in group_stats],
             'auditory_stats': [{'auditory': a[0], 'lessons_count': a[1]} for a in auditory_stats],
             'weekday_stats': [{'weekday': w[0], 'lessons_count': w[1]} for w in weekday_stats],
             'timeslot_stats': [{'time_start': t[0], 'lessons_count': t[1]} for t in timeslot_stats]
@@ -1395,131 +3249,141 @@ def get_usage_stats(current_user):
 @app.route('/api/schedule/find_optimal_time', methods=['POST'])
 @token_required
 def find_optimal_time(current_user):
-    """Поиск оптимального времени для занятия без конфликтов"""
+    """Поиск оптимального времени для занятия (или списка занятий) без конфликтов"""
     data = request.get_json()
 
     # Обязательные параметры
     lesson_id = data.get('lesson_id')
+    lesson_ids = data.get('lesson_ids')
     semester = data.get('semester')
     week_number = data.get('week_number')
 
-    if not all([lesson_id, semester, week_number]):
+    if not all([lesson_id or lesson_ids, semester, week_number]):
         return jsonify({'message': 'Не указаны обязательные параметры'}), 400
 
+    # id занятий сравниваются с найденными, поэтому приводятся к числам до запроса
+    if lesson_ids:
+        if not isinstance(lesson_ids, list):
+            return jsonify({'message': 'Параметр lesson_ids должен быть списком id занятий'}), 400
+        try:
+            lesson_ids = [int(item) for item in lesson_ids]
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Параметр lesson_ids должен содержать целые числа'}), 400
+
     try:
-        # Получаем информацию о занятии
-        lesson = Schedule.query.get_or_404(lesson_id)
+        # Получаем информацию о занятиях
+        if lesson_ids:
+            lessons = Schedule.query.filter(Schedule.id.in_(lesson_ids)).all()
+        else:
+            lessons = [Schedule.query.get_or_404(lesson_id)]
 
         # Получаем все временные слоты
         time_slots = TimeSlot.query.filter_by(is_active=True).order_by(TimeSlot.slot_number).all()
 
-        # Генерируем возможные варианты (все дни недели и все временные слоты)
-        options = []
+        # Даты недели считаем один раз
+        dates = get_dates_for_week(datetime.now().year, week_number)
 
-        for weekday in range(1, 7):  # Пн-Сб (1-6)
-            for slot in time_slots:
-                # Определяем дату для этого дня недели
-                dates = get_dates_for_week(datetime.now().year, week_number)
-                date_str = dates.get(weekday)
+        # Загружаем одним запросом все занятия недели, затрагивающие нужные ресурсы
+        resource_filters = []
+        for conflict_type, attribute in CONFLICT_RESOURCES:
+            values = {getattr(lesson, attribute) for lesson in lessons if getattr(lesson, attribute)}
+            if values:
+                resource_filters.append(getattr(Schedule, attribute).in_(values))
 
-                if not date_str:
-                    continue
+        week_lessons = Schedule.query.filter(
+            Schedule.semester == semester,
+            Schedule.week_number == week_number,
+            or_(*resource_filters)
+        ).all() if resource_filters else []
 
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+        occupancy = WeekOccupancy(week_lessons, time_slots)
+        serialized = {}
 
-                # Проверяем, свободно ли это время
-                conflicts = {
-                    'teacher_conflicts': [],
-                    'group_conflicts': [],
-                    'auditory_conflicts': []
-                }
+        def lesson_dict(item):
+            if item.id not in serialized:
+                serialized[item.id] = item.to_dict()
+            return serialized[item.id]
 
-                # Проверка конфликтов для преподавателя
-                if lesson.teacher_name:
-                    teacher_conflicts = Schedule.query.filter(
-                        Schedule.id != lesson_id,
-                        Schedule.semester == semester,
-                        Schedule.week_number == week_number,
-                        Schedule.weekday == weekday,
-                        Schedule.teacher_name == lesson.teacher_name,
-                        # Проверка пересечения времени
-                        ((Schedule.time_start <= slot.time_start) & (Schedule.time_end > slot.time_start)) |
-                        ((Schedule.time_start < slot.time_end) & (Schedule.time_end >= slot.time_end)) |
-                        ((Schedule.time_start >= slot.time_start) & (Schedule.time_end <= slot.time_end))
-                    ).all()
-
-                    if teacher_conflicts:
-                        conflicts['teacher_conflicts'] = [c.to_dict() for c in teacher_conflicts]
-
-                # Проверка конфликтов для группы
-                if lesson.group_name:
-                    group_conflicts = Schedule.query.filter(
-                        Schedule.id != lesson_id,
-                        Schedule.semester == semester,
-                        Schedule.week_number == week_number,
-                        Schedule.weekday == weekday,
-                        Schedule.group_name == lesson.group_name,
-                        # Проверка пересечения времени
-                        ((Schedule.time_start <= slot.time_start) & (Schedule.time_end > slot.time_start)) |
-                        ((Schedule.time_start < slot.time_end) & (Schedule.time_end >= slot.time_end)) |
-                        ((Schedule.time_start >= slot.time_start) & (Schedule.time_end <= slot.time_end))
-                    ).all()
-
-                    if group_conflicts:
-                        conflicts['group_conflicts'] = [c.to_dict() for c in group_conflicts]
-
-                # Проверка конфликтов для аудитории
-                if lesson.auditory:
-                    auditory_conflicts = Schedule.query.filter(
-                        Schedule.id != lesson_id,
-                        Schedule.semester == semester,
-                        Schedule.week_number == week_number,
-                        Schedule.weekday == weekday,
-                        Schedule.auditory == lesson.auditory,
-                        # Проверка пересечения времени
-                        ((Schedule.time_start <= slot.time_start) & (Schedule.time_end > slot.time_start)) |
-                        ((Schedule.time_start < slot.time_end) & (Schedule.time_end >= slot.time_end)) |
-                        ((Schedule.time_start >= slot.time_start) & (Schedule.time_end <= slot.time_end))
-                    ).all()
-
-                    if auditory_conflicts:
-                        conflicts['auditory_conflicts'] = [c.to_dict() for c in auditory_conflicts]
-
-                # Определяем общее количество конфликтов
-                total_conflicts = (
-                        len(conflicts['teacher_conflicts']) +
-                        len(conflicts['group_conflicts']) +
-                        len(conflicts['auditory_conflicts'])
-                )
+        weekday_names = ['', 'Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
+        results = []
 
-                # Добавляем вариант в список
-                options.append({
-                    'weekday': weekday,
-                    'weekday_name': ['', 'Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота'][weekday],
-                    'date': date_str,
-                    'time_start': slot.time_start,
-                    'time_end': slot.time_end,
-                    'time_slot_id': slot.id,
-                    'conflicts': conflicts,
-                    'total_conflicts': total_conflicts
-                })
+        for lesson in lessons:
+            resources = [(conflict_type, getattr(lesson, attribute))
+                         for conflict_type, attribute in CONFLICT_RESOURCES if getattr(lesson, attribute)]
+            masks = {conflict_type: occupancy.resource_mask(conflict_type, value, lesson.id)
+                     for conflict_type, value in resources}
+
+            # Ячейка свободна, если она не занята ни одним из ресурсов занятия
+            blocked = 0
+            for mask in masks.values():
+                blocked |= mask
+            free = occupancy.full_mask & ~blocked
+
+            options = []
+            for weekday in WeekOccupancy.WEEKDAYS:
+                date_str = dates.get(weekday)
+                if not date_str:
+                    continue
 
-        # Сортируем варианты по количеству конфликтов (сначала без конфликтов)
-        options.sort(key=lambda x: x['total_conflicts'])
+                for slot_index, slot in enumerate(time_slots):
+                    bit = occupancy.cell_bit(weekday, slot_index)
+                    conflicts = {
+                        'teacher_conflicts': [],
+                        'group_conflicts': [],
+                        'auditory_conflicts': []
+                    }
+
+                    # Списки конфликтов собираем только для занятых ячеек
+                    if not free >> bit & 1:
+                        for conflict_type, value in resources:
+                            if masks[conflict_type] >> bit & 1:
+                                conflicts[f'{conflict_type}_conflicts'] = [
+                                    lesson_dict(item)
+                                    for item in occupancy.conflicts_at(conflict_type, value, bit, lesson.id)
+                                ]
+
+                    # Определяем общее количество конфликтов
+                    total_conflicts = (
+                            len(conflicts['teacher_conflicts']) +
+                            len(conflicts['group_conflicts']) +
+                            len(conflicts['auditory_conflicts'])
+                    )
+
+                    options.append({
+                        'weekday': weekday,
+                        'weekday_name': weekday_names[weekday],
+                        'date': date_str,
+                        'time_start': slot.time_start,
+                        'time_end': slot.time_end,
+                        'time_slot_id': slot.id,
+                        'conflicts': conflicts,
+                        'total_conflicts': total_conflicts
+                    })
 
-        # Отбираем 10 лучших вариантов
-        top_options = options[:10]
+            # Сортируем варианты по количеству конфликтов (сначала без конфликтов)
+            options.sort(key=lambda x: x['total_conflicts'])
 
-        return jsonify({
-            'lesson': lesson.to_dict(),
-            'options': top_options,
-            'current': {
-                'weekday': lesson.weekday,
-                'date': lesson.date.strftime('%Y-%m-%d') if lesson.date else None,
-                'time_start': lesson.time_start,
-                'time_end': lesson.time_end
-            }
-        }), 200
+            results.append({
+                'lesson': lesson_dict(lesson),
+                # Отбираем 10 лучших вариантов
+                'options': options[:10],
+                'free_slots_count': bin(free).count('1'),
+                'current': {
+                    'weekday': lesson.weekday,
+                    'date': lesson.date.strftime('%Y-%m-%d') if lesson.date else None,
+                    'time_start': lesson.time_start,
+                    'time_end': lesson.time_end
+                }
+            })
+
+        if lesson_ids:
+            found_ids = {lesson.id for lesson in lessons}
+            return jsonify({
+                'results': results,
+                'missing_lesson_ids': [item for item in lesson_ids if item not in found_ids]
+            }), 200
+
+        return jsonify(results[0]), 200
 
     except Exception as e:
         return jsonify({'message': f'Ошибка при поиске оптимального времени: {str(e)}'}), 500
@@ -1529,10 +3393,16 @@ def find_optimal_time(current_user):
 def get_schedule_by_date(date):
     try:
         date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-        # Ищем занятия с этой датой
-        schedule_items = Schedule.query.filter_by(date=date_obj).all()
 
-        return jsonify([item.to_dict() for item in schedule_items]), 200
+        def build_response():
+            # Ищем занятия с этой датой
+            schedule_items = Schedule.query.filter_by(date=date_obj).all()
+
+            return jsonify([item.to_dict() for item in schedule_items]), 200
+
+        # Неделя по дате не известна заранее, поэтому используется общая версия расписания
+        etag = schedule_etag('by-date', date_obj, schedule_versions.global_version())
+        return conditional_response(etag, build_response)
     except Exception as e:
         return jsonify({'message': f'Ошибка: {str(e)}'}), 500
 
@@ -1553,101 +3423,8 @@ def get_all_conflicts(current_user):
             week_number=week_number
         ).all()
 
-        # Создаем словари для быстрого поиска
-        teacher_schedule = {}  # teacher_name -> [[weekday, time_start, time_end, lesson_id], ...]
-        group_schedule = {}  # group_name -> [[weekday, time_start, time_end, lesson_id], ...]
-        auditory_schedule = {}  # auditory -> [[weekday, time_start, time_end, lesson_id], ...]
-
-        for lesson in lessons:
-            # Добавляем в расписание преподавателя
-            if lesson.teacher_name:
-                if lesson.teacher_name not in teacher_schedule:
-                    teacher_schedule[lesson.teacher_name] = []
-                teacher_schedule[lesson.teacher_name].append([
-                    lesson.weekday, lesson.time_start, lesson.time_end, lesson.id, lesson
-                ])
-
-            # Добавляем в расписание группы
-            if lesson.group_name not in group_schedule:
-                group_schedule[lesson.group_name] = []
-            group_schedule[lesson.group_name].append([
-                lesson.weekday, lesson.time_start, lesson.time_end, lesson.id, lesson
-            ])
-
-            # Добавляем в расписание аудитории
-            if lesson.auditory:
-                if lesson.auditory not in auditory_schedule:
-                    auditory_schedule[lesson.auditory] = []
-                auditory_schedule[lesson.auditory].append([
-                    lesson.weekday, lesson.time_start, lesson.time_end, lesson.id, lesson
-                ])
-
-        # Функция для проверки пересечения временных интервалов
-        def has_time_overlap(time1_start, time1_end, time2_start, time2_end):
-            return (time1_start < time2_end and time1_end > time2_start)
-
         # Поиск конфликтов
-        conflicts = []
-
-        # Конфликты преподавателей
-        for teacher, schedule in teacher_schedule.items():
-            for i in range(len(schedule)):
-                for j in range(i + 1, len(schedule)):
-                    if (schedule[i][0] == schedule[j][0] and  # Тот же день недели
-                            has_time_overlap(schedule[i][1], schedule[i][2], schedule[j][1], schedule[j][2])):
-                        conflicts.append({
-                            'conflict_type': 'teacher',
-                            'conflict_value': teacher,
-                            'weekday': schedule[i][0],
-                            'time1_start': schedule[i][1],
-                            'time1_end': schedule[i][2],
-                            'time2_start': schedule[j][1],
-                            'time2_end': schedule[j][2],
-                            'lesson1_id': schedule[i][3],
-                            'lesson2_id': schedule[j][3],
-                            'lesson1': schedule[i][4].to_dict(),
-                            'lesson2': schedule[j][4].to_dict()
-                        })
-
-        # Конфликты групп
-        for group, schedule in group_schedule.items():
-            for i in range(len(schedule)):
-                for j in range(i + 1, len(schedule)):
-                    if (schedule[i][0] == schedule[j][0] and  # Тот же день недели
-                            has_time_overlap(schedule[i][1], schedule[i][2], schedule[j][1], schedule[j][2])):
-                        conflicts.append({
-                            'conflict_type': 'group',
-                            'conflict_value': group,
-                            'weekday': schedule[i][0],
-                            'time1_start': schedule[i][1],
-                            'time1_end': schedule[i][2],
-                            'time2_start': schedule[j][1],
-                            'time2_end': schedule[j][2],
-                            'lesson1_id': schedule[i][3],
-                            'lesson2_id': schedule[j][3],
-                            'lesson1': schedule[i][4].to_dict(),
-                            'lesson2': schedule[j][4].to_dict()
-                        })
-
-        # Конфликты аудиторий
-        for auditory, schedule in auditory_schedule.items():
-            for i in range(len(schedule)):
-                for j in range(i + 1, len(schedule)):
-                    if (schedule[i][0] == schedule[j][0] and  # Тот же день недели
-                            has_time_overlap(schedule[i][1], schedule[i][2], schedule[j][1], schedule[j][2])):
-                        conflicts.append({
-                            'conflict_type': 'auditory',
-                            'conflict_value': auditory,
-                            'weekday': schedule[i][0],
-                            'time1_start': schedule[i][1],
-                            'time1_end': schedule[i][2],
-                            'time2_start': schedule[j][1],
-                            'time2_end': schedule[j][2],
-                            'lesson1_id': schedule[i][3],
-                            'lesson2_id': schedule[j][3],
-                            'lesson1': schedule[i][4].to_dict(),
-                            'lesson2': schedule[j][4].to_dict()
-                        })
+        conflicts = find_schedule_conflicts(lessons)
 
         # Группируем конфликты по типу
         grouped_conflicts = {
@@ -1706,86 +3483,32 @@ def update_schedule(current_user, id):
         'time_end' in data, 'auditory' in data, 'teacher_name' in data,
         'group_name' in data
     ]):
-        conflict_found = False
         conflicts = []
+        new_semester = data.get('semester', item.semester)
+        new_week_number = data.get('week_number', item.week_number)
+
+        # Check for auditory, teacher and group conflicts if they are specified
+        for conflict_type, conflict_value in (('auditory', new_auditory), ('teacher', new_teacher_name),
+                                              ('group', new_group_name)):
+            overlapping = schedule_index.find_overlaps(
+                new_semester, new_week_number, conflict_type, conflict_value,
+                new_time_start, new_time_end,
+                date=new_date, exclude_ids={id}  # Exclude the current lesson
+            )
 
-        # Check for auditory conflicts if auditory is specified
-        if new_auditory:
-            auditory_conflicts = Schedule.query.filter(
-                Schedule.id != id,  # Exclude the current lesson
-                Schedule.date == new_date,
-                Schedule.auditory == new_auditory,
-                # Check for time overlap
-                ((Schedule.time_start <= new_time_start) & (Schedule.time_end > new_time_start)) |
-                ((Schedule.time_start < new_time_end) & (Schedule.time_end >= new_time_end)) |
-                ((Schedule.time_start >= new_time_start) & (Schedule.time_end <= new_time_end))
-            ).all()
-
-            if auditory_conflicts:
-                conflict_found = True
-                for c in auditory_conflicts:
-                    conflicts.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'auditory',
-                        'conflict_value': new_auditory
-                    })
-
-        # Check for teacher conflicts if teacher is specified
-        if new_teacher_name:
-            teacher_conflicts = Schedule.query.filter(
-                Schedule.id != id,  # Exclude the current lesson
-                Schedule.date == new_date,
-                Schedule.teacher_name == new_teacher_name,
-                # Check for time overlap
-                ((Schedule.time_start <= new_time_start) & (Schedule.time_end > new_time_start)) |
-                ((Schedule.time_start < new_time_end) & (Schedule.time_end >= new_time_end)) |
-                ((Schedule.time_start >= new_time_start) & (Schedule.time_end <= new_time_end))
-            ).all()
-
-            if teacher_conflicts:
-                conflict_found = True
-                for c in teacher_conflicts:
-                    conflicts.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'teacher',
-                        'conflict_value': new_teacher_name
-                    })
+            for c in overlapping:
+                conflicts.append({
+                    'id': c.id,
+                    'subject': c.subject,
+                    'group_name': c.group_name,
+                    'teacher_name': c.teacher_name,
+                    'time_start': c.time_start,
+                    'time_end': c.time_end,
+                    'conflict_type': conflict_type,
+                    'conflict_value': conflict_value
+                })
 
-        # Check for group conflicts if group is specified
-        if new_group_name:
-            group_conflicts = Schedule.query.filter(
-                Schedule.id != id,  # Exclude the current lesson
-                Schedule.date == new_date,
-                Schedule.group_name == new_group_name,
-                # Check for time overlap
-                ((Schedule.time_start <= new_time_start) & (Schedule.time_end > new_time_start)) |
-                ((Schedule.time_start < new_time_end) & (Schedule.time_end >= new_time_end)) |
-                ((Schedule.time_start >= new_time_start) & (Schedule.time_end <= new_time_end))
-            ).all()
-
-            if group_conflicts:
-                conflict_found = True
-                for c in group_conflicts:
-                    conflicts.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'group',
-                        'conflict_value': new_group_name
-                    })
+        conflict_found = bool(conflicts)
 
         if conflict_found:
             return jsonify({
@@ -1870,359 +3593,1191 @@ def swap_schedule_items(current_user):
         if not force_swap:
             conflicts = []
 
-            # Check conflicts for lesson1 going to lesson2's slot
-            conflicts_for_lesson1 = []
-
-            # Check for auditory conflicts
-            if lesson1.auditory:
-                auditory_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson1_id,
-                    Schedule.id != lesson2_id,
-                    Schedule.date == lesson2.date,
-                    Schedule.auditory == lesson1.auditory,
-                    # Check for time overlap
-                    ((Schedule.time_start <= lesson2.time_start) & (Schedule.time_end > lesson2.time_start)) |
-                    ((Schedule.time_start < lesson2.time_end) & (Schedule.time_end >= lesson2.time_end)) |
-                    ((Schedule.time_start >= lesson2.time_start) & (Schedule.time_end <= lesson2.time_end))
-                ).all()
+            # Check conflicts for each lesson going to the other lesson's slot
+            for moving, target in ((lesson1, lesson2), (lesson2, lesson1)):
+                moving_conflicts = []
+
+                for conflict_type, conflict_value in (('auditory', moving.auditory),
+                                                      ('teacher', moving.teacher_name),
+                                                      ('group', moving.group_name)):
+                    overlapping = schedule_index.find_overlaps(
+                        target.semester, target.week_number, conflict_type, conflict_value,
+                        target.time_start, target.time_end,
+                        date=target.date, exclude_ids={lesson1_id, lesson2_id}
+                    )
+
+                    for c in overlapping:
+                        moving_conflicts.append({
+                            'id': c.id,
+                            'subject': c.subject,
+                            'group_name': c.group_name,
+                            'teacher_name': c.teacher_name,
+                            'auditory': c.auditory,
+                            'time_start': c.time_start,
+                            'time_end': c.time_end,
+                            'conflict_type': conflict_type,
+                            'conflict_value': conflict_value
+                        })
 
-                for c in auditory_conflicts:
-                    conflicts_for_lesson1.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'auditory': c.auditory,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'auditory',
-                        'conflict_value': lesson1.auditory
+                if moving_conflicts:
+                    conflicts.append({
+                        'lesson_id': moving.id,
+                        'subject': moving.subject,
+                        'conflicts': moving_conflicts
                     })
 
-            # Check for teacher conflicts
-            if lesson1.teacher_name:
-                teacher_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson1_id,
-                    Schedule.id != lesson2_id,
-                    Schedule.date == lesson2.date,
-                    Schedule.teacher_name == lesson1.teacher_name,
-                    # Check for time overlap
-                    ((Schedule.time_start <= lesson2.time_start) & (Schedule.time_end > lesson2.time_start)) |
-                    ((Schedule.time_start < lesson2.time_end) & (Schedule.time_end >= lesson2.time_end)) |
-                    ((Schedule.time_start >= lesson2.time_start) & (Schedule.time_end <= lesson2.time_end))
-                ).all()
+            if conflicts:
+                return jsonify({
+                    'message': 'Обнаружены конфликты при обмене занятиями',
+                    'conflicts': conflicts
+                }), 409
+
+        # Perform the swap of time and location information
+        lesson1.date = lesson2_date
+        lesson1.weekday = lesson2_weekday
+        lesson1.time_start = lesson2_time_start
+        lesson1.time_end = lesson2_time_end
+
+        lesson2.date = lesson1_date
+        lesson2.weekday = lesson1_weekday
+        lesson2.time_start = lesson1_time_start
+        lesson2.time_end = lesson1_time_end
+
+        # Also swap locations if requested
+        if data.get('swap_locations', False):
+            lesson1.auditory = lesson2_auditory
+            lesson2.auditory = lesson1_auditory
 
-                for c in teacher_conflicts:
-                    conflicts_for_lesson1.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'auditory': c.auditory,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'teacher',
-                        'conflict_value': lesson1.teacher_name
+        # Commit changes
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Занятия успешно поменяны местами',
+            'lesson1': lesson1.to_dict(),
+            'lesson2': lesson2.to_dict()
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Ошибка при обмене занятиями: {str(e)}'}), 500
+
+
+@app.route('/api/schedule/conflicts', methods=['POST'])
+@token_required
+def get_conflicts(current_user):
+    """Get detailed information about all conflicts for a specific time slot"""
+    data = request.get_json()
+
+    # Required parameters
+    date = data.get('date')
+    time_start = data.get('time_start')
+    time_end = data.get('time_end')
+
+    if not all([date, time_start, time_end]):
+        return jsonify({'message': 'Missing required parameters'}), 400
+
+    try:
+        # Convert string date to Date object if needed
+        if isinstance(date, str):
+            try:
+                date_obj = datetime.strptime(date, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'message': 'Неверный формат даты. Используйте YYYY-MM-DD.'}), 400
+        else:
+            date_obj = date
+
+        # Find all lessons at the given time slot
+        lessons = Schedule.query.filter(
+            Schedule.date == date_obj,
+            Schedule.start_min == time_to_minutes(time_start),
+            Schedule.end_min == time_to_minutes(time_end)
+        ).all()
+
+        # Serialize each lesson once and group by resource
+        lesson_dicts = [lesson.to_dict() for lesson in lessons]
+        resource_buckets = {conflict_type: {} for conflict_type, _ in CONFLICT_RESOURCES}
+
+        for lesson, lesson_dict in zip(lessons, lesson_dicts):
+            for conflict_type, attribute in CONFLICT_RESOURCES:
+                value = getattr(lesson, attribute)
+                if value:
+                    resource_buckets[conflict_type].setdefault(value, []).append(lesson_dict)
+
+        # Find actual conflicts (where there are multiple lessons for the same resource)
+        actual_teacher_conflicts = {teacher: items for teacher, items in resource_buckets['teacher'].items()
+                                    if len(items) > 1}
+        actual_auditory_conflicts = {auditory: items for auditory, items in resource_buckets['auditory'].items()
+                                     if len(items) > 1}
+        actual_group_conflicts = {group: items for group, items in resource_buckets['group'].items()
+                                  if len(items) > 1}
+
+        return jsonify({
+            'date': date,
+            'time_start': time_start,
+            'time_end': time_end,
+            'teacher_conflicts': actual_teacher_conflicts,
+            'auditory_conflicts': actual_auditory_conflicts,
+            'group_conflicts': actual_group_conflicts,
+            'all_lessons': lesson_dicts
+        }), 200
+
+    except Exception as e:
+        return jsonify({'message': f'Ошибка при получении конфликтов: {str(e)}'}), 500
+
+# Быстрое добавление записей в расписание БЕЗ авторизации
+QUICK_ADD_REQUIRED_FIELDS = (
+    'semester', 'week_number', 'group_name', 'course',
+    'subject', 'date', 'time_start', 'time_end', 'weekday'
+)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def quick_add_values(data):
+    """Проверяет запись quick_add_schedule и возвращает значения строки schedule; ошибки - ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Запись должна быть JSON-объектом')
+
+    # Обязательные проверки
+    for field in QUICK_ADD_REQUIRED_FIELDS:
+        if field not in data or not data[field]:
+            raise ValueError(f'Поле {field} обязательно для заполнения!')
+
+    # Пытаемся распарсить дату
+    if isinstance(data['date'], str):
+        # Попытка распарсить строку
+        try:
+            date_obj = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        except ValueError as e:
+            raise ValueError(f'Ошибка парсинга даты: {str(e)}')
+    elif isinstance(data['date'], (int, float)):
+        # Если передан timestamp
+        date_obj = datetime.fromtimestamp(data['date'] / 1000).date()
+    else:
+        raise ValueError('Неверный формат даты')
+
+    try:
+        return dict(
+            semester=int(data['semester']),
+            week_number=int(data['week_number']),
+            group_name=data['group_name'],
+            course=int(data['course']),
+            faculty=data.get('faculty', ''),
+            subject=data['subject'],
+            lesson_type=data.get('lesson_type', ''),
+            subgroup=int(data.get('subgroup') or 0),
+            date=date_obj,
+            time_start=data['time_start'],
+            time_end=data['time_end'],
+            weekday=int(data['weekday']),
+            teacher_name=data.get('teacher_name', ''),
+            auditory=data.get('auditory', '')
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Некорректное числовое поле: {str(e)}')
+
+
+def iter_quick_add_records(stream, ndjson):
+    """Пары (индекс, запись) из NDJSON или элементов JSON-массива; некорректная строка NDJSON
+    выдается как исключение, а ошибка в самом массиве прерывает разбор (ScheduleFileError)"""
+    if ndjson:
+        index = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError as e:
+                yield index, ValueError(f'Некорректный JSON: {str(e)}')
+            index += 1
+        return
+
+    tokens = JSONTokenStream(stream, encoding='utf-8')
+    if tokens.next()[0] != '[':
+        raise ScheduleFileError('Ожидается JSON-массив записей')
+    for index, token in enumerate(tokens.iter_array()):
+        yield index, tokens.parse_value(token)
+
+
+def insert_quick_add_chunk(chunk):
+    """Вставляет пачку [(индекс, значения)] отдельной транзакцией и возвращает результаты по записям"""
+    table = Schedule.__table__
+    try:
+        rows = [schedule_row_values(db.session, values) for _, values in chunk]
+        ids = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for semester, week_number in {(row['semester'], row['week_number']) for row in rows}:
+            register_schedule_week_change(semester, week_number)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return [{'index': index, 'status': 'error', 'message': f'Ошибка при добавлении записи: {str(e)}'}
+                for index, _ in chunk]
+
+    return [{'index': index, 'status': 'ok', 'id': row_id} for (index, _), row_id in zip(chunk, ids)]
+
+
+def quick_add_batch(records):
+    """Потоковый ответ NDJSON: результат по каждой записи по мере записи пачек и итоговая строка"""
+    chunk_size = app.config['IMPORT_BATCH_SIZE']
+
+    def line(item):
+        return json.dumps(item, ensure_ascii=False) + '\n'
+
+    def generate():
+        started_at = time.perf_counter()
+        counts = Counter()
+        chunk = []
+        stream_error = None
+
+        def write(chunk):
+            for result in insert_quick_add_chunk(chunk):
+                counts[result['status']] += 1
+                yield line(result)
+
+        try:
+            for index, record in records:
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    values = quick_add_values(record)
+                except ValueError as e:
+                    counts['error'] += 1
+                    yield line({'index': index, 'status': 'error', 'message': str(e)})
+                    continue
+
+                chunk.append((index, values))
+                if len(chunk) >= chunk_size:
+                    yield from write(chunk)
+                    chunk = []
+        except (ScheduleFileError, UnicodeDecodeError) as e:
+            # Дальше тело запроса не разобрать; уже прочитанные записи сохраняются
+            stream_error = str(e)
+
+        if chunk:
+            yield from write(chunk)
+
+        elapsed = time.perf_counter() - started_at
+        yield line({'summary': {
+            'inserted_count': counts['ok'],
+            'failed_count': counts['error'],
+            'error': stream_error,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': int(counts['ok'] / elapsed) if elapsed > 0 else counts['ok']
+        }})
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/quick_add_schedule', methods=['POST'])
+def quick_add_schedule():
+    """Одна запись (JSON-объект) или пакет: JSON-массив либо NDJSON (application/x-ndjson).
+
+    Для пакета записи проверяются по отдельности и вставляются транзакциями по
+    IMPORT_BATCH_SIZE; ответ - NDJSON с результатом по индексу каждой записи
+    и итоговой строкой summary.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        # Буфер нужен для построчного чтения: request.stream читает строку по байту
+        return quick_add_batch(iter_quick_add_records(io.BufferedReader(request.stream), ndjson=True))
+
+    if request.is_json:
+        # Первый значимый символ тела отличает массив от одиночной записи
+        stream = io.BufferedReader(request.stream)
+        if stream.peek(64).lstrip()[:1] == b'[':
+            return quick_add_batch(iter_quick_add_records(stream, ndjson=False))
+
+        try:
+            data = json.load(stream)
+        except ValueError as e:
+            return jsonify({'message': f'Некорректный JSON: {str(e)}'}), 400
+    else:
+        # Получаем данные из запроса
+        data = request.get_json()
+
+    try:
+        values = quick_add_values(data)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    try:
+        # Создаем новую запись
+        new_item = Schedule(**values)
+
+        # Добавляем и сохраняем
+        db.session.add(new_item)
+        db.session.commit()
+
+        return jsonify({
+            'message': 'Запись успешно добавлена!',
+            'id': new_item.id
+        }), 201
+
+    except Exception as e:
+        # Откатываем транзакцию в случае ошибки
+        db.session.rollback()
+        return jsonify({
+            'message': f'Ошибка при добавлении записи: {str(e)}'
+        }), 500
+
+
+# Анализ файлов расписания
+# Потоковый разбор файлов расписания (windows-1251 JSON)
+class ScheduleFileError(ValueError):
+    """Файл расписания не является корректным JSON или имеет неверную структуру"""
+
+
+TimetableRecord = namedtuple('TimetableRecord', 'kind week group')
+
+
+class JSONTokenStream:
+    """Токенизатор JSON, читающий файл кусками фиксированного размера.
+
+    Файл декодируется инкрементально, поэтому в памяти одновременно находится
+    только текущий кусок. Одиночные обратные слеши внутри строк, не образующие
+    допустимую escape-последовательность, считаются обычными символами - так
+    выгружает расписание исходная система.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    TOKEN = re.compile(
+        r'\s*(?:(?P<string>"(?:[^"\\]|\\.)*")'
+        r'|(?P<punct>[{}\[\]:,])'
+        r'|(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'
+        r'|(?P<literal>true|false|null))',
+        re.S
+    )
+    # Допустимая escape-последовательность (группа 1) или одиночный обратный слеш
+    STRING_ESCAPE = re.compile(r'(\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})|\\')
+    LITERALS = {'true': True, 'false': False, 'null': None}
+
+    def __init__(self, stream, encoding='windows-1251'):
+        self._stream = stream
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        # Следующий токен: (вид, значение), где вид - символ пунктуации, 'string', 'value' или None в конце
+        self.next = self._iter_tokens().__next__
+
+    def _iter_tokens(self):
+        buffer = ''
+        offset = 0  # позиция начала буфера в файле, символов
+        eof = False
+        match_token = self.TOKEN.match
+        literals = self.LITERALS
+
+        while not eof:
+            chunk = self._stream.read(self.CHUNK_SIZE)
+            eof = not chunk
+            buffer += self._decoder.decode(chunk or b'', final=eof)
+            limit = len(buffer)
+            position = 0
+
+            while True:
+                match = match_token(buffer, position)
+                # Токен в самом конце буфера может быть обрезан границей куска - дочитываем
+                if match is None or (not eof and match.end() == limit):
+                    break
+                position = match.end()
+
+                string, punct, number, literal = match.groups()
+                if punct is not None:
+                    yield punct, None
+                elif string is not None:
+                    yield 'string', string[1:-1]
+                elif number is not None:
+                    yield 'value', float(number) if ('.' in number or 'e' in number or 'E' in number) else int(number)
+                else:
+                    yield 'value', literals[literal]
+
+            buffer = buffer[position:]
+            offset += position
+
+            # Не распознанным без дочитывания может быть только начало строки, числа или литерала
+            head = buffer.lstrip()[:1]
+            if head and (eof or (match is None and head not in '"-0123456789tfn')):
+                raise ScheduleFileError(f"Некорректный JSON в позиции {offset}: {buffer.strip()[:30]!r}")
+
+        while True:
+            yield None, None
+
+    def expect(self, expected):
+        kind, _ = self.next()
+        if kind != expected:
+            raise ScheduleFileError(f"Ожидался символ {expected!r}, получено {kind!r}")
+
+    @classmethod
+    def decode_string(cls, raw):
+        if '\\' not in raw:
+            return raw
+        repaired = cls.STRING_ESCAPE.sub(lambda match: match.group(1) or '\\\\', raw)
+        return json.loads('"' + repaired + '"', strict=False)
+
+    def iter_array(self):
+        """Перебирает элементы массива после '['; вызывающий обязан дочитать каждый элемент"""
+        token = self.next()
+        if token[0] == ']':
+            return
+        while True:
+            yield token
+            kind, _ = self.next()
+            if kind == ']':
+                return
+            if kind != ',':
+                raise ScheduleFileError(f"Ожидалась ',' или ']', получено {kind!r}")
+            token = self.next()
+
+    def iter_object(self):
+        """Перебирает пары (ключ, первый токен значения) после '{'"""
+        kind, raw = self.next()
+        if kind == '}':
+            return
+        while True:
+            if kind != 'string':
+                raise ScheduleFileError(f"Ожидался ключ объекта, получено {kind!r}")
+            self.expect(':')
+            yield self.decode_string(raw), self.next()
+            kind, _ = self.next()
+            if kind == '}':
+                return
+            if kind != ',':
+                raise ScheduleFileError(f"Ожидалась ',' или '}}', получено {kind!r}")
+            kind, raw = self.next()
+
+    def parse_value(self, token):
+        kind, value = token
+        if kind == '{':
+            return {key: self.parse_value(value_token) for key, value_token in self.iter_object()}
+        if kind == '[':
+            return [self.parse_value(item_token) for item_token in self.iter_array()]
+        if kind == 'string':
+            return self.decode_string(value)
+        if kind == 'value':
+            return value
+        if kind is None:
+            raise ScheduleFileError('Неожиданный конец файла')
+        raise ScheduleFileError(f"Неожиданный токен {kind!r}")
+
+    def skip_value(self, token):
+        """Пропускает значение, не создавая объектов"""
+        kind = token[0]
+        if kind in ('{', '['):
+            depth = 1
+            while depth:
+                kind = self.next()[0]
+                if kind in ('{', '['):
+                    depth += 1
+                elif kind in ('}', ']'):
+                    depth -= 1
+                elif kind is None:
+                    raise ScheduleFileError('Неожиданный конец файла')
+        elif kind not in ('string', 'value'):
+            raise ScheduleFileError(f"Неожиданный токен {kind!r}")
+
+
+def iter_timetable_records(stream):
+    """Разбирает файл расписания потоково.
+
+    Выдает TimetableRecord:
+      ('timetable', None, None) - в элементе массива найден ключ timetable;
+      ('group', неделя, группа) - группа со всеми днями и занятиями;
+      ('week', неделя, None) - неделя прочитана целиком.
+    Неделя - словарь ее полей кроме groups. Группы, встретившиеся в файле раньше
+    номера недели, придерживаются до конца объекта недели.
+    """
+    tokens = JSONTokenStream(stream)
+
+    if tokens.next()[0] != '[':
+        raise ScheduleFileError('Неверный формат данных (ожидается массив)')
+
+    for item_token in tokens.iter_array():
+        if item_token[0] != '{':
+            tokens.skip_value(item_token)
+            continue
+
+        for key, timetable_token in tokens.iter_object():
+            if key != 'timetable':
+                tokens.skip_value(timetable_token)
+                continue
+
+            yield TimetableRecord('timetable', None, None)
+            if timetable_token[0] != '[':
+                raise ScheduleFileError('Ключ "timetable" должен содержать массив недель')
+
+            for week_token in tokens.iter_array():
+                if week_token[0] != '{':
+                    raise ScheduleFileError('Неделя расписания должна быть объектом')
+
+                week = {}
+                held_groups = []
+                for week_key, value_token in tokens.iter_object():
+                    if week_key != 'groups' or value_token[0] != '[':
+                        week[week_key] = tokens.parse_value(value_token)
+                        continue
+
+                    for group_token in tokens.iter_array():
+                        if group_token[0] != '{':
+                            raise ScheduleFileError('Группа расписания должна быть объектом')
+
+                        group = tokens.parse_value(group_token)
+
+                        if 'week_number' in week:
+                            yield TimetableRecord('group', week, group)
+                        else:
+                            held_groups.append(group)
+
+                for group in held_groups:
+                    yield TimetableRecord('group', week, group)
+                yield TimetableRecord('week', week, None)
+
+    if tokens.next()[0] is not None:
+        raise ScheduleFileError('Лишние данные после конца массива')
+
+
+# Разбор файлов импорта в пуле процессов
+IMPORT_ROW_FIELDS = ('semester', 'week_number', 'group_name', 'course', 'faculty', 'subject', 'lesson_type',
+                     'subgroup', 'date', 'time_start', 'time_end', 'weekday', 'teacher_name', 'auditory')
+
+
+def schedule_rows_from_group(filename, semester, week_number, group_data):
+    """Строки занятий группы (кортежи в порядке IMPORT_ROW_FIELDS) и список проблемных пар"""
+    group_name = group_data.get('group_name')
+    course = group_data.get('course')
+    faculty = group_data.get('faculty')
+    rows = []
+    problems = []
+
+    # Обрабатываем дни и занятия
+    for day_data in group_data.get('days', []):
+        weekday = day_data.get('weekday')
+
+        for lesson in day_data.get('lessons', []):
+            try:
+                # Извлекаем данные о занятии
+                subject = lesson.get('subject')
+                lesson_type = lesson.get('type')
+                subgroup = lesson.get('subgroup', 0)
+                time_start = lesson.get('time_start')
+                time_end = lesson.get('time_end')
+
+                # Преобразуем дату из строки в объект Date
+                date_str = lesson.get('date')
+                if date_str:
+                    # Преобразуем формат даты из DD-MM-YYYY в YYYY-MM-DD
+                    try:
+                        day, month, year = date_str.split('-')
+                        date = datetime.strptime(f"{year}-{month}-{day}", '%Y-%m-%d').date()
+                    except (ValueError, TypeError) as e:
+                        # Сохраняем информацию о проблемной паре
+                        problems.append({
+                            'file': filename,
+                            'week': week_number,
+                            'group': group_name,
+                            'subject': subject,
+                            'date': date_str,
+                            'error': f'Ошибка формата даты: {str(e)}',
+                            'raw_data': lesson
+                        })
+                        continue
+                else:
+                    # Если даты нет, это проблема
+                    problems.append({
+                        'file': filename,
+                        'week': week_number,
+                        'group': group_name,
+                        'subject': subject,
+                        'error': 'Отсутствует дата занятия',
+                        'raw_data': lesson
                     })
+                    continue
 
-            # Check for group conflicts
-            if lesson1.group_name:
-                group_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson1_id,
-                    Schedule.id != lesson2_id,
-                    Schedule.date == lesson2.date,
-                    Schedule.group_name == lesson1.group_name,
-                    # Check for time overlap
-                    ((Schedule.time_start <= lesson2.time_start) & (Schedule.time_end > lesson2.time_start)) |
-                    ((Schedule.time_start < lesson2.time_end) & (Schedule.time_end >= lesson2.time_end)) |
-                    ((Schedule.time_start >= lesson2.time_start) & (Schedule.time_end <= lesson2.time_end))
-                ).all()
+                # Получаем имя преподавателя и аудиторию
+                teacher_name = ""
+                auditory = ""
+
+                if 'teachers' in lesson and lesson['teachers']:
+                    teacher_name = lesson['teachers'][0].get('teacher_name', '')
+
+                if 'auditories' in lesson and lesson['auditories']:
+                    auditory = lesson['auditories'][0].get('auditory_name', '')
+
+                # Проверка обязательных полей
+                if not all([subject, time_start, time_end, weekday is not None]):
+                    problems.append({
+                        'file': filename,
+                        'week': week_number,
+                        'group': group_name,
+                        'subject': subject,
+                        'date': date_str,
+                        'error': 'Отсутствуют обязательные поля (предмет, время начала/окончания, день недели)',
+                        'raw_data': lesson
+                    })
+                    continue
+
+                # Значения новой записи в порядке IMPORT_ROW_FIELDS
+                row = (semester, week_number, group_name, course, faculty or '', subject or '', lesson_type or '',
+                       subgroup or 0, date, time_start or '', time_end or '', weekday or 0, teacher_name, auditory)
+            except Exception as e:
+                # Сохраняем подробную информацию о проблеме
+                problems.append({
+                    'file': filename,
+                    'week': week_number,
+                    'group': group_name,
+                    'subject': lesson.get('subject', 'Неизвестно'),
+                    'date': lesson.get('date', 'Неизвестно'),
+                    'time': f"{lesson.get('time_start', 'Н/Д')}-{lesson.get('time_end', 'Н/Д')}",
+                    'error': str(e),
+                    'raw_data': lesson
+                })
+                continue
+
+            rows.append(row)
+
+    return rows, problems
+
+
+def parse_timetable_file(path, filename, semester, rows_path, selected_weeks=None):
+    """Разбирает файл для анализа и импорта за один проход; выполняется в процессе пула.
+
+    Группы пишутся в rows_path последовательностью pickle-записей
+    (неделя, группа, строки, проблемные пары), чтобы не передавать их между
+    процессами и не держать в памяти весь файл. Если selected_weeks задан,
+    строки сохраняются только для этих недель. Файл с ошибкой разбора
+    не дает ни строк, ни сводки по неделям.
+    """
+    result = {'file': filename, 'rows_path': None, 'weeks': [], 'problems': [], 'has_timetable': False,
+              'error': None}
+
+    # Счетчики занятий текущего объекта недели: всего и по группам
+    lessons_count = 0
+    group_lessons = {}
 
-                for c in group_conflicts:
-                    conflicts_for_lesson1.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'auditory': c.auditory,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'group',
-                        'conflict_value': lesson1.group_name
-                    })
+    try:
+        with open(path, 'rb') as stream, open(rows_path, 'wb') as output:
+            for record in iter_timetable_records(stream):
+                if record.kind == 'timetable':
+                    result['has_timetable'] = True
+
+                elif record.kind == 'group':
+                    group_data = record.group
+                    group_name = group_data.get('group_name')
+
+                    # Подсчет занятий; повторное вхождение группы заменяет прежнее, как при импорте
+                    group_count = sum(len(day_data.get('lessons', [])) for day_data in group_data.get('days', []))
+                    lessons_count += group_count
+                    if group_name:
+                        group_lessons[group_name] = group_count
+
+                    week_number = record.week.get('week_number')
+                    if week_number is None or (selected_weeks is not None and week_number not in selected_weeks):
+                        continue
+                    if not group_name or group_data.get('course') is None:
+                        continue
 
-            if conflicts_for_lesson1:
-                conflicts.append({
-                    'lesson_id': lesson1_id,
-                    'subject': lesson1.subject,
-                    'conflicts': conflicts_for_lesson1
-                })
+                    rows, problems = schedule_rows_from_group(filename, semester, week_number, group_data)
+                    pickle.dump((week_number, group_name, rows, problems), output, pickle.HIGHEST_PROTOCOL)
 
-            # Check conflicts for lesson2 going to lesson1's slot
-            conflicts_for_lesson2 = []
-
-            # Check for auditory conflicts
-            if lesson2.auditory:
-                auditory_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson1_id,
-                    Schedule.id != lesson2_id,
-                    Schedule.date == lesson1.date,
-                    Schedule.auditory == lesson2.auditory,
-                    # Check for time overlap
-                    ((Schedule.time_start <= lesson1.time_start) & (Schedule.time_end > lesson1.time_start)) |
-                    ((Schedule.time_start < lesson1.time_end) & (Schedule.time_end >= lesson1.time_end)) |
-                    ((Schedule.time_start >= lesson1.time_start) & (Schedule.time_end <= lesson1.time_end))
-                ).all()
+                elif record.kind == 'week':
+                    week = record.week
+                    if week.get('week_number') is None:
+                        result['problems'].append({
+                            'file': filename,
+                            'error': 'Отсутствует номер недели в данных',
+                            'week_data': week
+                        })
+                    else:
+                        result['weeks'].append({
+                            'week_number': week['week_number'],
+                            'date_start': week.get('date_start'),
+                            'date_end': week.get('date_end'),
+                            'lessons_count': lessons_count,
+                            'groups_count': len(group_lessons),
+                            'groups': group_lessons
+                        })
 
-                for c in auditory_conflicts:
-                    conflicts_for_lesson2.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'auditory': c.auditory,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'auditory',
-                        'conflict_value': lesson2.auditory
-                    })
+                    lessons_count = 0
+                    group_lessons = {}
+    except Exception as e:
+        # Частично записанные строки файла не используются
+        if os.path.exists(rows_path):
+            os.remove(rows_path)
+        return {'file': filename, 'rows_path': None, 'weeks': [], 'problems': [], 'has_timetable': False,
+                'error': str(e)}
 
-            # Check for teacher conflicts
-            if lesson2.teacher_name:
-                teacher_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson1_id,
-                    Schedule.id != lesson2_id,
-                    Schedule.date == lesson1.date,
-                    Schedule.teacher_name == lesson2.teacher_name,
-                    # Check for time overlap
-                    ((Schedule.time_start <= lesson1.time_start) & (Schedule.time_end > lesson1.time_start)) |
-                    ((Schedule.time_start < lesson1.time_end) & (Schedule.time_end >= lesson1.time_end)) |
-                    ((Schedule.time_start >= lesson1.time_start) & (Schedule.time_end <= lesson1.time_end))
-                ).all()
+    result['rows_path'] = rows_path
+    return result
 
-                for c in teacher_conflicts:
-                    conflicts_for_lesson2.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'auditory': c.auditory,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'teacher',
-                        'conflict_value': lesson2.teacher_name
-                    })
 
-            # Check for group conflicts
-            if lesson2.group_name:
-                group_conflicts = Schedule.query.filter(
-                    Schedule.id != lesson1_id,
-                    Schedule.id != lesson2_id,
-                    Schedule.date == lesson1.date,
-                    Schedule.group_name == lesson2.group_name,
-                    # Check for time overlap
-                    ((Schedule.time_start <= lesson1.time_start) & (Schedule.time_end > lesson1.time_start)) |
-                    ((Schedule.time_start < lesson1.time_end) & (Schedule.time_end >= lesson1.time_end)) |
-                    ((Schedule.time_start >= lesson1.time_start) & (Schedule.time_end <= lesson1.time_end))
-                ).all()
+def iter_upload_groups(rows_path):
+    """Читает записи (неделя, группа, строки, проблемные пары), сохраненные parse_timetable_file"""
+    with open(rows_path, 'rb') as stream:
+        while True:
+            try:
+                yield pickle.load(stream)
+            except EOFError:
+                return
 
-                for c in group_conflicts:
-                    conflicts_for_lesson2.append({
-                        'id': c.id,
-                        'subject': c.subject,
-                        'group_name': c.group_name,
-                        'teacher_name': c.teacher_name,
-                        'auditory': c.auditory,
-                        'time_start': c.time_start,
-                        'time_end': c.time_end,
-                        'conflict_type': 'group',
-                        'conflict_value': lesson2.group_name
-                    })
 
-            if conflicts_for_lesson2:
-                conflicts.append({
-                    'lesson_id': lesson2_id,
-                    'subject': lesson2.subject,
-                    'conflicts': conflicts_for_lesson2
-                })
+def save_uploaded_files(files, directory):
+    """Сохраняет загруженные файлы в каталог: процессы пула читают их с диска"""
+    saved = []
+    for index, file in enumerate(files):
+        path = os.path.join(directory, f"{index}.json")
+        file.save(path)
+        saved.append((path, file.filename))
+    return saved
 
-            if conflicts:
-                return jsonify({
-                    'message': 'Обнаружены конфликты при обмене занятиями',
-                    'conflicts': conflicts
-                }), 409
 
-        # Perform the swap of time and location information
-        lesson1.date = lesson2_date
-        lesson1.weekday = lesson2_weekday
-        lesson1.time_start = lesson2_time_start
-        lesson1.time_end = lesson2_time_end
+class ImportStaging:
+    """Файлы, разобранные при анализе и ожидающие импорта.
 
-        lesson2.date = lesson1_date
-        lesson2.weekday = lesson1_weekday
-        lesson2.time_start = lesson1_time_start
-        lesson2.time_end = lesson1_time_end
+    Каждая подготовка - каталог <root>/<токен> с файлами строк
+    parse_timetable_file и manifest.json. Данные лежат на диске, поэтому токен
+    действителен в любом процессе сервера; каталоги старше ttl секунд удаляются.
+    """
 
-        # Also swap locations if requested
-        if data.get('swap_locations', False):
-            lesson1.auditory = lesson2_auditory
-            lesson2.auditory = lesson1_auditory
+    TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+    MANIFEST = 'manifest.json'
 
-        # Commit changes
-        db.session.commit()
+    def __init__(self, root, ttl):
+        self.root = root
+        self.ttl = ttl
 
-        return jsonify({
-            'message': 'Занятия успешно поменяны местами',
-            'lesson1': lesson1.to_dict(),
-            'lesson2': lesson2.to_dict()
-        }), 200
+    def _directory(self, token):
+        if not token or not self.TOKEN_PATTERN.match(token):
+            return None
+        return os.path.join(self.root, token)
 
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'message': f'Ошибка при обмене занятиями: {str(e)}'}), 500
+    def _expired(self, directory):
+        try:
+            return time.time() - os.path.getmtime(directory) > self.ttl
+        except OSError:
+            return True
+
+    def create(self):
+        """Новый каталог подготовки: (токен, путь)"""
+        self.purge_expired()
+        token = secrets.token_hex(16)
+        directory = os.path.join(self.root, token)
+        os.makedirs(directory)
+        return token, directory
+
+    def save_manifest(self, token, semester, files):
+        """Фиксирует подготовку; files - [{'file', 'error', 'rows_file'}] в порядке загрузки"""
+        with open(os.path.join(self._directory(token), self.MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump({'semester': semester, 'files': files}, f, ensure_ascii=False)
+
+    def load(self, token):
+        """Манифест подготовки с путем каталога или None, если токен неизвестен или устарел"""
+        directory = self._directory(token)
+        if directory is None:
+            return None
+
+        manifest_path = os.path.join(directory, self.MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        if self._expired(directory):
+            self.discard(token)
+            return None
+
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['directory'] = directory
+        return manifest
+
+    def discard(self, token):
+        directory = self._directory(token)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def purge_expired(self):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if self.TOKEN_PATTERN.match(name) and self._expired(directory):
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+import_staging = ImportStaging(app.config['IMPORT_STAGING_DIR'], app.config['IMPORT_STAGING_TTL'])
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def run_in_process_pool(func, jobs):
+    """Выполняет func(*job) для каждого задания в пуле процессов (IMPORT_WORKERS).
+
+    Результаты выдаются в порядке заданий, так что запись в БД и ответ
+    остаются последовательными в потоке запроса.
+    """
+    global _process_pool
+
+    workers = app.config['IMPORT_WORKERS']
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield func(*job)
+        return
+
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: дочерние процессы не наследуют соединения с БД и потоки сервера
+            _process_pool = ProcessPoolExecutor(max_workers=workers,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        executor = _process_pool
+
+    futures = [executor.submit(func, *job) for job in jobs]
+    try:
+        for future in futures:
+            yield future.result()
+    except BrokenProcessPool:
+        with _process_pool_lock:
+            if _process_pool is executor:
+                _process_pool = None
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+# Запись разобранных файлов в БД
+class ImportCancelled(Exception):
+    """Фоновый импорт отменен до фиксации транзакции"""
+
+
+def staged_import_files(manifest):
+    """Результаты разбора из манифеста подготовки в формате parse_timetable_file"""
+    return [
+        {'file': item['file'], 'error': item['error'],
+         'rows_path': item['rows_file'] and os.path.join(manifest['directory'], item['rows_file'])}
+        for item in manifest['files']
+    ]
 
 
-@app.route('/api/schedule/conflicts', methods=['POST'])
-@token_required
-def get_conflicts(current_user):
-    """Get detailed information about all conflicts for a specific time slot"""
-    data = request.get_json()
+def parse_import_files(saved_files, semester, selected_weeks):
+    """Разбирает сохраненные файлы в пуле процессов; результаты выдаются в порядке файлов"""
+    jobs = [(path, filename, semester, path + '.rows', selected_weeks) for path, filename in saved_files]
+    return run_in_process_pool(parse_timetable_file, jobs)
 
-    # Required parameters
-    date = data.get('date')
-    time_start = data.get('time_start')
-    time_end = data.get('time_end')
 
-    if not all([date, time_start, time_end]):
-        return jsonify({'message': 'Missing required parameters'}), 400
+def import_parsed_files(semester, selected_weeks, parsed_files, user_id=None, job=None):
+    """Записывает выбранные недели разобранных файлов одной транзакцией и возвращает итог импорта.
 
-    try:
-        # Convert string date to Date object if needed
-        if isinstance(date, str):
-            try:
-                date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            except ValueError:
-                return jsonify({'message': 'Неверный формат даты. Используйте YYYY-MM-DD.'}), 400
+    Проблемные пары сохраняются в той же транзакции как ImportRun/ImportProblem.
+    Если передан job (ImportJob), в него пишется прогресс, а отмена прерывает
+    импорт исключением ImportCancelled до фиксации. Откат при ошибке выполняет
+    вызывающий.
+    """
+    # Статистика импорта
+    imported_count = 0
+    failed_count = 0
+    files_count = 0
+    processed_groups = set()
+
+    # Список для хранения проблемных пар
+    problem_lessons = []
+
+    # Занятия записываются пачками после разбора; в БД попадают только отличия
+    writer = ScheduleBulkWriter()
+
+    for result in parsed_files:
+        files_count += 1
+        if job is not None:
+            job.update(phase='writing')
+
+        if result['error'] is not None:
+            # Сохраняем ошибку обработки файла
+            problem_lessons.append({
+                'file': result['file'],
+                'error': f"Ошибка обработки файла: {result['error']}",
+                'is_file_error': True
+            })
         else:
-            date_obj = date
+            for week_number, group_name, rows, problems in iter_upload_groups(result['rows_path']):
+                # Пропускаем недели, которые не были выбраны
+                if week_number not in selected_weeks:
+                    continue
 
-        # Find all lessons at the given time slot
-        lessons = Schedule.query.filter(
-            Schedule.date == date_obj,
-            Schedule.time_start == time_start,
-            Schedule.time_end == time_end
-        ).all()
+                if job is not None:
+                    job.check_cancelled()
 
-        # Group lessons by conflict type
-        teacher_conflicts = {}
-        auditory_conflicts = {}
-        group_conflicts = {}
+                processed_groups.add(group_name)
+                problem_lessons.extend(problems)
+                failed_count += len(problems)
 
-        for lesson in lessons:
-            # Group by teacher
-            if lesson.teacher_name:
-                if lesson.teacher_name not in teacher_conflicts:
-                    teacher_conflicts[lesson.teacher_name] = []
-                teacher_conflicts[lesson.teacher_name].append(lesson.to_dict())
-
-            # Group by auditory
-            if lesson.auditory:
-                if lesson.auditory not in auditory_conflicts:
-                    auditory_conflicts[lesson.auditory] = []
-                auditory_conflicts[lesson.auditory].append(lesson.to_dict())
-
-            # Group by group
-            if lesson.group_name:
-                if lesson.group_name not in group_conflicts:
-                    group_conflicts[lesson.group_name] = []
-                group_conflicts[lesson.group_name].append(lesson.to_dict())
+                # Занятия группы на этой неделе заменяются новыми (с записью только изменений)
+                writer.replace_group_week(semester, week_number, group_name)
 
-        # Find actual conflicts (where there are multiple lessons for the same resource)
-        actual_teacher_conflicts = {teacher: lessons for teacher, lessons in teacher_conflicts.items() if
-                                    len(lessons) > 1}
-        actual_auditory_conflicts = {auditory: lessons for auditory, lessons in auditory_conflicts.items() if
-                                     len(lessons) > 1}
-        actual_group_conflicts = {group: lessons for group, lessons in group_conflicts.items() if len(lessons) > 1}
+                for row in rows:
+                    writer.add(**dict(zip(IMPORT_ROW_FIELDS, row)))
+                    imported_count += 1
 
-        return jsonify({
-            'date': date,
-            'time_start': time_start,
-            'time_end': time_end,
-            'teacher_conflicts': actual_teacher_conflicts,
-            'auditory_conflicts': actual_auditory_conflicts,
-            'group_conflicts': actual_group_conflicts,
-            'all_lessons': [lesson.to_dict() for lesson in lessons]
-        }), 200
+                if job is not None:
+                    job.update(rows_processed=imported_count, groups_processed=len(processed_groups),
+                               problems_count=len(problem_lessons))
 
-    except Exception as e:
-        return jsonify({'message': f'Ошибка при получении конфликтов: {str(e)}'}), 500
+        if job is not None:
+            job.update(files_processed=job.files_processed + 1, problems_count=len(problem_lessons))
 
-# Быстрое добавление записи в расписание БЕЗ авторизации
-@app.route('/api/quick_add_schedule', methods=['POST'])
-def quick_add_schedule():
-    # Получаем данные из запроса
-    data = request.get_json()
+    # Записываем остаток пачки и проблемные пары, сохраняем изменения в БД
+    writer.flush()
+    run = save_import_run('upload', user_id, semester, problem_lessons, files_count=files_count,
+                          imported_count=imported_count, failed_count=failed_count)
+    if job is not None:
+        job.check_cancelled()
+        job.update(phase='committing')
+    db.session.commit()
+    write_stats = writer.stats()
 
-    # Обязательные проверки
-    required_fields = [
-        'semester', 'week_number', 'group_name', 'course',
-        'subject', 'date', 'time_start', 'time_end', 'weekday'
-    ]
+    return {
+        'message': f'Импорт завершен. Загружено: {imported_count} (новых: {writer.inserted_count}, '
+                   f'изменено: {writer.updated_count}, без изменений: {writer.unchanged_count}, '
+                   f'удалено: {writer.deleted_count}), не удалось импортировать: {failed_count} занятий.',
+        'imported_count': imported_count,
+        'inserted_count': writer.inserted_count,
+        'updated_count': writer.updated_count,
+        'deleted_count': writer.deleted_count,
+        'unchanged_count': writer.unchanged_count,
+        'failed_count': failed_count,
+        'processed_groups': len(processed_groups),
+        'week_changes': write_stats['weeks'],
+        # Сами проблемные пары - постранично через /api/import_runs/<id>/problems
+        'import_run_id': run.id,
+        'problem_lessons_count': len(problem_lessons),
+        'problems_summary': import_problems_summary(problem_lessons),
+        'write_stats': write_stats
+    }
+
+
+# Проблемы импорта хранятся в БД (ImportRun/ImportProblem), в ответ попадают только сводные счетчики
+def _problem_text(value, limit=None):
+    if value is None or value == '':
+        return None
+    value = str(value)
+    return value[:limit] if limit else value
+
+
+def import_problem_row(run_id, problem):
+    """Строка import_problem из словаря проблемы, сформированного при разборе"""
+    week_number = problem.get('week')
+    raw_data = problem.get('raw_data', problem.get('week_data'))
+    return {
+        'run_id': run_id,
+        'file': _problem_text(problem.get('file'), 256),
+        'week_number': week_number if isinstance(week_number, int) else None,
+        'group_name': _problem_text(problem.get('group'), 100),
+        'subject': _problem_text(problem.get('subject')),
+        'date': _problem_text(problem.get('date'), 50),
+        'time': _problem_text(problem.get('time'), 50),
+        'error': str(problem.get('error') or 'Неизвестная ошибка'),
+        'is_file_error': bool(problem.get('is_file_error')),
+        'raw_data': json.dumps(raw_data, ensure_ascii=False, default=str) if raw_data is not None else None
+    }
+
+
+def save_import_run(kind, user_id, semester, problems, **counts):
+    """Создает ImportRun и пачками записывает его проблемы; фиксирует транзакцию вызывающий"""
+    run = ImportRun(kind=kind, user_id=user_id, semester=semester, problems_count=len(problems), **counts)
+    db.session.add(run)
+    db.session.flush()
+
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    table = ImportProblem.__table__
+    for start in range(0, len(problems), batch_size):
+        db.session.execute(table.insert(), [import_problem_row(run.id, problem)
+                                            for problem in problems[start:start + batch_size]])
+    return run
+
+
+def import_problems_summary(problems):
+    """Число проблем по файлам и по группам с видами ошибок (текст до двоеточия)"""
+    by_file = Counter(problem.get('file') for problem in problems)
+    by_group = {}
+    for problem in problems:
+        if problem.get('is_file_error'):
+            continue
+        group = by_group.setdefault(problem.get('group') or 'Не указана', {'count': 0, 'errors': []})
+        group['count'] += 1
+        error_type = str(problem.get('error') or 'Неизвестная ошибка').split(':', 1)[0]
+        if error_type not in group['errors']:
+            group['errors'].append(error_type)
+
+    return {
+        'by_file': [{'file': file, 'count': count} for file, count in by_file.most_common()],
+        'by_group': [{'group': group, **data} for group, data in
+                     sorted(by_group.items(), key=lambda item: -item[1]['count'])]
+    }
+
+
+# Фоновые задачи импорта
+class ImportJob:
+    """Импорт, выполняемый в фоне: исходные данные, состояние и прогресс.
+
+    Источник - либо токен анализа (import_token), либо файлы, сохраненные
+    в upload_dir (saved_files: [(путь, имя файла)]).
+    """
+
+    FINISHED = ('done', 'failed', 'cancelled')
+
+    def __init__(self, user_id, semester, selected_weeks, files_total, import_token=None,
+                 upload_dir=None, saved_files=None):
+        self.id = secrets.token_hex(16)
+        self.user_id = user_id
+        self.semester = semester
+        self.selected_weeks = selected_weeks
+        self.import_token = import_token
+        self.upload_dir = upload_dir
+        self.saved_files = saved_files
+
+        self.status = 'queued'
+        self.phase = 'queued'
+        self.files_total = files_total
+        self.files_processed = 0
+        self.groups_processed = 0
+        self.rows_processed = 0
+        self.problems_count = 0
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def start(self):
+        self.update(status='running', phase='parsing', started_at=time.time())
+
+    def finish(self, status, result=None, error=None):
+        self.update(status=status, phase=status, result=result, error=error, finished_at=time.time())
+
+    def cancel(self):
+        """Запрашивает отмену; возвращает False, если задача уже завершена"""
+        with self._lock:
+            if self.status in self.FINISHED:
+                return False
+            self._cancel.set()
+            return True
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise ImportCancelled()
 
-    for field in required_fields:
-        if field not in data or not data[field]:
-            return jsonify({'message': f'Поле {field} обязательно для заполнения!'}), 400
+    def to_dict(self):
+        with self._lock:
+            finished_at = self.finished_at or time.time()
+            elapsed = finished_at - self.started_at if self.started_at else 0.0
+            return {
+                'id': self.id,
+                'status': self.status,
+                'phase': self.phase,
+                'semester': self.semester,
+                'weeks': self.selected_weeks,
+                'files_total': self.files_total,
+                'files_processed': self.files_processed,
+                'groups_processed': self.groups_processed,
+                'rows_processed': self.rows_processed,
+                'rows_per_second': int(self.rows_processed / elapsed) if elapsed else 0,
+                'problems_count': self.problems_count,
+                'elapsed_seconds': round(elapsed, 3),
+                'cancel_requested': self._cancel.is_set(),
+                'error': self.error,
+                'result': self.result,
+                'created_at': datetime.fromtimestamp(self.created_at).strftime('%Y-%m-%d %H:%M:%S')
+            }
 
-    try:
-        # Пытаемся распарсить дату
+
+def run_import_job(job):
+    """Выполняет задачу импорта; транзакция фиксируется целиком или откатывается"""
+    with app.app_context():
+        job.start()
         try:
-            if isinstance(data['date'], str):
-                # Попытка распарсить строку
-                date_obj = datetime.strptime(data['date'], '%Y-%m-%d').date()
-            elif isinstance(data['date'], (int, float)):
-                # Если передан timestamp
-                date_obj = datetime.fromtimestamp(data['date'] / 1000).date()
+            if job.import_token:
+                manifest = import_staging.load(job.import_token)
+                if manifest is None:
+                    raise ValueError('Результаты анализа устарели. Загрузите файлы повторно.')
+                parsed_files = staged_import_files(manifest)
             else:
-                return jsonify({'message': 'Неверный формат даты'}), 400
+                parsed_files = parse_import_files(job.saved_files, job.semester, job.selected_weeks)
+
+            result = import_parsed_files(job.semester, job.selected_weeks, parsed_files, job.user_id, job)
+            if job.import_token:
+                import_staging.discard(job.import_token)
+            job.finish('done', result=result)
+        except ImportCancelled:
+            db.session.rollback()
+            job.finish('cancelled')
         except Exception as e:
-            return jsonify({'message': f'Ошибка парсинга даты: {str(e)}'}), 400
-
-        # Создаем новую запись
-        new_item = Schedule(
-            semester=data['semester'],
-            week_number=data['week_number'],
-            group_name=data['group_name'],
-            course=data['course'],
-            faculty=data.get('faculty', ''),
-            subject=data['subject'],
-            lesson_type=data.get('lesson_type', ''),
-            subgroup=data.get('subgroup', 0),
-            date=date_obj,
-            time_start=data['time_start'],
-            time_end=data['time_end'],
-            weekday=data['weekday'],
-            teacher_name=data.get('teacher_name', ''),
-            auditory=data.get('auditory', '')
-        )
-
-        # Добавляем и сохраняем
-        db.session.add(new_item)
-        db.session.commit()
+            db.session.rollback()
+            job.finish('failed', error=str(e))
+        finally:
+            if job.upload_dir is not None:
+                shutil.rmtree(job.upload_dir, ignore_errors=True)
+            db.session.remove()
+
+
+class ImportJobQueue:
+    """Очередь фоновых импортов, выполняемых локальными потоками.
+
+    Потоки запускаются при первой задаче; завершенные задачи хранятся
+    keep_seconds секунд, чтобы клиент успел забрать результат.
+    """
+
+    def __init__(self, workers, keep_seconds):
+        self.workers = workers
+        self.keep_seconds = keep_seconds
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"import-job-{len(self._threads) + 1}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.keep_seconds:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job.cancel_requested:
+                    # Отменена, пока ждала в очереди
+                    if job.upload_dir is not None:
+                        shutil.rmtree(job.upload_dir, ignore_errors=True)
+                    job.finish('cancelled')
+                else:
+                    run_import_job(job)
+            finally:
+                self._queue.task_done()
 
-        return jsonify({
-            'message': 'Запись успешно добавлена!',
-            'id': new_item.id
-        }), 201
 
-    except Exception as e:
-        # Откатываем транзакцию в случае ошибки
-        db.session.rollback()
-        return jsonify({
-            'message': f'Ошибка при добавлении записи: {str(e)}'
-        }), 500
+import_jobs = ImportJobQueue(app.config['IMPORT_JOB_WORKERS'], app.config['IMPORT_JOB_KEEP_SECONDS'])
 
 
-# Анализ файлов расписания
 @app.route('/api/schedule/analyze', methods=['POST'])
 @token_required
 def analyze_schedule_files(current_user):
@@ -2248,144 +4803,121 @@ def analyze_schedule_files(current_user):
         total_lessons = 0
         problem_files = []  # Список для хранения информации о проблемных файлах
 
-        # Обрабатываем каждый файл
-        for file in files:
-            try:
-                # Читаем файл с учетом кодировки Windows-1251
-                content = file.read().decode('windows-1251')
-
-                # Исправляем проблемы с экранированием символов
-                import re
-
-                # Экранируем обратные слеши внутри строк
-                def fix_backslashes(match):
-                    content = match.group(0)
-                    # Заменяем одиночные \ на \\, но только если они не экранируют специальные символы
-                    return re.sub(r'\\(?!["\\/bfnrt])', r'\\\\', content)
-
-                # Ищем все строковые литералы в JSON и фиксируем в них обратные слеши
-                fixed_content = re.sub(r'"[^"\\]*(?:\\.[^"\\]*)*"', fix_backslashes, content)
-
-                # Парсим JSON
-                data = json.loads(fixed_content)
-
-                # Проверяем формат данных
-                if not isinstance(data, list):
-                    problem_files.append({
-                        'file': file.filename,
-                        'error': 'Неверный формат данных (ожидается массив)'
-                    })
-                    continue
-
-                file_has_timetable = False
-
-                # Обрабатываем каждый объект в массиве данных
-                for item in data:
-                    if 'timetable' not in item:
-                        continue
-
-                    file_has_timetable = True
-                    timetable = item['timetable']
-
-                    # Собираем информацию о неделях
-                    for week_data in timetable:
-                        week_number = week_data.get('week_number')
-                        date_start = week_data.get('date_start')
-                        date_end = week_data.get('date_end')
-
-                        if week_number is None:
-                            problem_files.append({
-                                'file': file.filename,
-                                'error': 'Отсутствует номер недели в данных',
-                                'week_data': week_data
-                            })
-                            continue
-
-                        # Счетчики занятий и групп
-                        lessons_count = 0
-                        groups_set = set()
-
-                        # Обрабатываем группы и занятия
-                        for group_data in week_data.get('groups', []):
-                            group_name = group_data.get('group_name')
-                            if group_name:
-                                groups_set.add(group_name)
-
-                            # Подсчет занятий
-                            for day_data in group_data.get('days', []):
-                                lessons_count += len(day_data.get('lessons', []))
-
-                        # Проверяем, существуют ли занятия для этой недели в БД
-                        existing_lessons = Schedule.query.filter_by(
-                            semester=semester,
-                            week_number=week_number
-                        ).count()
-
-                        status = 'new' if existing_lessons == 0 else 'exists'
-
-                        # Сохраняем информацию о неделе
-                        if week_number not in weeks_info:
-                            weeks_info[week_number] = {
-                                'week_number': week_number,
-                                'date_start': date_start,
-                                'date_end': date_end,
-                                'lessons_count': lessons_count,
-                                'groups_count': len(groups_set),
-                                'status': status
-                            }
-                        else:
-                            # Обновляем счетчики, если неделя уже встречалась
-                            weeks_info[week_number]['lessons_count'] += lessons_count
-                            weeks_info[week_number]['groups_count'] += len(groups_set)
-
-                        total_lessons += lessons_count
-
-                # Проверяем, содержал ли файл вообще таблицу расписания
-                if not file_has_timetable:
-                    problem_files.append({
-                        'file': file.filename,
-                        'error': 'Файл не содержит данных о расписании (отсутствует ключ "timetable")'
-                    })
+        # Добавляет сведения об объекте недели; повторная встреча номера недели суммирует занятия,
+        # а для группы, как и при импорте, действует последнее вхождение
+        def add_week_info(target, week):
+            week_number = week['week_number']
+            if week_number not in target:
+                target[week_number] = {
+                    'week_number': week_number,
+                    'date_start': week.get('date_start'),
+                    'date_end': week.get('date_end'),
+                    'lessons_count': 0,
+                    'groups': {}
+                }
+            target[week_number]['lessons_count'] += week['lessons_count']
+            target[week_number]['groups'].update(week['groups'])
 
-            except Exception as e:
+        # Файлы разбираются параллельно в пуле процессов, результаты - в порядке файлов.
+        # Строки сохраняются в каталог подготовки, чтобы импорт не передавал и не разбирал файлы повторно
+        import_token, staging_dir = import_staging.create()
+        try:
+            jobs = [(path, filename, semester, os.path.join(staging_dir, f"{index}.rows"))
+                    for index, (path, filename) in enumerate(save_uploaded_files(files, staging_dir))]
+            results = list(run_in_process_pool(parse_timetable_file, jobs))
+            for path, _, _, _ in jobs:
+                os.remove(path)
+        except Exception:
+            import_staging.discard(import_token)
+            raise
+
+        import_staging.save_manifest(import_token, semester, [
+            {'file': result['file'], 'error': result['error'],
+             'rows_file': result['rows_path'] and os.path.basename(result['rows_path'])}
+            for result in results
+        ])
+
+        for result in results:
+            if result['error'] is not None:
                 # Логируем ошибку для каждого файла и добавляем в список проблемных файлов
-                print(f"Ошибка обработки файла {file.filename}: {str(e)}")
+                print(f"Ошибка обработки файла {result['file']}: {result['error']}")
                 problem_files.append({
-                    'file': file.filename,
-                    'error': f"Ошибка обработки файла: {str(e)}"
+                    'file': result['file'],
+                    'error': f"Ошибка обработки файла: {result['error']}"
                 })
                 continue
 
+            problem_files.extend(result['problems'])
+
+            # Проверяем, содержал ли файл вообще таблицу расписания
+            if not result['has_timetable']:
+                problem_files.append({
+                    'file': result['file'],
+                    'error': 'Файл не содержит данных о расписании (отсутствует ключ "timetable")'
+                })
+
+            for week in result['weeks']:
+                add_week_info(weeks_info, week)
+                total_lessons += week['lessons_count']
+
+        # Занятия в БД по неделям и группам - одним запросом для всех недель
+        existing_counts = {}
+        if weeks_info:
+            rows = db.session.query(
+                Schedule.week_number, Schedule.group_name, db.func.count(Schedule.id)
+            ).filter(
+                Schedule.semester == semester,
+                Schedule.week_number.in_(list(weeks_info))
+            ).group_by(Schedule.week_number, Schedule.group_name).all()
+            for week_number, group_name, count in rows:
+                existing_counts.setdefault(week_number, {})[group_name] = count
+
+        # Статус недели (есть ли ее занятия в БД) и сравнение числа занятий по группам
+        for week_number, info in weeks_info.items():
+            existing = existing_counts.get(week_number, {})
+            incoming = info.pop('groups')
+            info['groups_count'] = len(incoming)
+            info['existing_lessons_count'] = sum(existing.values())
+            info['status'] = 'exists' if existing else 'new'
+            info['groups'] = [
+                {'group_name': group_name, 'incoming_count': count, 'existing_count': existing.get(group_name, 0)}
+                for group_name, count in sorted(incoming.items())
+            ]
+
         # Преобразуем словарь в список для ответа
         weeks_list = list(weeks_info.values())
 
         # Сортируем недели по номеру
         weeks_list.sort(key=lambda x: x['week_number'])
 
+        # Сохраняем информацию о проблемных файлах в журнал импорта; в ответе - без исходных данных недели
+        run = save_import_run('analyze', current_user.id, semester, problem_files, files_count=len(files))
+        db.session.commit()
+        problem_files = [{key: value for key, value in problem.items() if key != 'week_data'}
+                         for problem in problem_files]
+
         if not weeks_list:
+            import_staging.discard(import_token)
             return jsonify({
                 'message': 'Не удалось извлечь данные о неделях из загруженных файлов. Проверьте формат файлов.',
+                'import_run_id': run.id,
                 'problem_files': problem_files,
                 'problem_files_count': len(problem_files)
             }), 400
 
-        # Сохраняем информацию о проблемных файлах в отдельный файл
-        if problem_files:
-            try:
-                with open('problem_files_analysis.json', 'w', encoding='utf-8') as f:
-                    json.dump(problem_files, f, ensure_ascii=False, indent=2)
-            except Exception as file_write_error:
-                print(f"Ошибка при сохранении информации о проблемных файлах: {str(file_write_error)}")
-
         return jsonify({
             'weeks': weeks_list,
             'total_lessons': total_lessons,
             'files_count': len(files),
+            'import_run_id': run.id,
             'problem_files': problem_files,
-            'problem_files_count': len(problem_files)
+            'problem_files_count': len(problem_files),
+            'import_token': import_token,
+            'import_token_ttl': import_staging.ttl
         }), 200
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': f'Ошибка при анализе файлов: {str(e)}'}), 500
 
 
@@ -2400,11 +4932,21 @@ def delete_schedule_by_week(current_user):
         return jsonify({'message': 'Необходимо указать семестр и номер недели'}), 400
 
     try:
+        # Названия групп, преподавателей и аудиторий недели - для перепроверки индекса подсказок
+        week_names = db.session.query(Schedule.group_name, Schedule.teacher_name, Schedule.auditory).filter_by(
+            semester=semester,
+            week_number=week_number
+        ).distinct()
+        register_schedule_dimension_names(
+            {name for row in week_names for name in schedule_dimension_names(row._mapping)}
+        )
+
         # Delete all schedule items for the specified week
         deleted = Schedule.query.filter_by(
             semester=semester,
             week_number=week_number
         ).delete()
+        register_schedule_week_change(semester, week_number)
 
         db.session.commit()
 
@@ -2420,14 +4962,8 @@ def delete_schedule_by_week(current_user):
 @app.route('/api/schedule/upload', methods=['POST'])
 @token_required
 def upload_schedule(current_user):
+    upload_dir = None
     try:
-        # Проверяем наличие файлов в запросе
-        if 'files[]' not in request.files and len(request.files) == 0:
-            return jsonify({'message': 'Не найдены файлы в запросе!'}), 400
-
-        # Получаем семестр
-        semester = int(request.form.get('semester', 1))
-
         # Получаем выбранные недели
         weeks_str = request.form.get('weeks', '[]')
         selected_weeks = json.loads(weeks_str)
@@ -2435,223 +4971,148 @@ def upload_schedule(current_user):
         if not selected_weeks:
             return jsonify({'message': 'Не выбраны недели для импорта!'}), 400
 
-        # Получаем файлы
-        files = []
-        for key in request.files:
-            if key.startswith('files['):
-                files.append(request.files[key])
+        # background=true - импорт ставится в очередь, ответ 202 с идентификатором задачи
+        background = request.form.get('background', '').lower() in ('1', 'true', 'yes')
 
-        if len(files) == 0:
-            return jsonify({'message': 'Не найдены файлы в запросе!'}), 400
+        # Токен анализа: строки уже разобраны и лежат в каталоге подготовки
+        import_token = request.form.get('import_token')
 
-        # Статистика импорта
-        imported_count = 0
-        updated_count = 0
-        failed_count = 0
-        processed_groups = set()
+        if import_token:
+            manifest = import_staging.load(import_token)
+            if manifest is None:
+                return jsonify({'message': 'Результаты анализа устарели. Загрузите файлы повторно.'}), 410
 
-        # Список для хранения проблемных пар
-        problem_lessons = []
+            semester = manifest['semester']
+            if int(request.form.get('semester', semester)) != semester:
+                return jsonify({'message': 'Семестр не совпадает с семестром проанализированных файлов!'}), 400
 
-        # Обрабатываем каждый файл
-        for file in files:
-            try:
-                # Читаем файл с учетом кодировки Windows-1251
-                content = file.read().decode('windows-1251')
+            files_total = len(manifest['files'])
+            saved_files = None
+        else:
+            # Получаем семестр
+            semester = int(request.form.get('semester', 1))
+
+            # Получаем файлы
+            files = []
+            for key in request.files:
+                if key.startswith('files['):
+                    files.append(request.files[key])
+
+            if len(files) == 0:
+                return jsonify({'message': 'Не найдены файлы в запросе!'}), 400
+
+            upload_dir = tempfile.mkdtemp(prefix='schedule_upload_')
+            saved_files = save_uploaded_files(files, upload_dir)
+            files_total = len(saved_files)
+
+        if background:
+            job = import_jobs.submit(ImportJob(
+                current_user.id, semester, selected_weeks, files_total,
+                import_token=import_token, upload_dir=upload_dir, saved_files=saved_files
+            ))
+            # Каталог с файлами теперь удалит задача
+            upload_dir = None
+            response = jsonify(job.to_dict())
+            response.headers['Location'] = f"/api/import_jobs/{job.id}"
+            return response, 202
+
+        if import_token:
+            parsed_files = staged_import_files(manifest)
+        else:
+            # Файлы разбираются параллельно в пуле процессов, а записываются по порядку в этом потоке
+            parsed_files = parse_import_files(saved_files, semester, selected_weeks)
 
-                # Исправляем проблемы с экранированием символов
-                import re
+        result = import_parsed_files(semester, selected_weeks, parsed_files, current_user.id)
 
-                # Экранируем обратные слеши внутри строк
-                def fix_backslashes(match):
-                    content = match.group(0)
-                    # Заменяем одиночные \ на \\, только если они не экранируют специальные символы
-                    return re.sub(r'\\(?!["\\/bfnrt])', r'\\\\', content)
+        if import_token:
+            import_staging.discard(import_token)
 
-                # Ищем все строковые литералы в JSON и фиксируем в них обратные слеши
-                fixed_content = re.sub(r'"[^"\\]*(?:\\.[^"\\]*)*"', fix_backslashes, content)
+        return jsonify(result), 200
 
-                # Парсим JSON
-                data = json.loads(fixed_content)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Ошибка при импорте расписания: {str(e)}'}), 500
+    finally:
+        if upload_dir is not None:
+            shutil.rmtree(upload_dir, ignore_errors=True)
 
-                # Проверяем формат данных
-                if not isinstance(data, list):
-                    continue
 
-                # Обрабатываем каждый объект в массиве данных
-                for item in data:
-                    if 'timetable' not in item:
-                        continue
+# Состояние фонового импорта (видно автору задачи и администраторам)
+@app.route('/api/import_jobs/<job_id>', methods=['GET'])
+@token_required
+def get_import_job(current_user, job_id):
+    job = import_jobs.get(job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != 'admin'):
+        return jsonify({'message': 'Задача импорта не найдена!'}), 404
 
-                    timetable = item['timetable']
-
-                    # Обрабатываем расписание
-                    for week_data in timetable:
-                        week_number = week_data.get('week_number')
-
-                        # Пропускаем недели, которые не были выбраны
-                        if week_number not in selected_weeks:
-                            continue
-
-                        # Обрабатываем группы и занятия
-                        for group_data in week_data.get('groups', []):
-                            group_name = group_data.get('group_name')
-                            course = group_data.get('course')
-                            faculty = group_data.get('faculty')
-
-                            if not group_name or course is None:
-                                continue
-
-                            processed_groups.add(group_name)
-
-                            # Удаляем существующие занятия для этой группы на данной неделе
-                            Schedule.query.filter_by(
-                                semester=semester,
-                                week_number=week_number,
-                                group_name=group_name
-                            ).delete()
-
-                            # Обрабатываем дни и занятия
-                            for day_data in group_data.get('days', []):
-                                weekday = day_data.get('weekday')
-
-                                for lesson in day_data.get('lessons', []):
-                                    try:
-                                        # Извлекаем данные о занятии
-                                        subject = lesson.get('subject')
-                                        lesson_type = lesson.get('type')
-                                        subgroup = lesson.get('subgroup', 0)
-                                        time_start = lesson.get('time_start')
-                                        time_end = lesson.get('time_end')
-
-                                        # Преобразуем дату из строки в объект Date
-                                        date_str = lesson.get('date')
-                                        if date_str:
-                                            # Преобразуем формат даты из DD-MM-YYYY в YYYY-MM-DD
-                                            try:
-                                                day, month, year = date_str.split('-')
-                                                date = datetime.strptime(f"{year}-{month}-{day}", '%Y-%m-%d').date()
-                                            except (ValueError, TypeError) as e:
-                                                # Сохраняем информацию о проблемной паре
-                                                problem_lessons.append({
-                                                    'file': file.filename,
-                                                    'week': week_number,
-                                                    'group': group_name,
-                                                    'subject': subject,
-                                                    'date': date_str,
-                                                    'error': f'Ошибка формата даты: {str(e)}',
-                                                    'raw_data': lesson
-                                                })
-                                                failed_count += 1
-                                                continue
-                                        else:
-                                            # Если даты нет, это проблема
-                                            problem_lessons.append({
-                                                'file': file.filename,
-                                                'week': week_number,
-                                                'group': group_name,
-                                                'subject': subject,
-                                                'error': 'Отсутствует дата занятия',
-                                                'raw_data': lesson
-                                            })
-                                            failed_count += 1
-                                            continue
-
-                                        # Получаем имя преподавателя и аудиторию
-                                        teacher_name = ""
-                                        auditory = ""
-
-                                        if 'teachers' in lesson and lesson['teachers']:
-                                            teacher_name = lesson['teachers'][0].get('teacher_name', '')
-
-                                        if 'auditories' in lesson and lesson['auditories']:
-                                            auditory = lesson['auditories'][0].get('auditory_name', '')
-
-                                        # Проверка обязательных полей
-                                        if not all([subject, time_start, time_end, weekday is not None]):
-                                            problem_lessons.append({
-                                                'file': file.filename,
-                                                'week': week_number,
-                                                'group': group_name,
-                                                'subject': subject,
-                                                'date': date_str,
-                                                'error': 'Отсутствуют обязательные поля (предмет, время начала/окончания, день недели)',
-                                                'raw_data': lesson
-                                            })
-                                            failed_count += 1
-                                            continue
-
-                                        # Создаем новую запись
-                                        new_item = Schedule(
-                                            semester=semester,
-                                            week_number=week_number,
-                                            group_name=group_name,
-                                            course=course,
-                                            faculty=faculty or '',
-                                            subject=subject or '',
-                                            lesson_type=lesson_type or '',
-                                            subgroup=subgroup or 0,
-                                            date=date,
-                                            time_start=time_start or '',
-                                            time_end=time_end or '',
-                                            weekday=weekday or 0,
-                                            teacher_name=teacher_name,
-                                            auditory=auditory
-                                        )
-
-                                        db.session.add(new_item)
-                                        imported_count += 1
-                                    except Exception as e:
-                                        failed_count += 1
-                                        # Сохраняем подробную информацию о проблеме
-                                        problem_lessons.append({
-                                            'file': file.filename,
-                                            'week': week_number,
-                                            'group': group_name,
-                                            'subject': lesson.get('subject', 'Неизвестно'),
-                                            'date': lesson.get('date', 'Неизвестно'),
-                                            'time': f"{lesson.get('time_start', 'Н/Д')}-{lesson.get('time_end', 'Н/Д')}",
-                                            'error': str(e),
-                                            'raw_data': lesson
-                                        })
-                                        continue
-            except Exception as e:
-                # Сохраняем ошибку обработки файла
-                problem_lessons.append({
-                    'file': file.filename,
-                    'error': f"Ошибка обработки файла: {str(e)}",
-                    'is_file_error': True
-                })
-                continue
+    return jsonify(job.to_dict()), 200
 
-        # Сохраняем изменения в БД
-        db.session.commit()
 
-        # Сохраняем проблемные пары в файл или базу данных
-        if problem_lessons:
-            # Вариант 1: Сохранение в файл
-            try:
-                with open('problem_lessons.json', 'w', encoding='utf-8') as f:
-                    json.dump(problem_lessons, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print(f"Ошибка при сохранении проблемных пар в файл: {str(e)}")
+# Отмена фонового импорта: изменения откатываются, если транзакция еще не зафиксирована
+@app.route('/api/import_jobs/<job_id>/cancel', methods=['POST'])
+@token_required
+def cancel_import_job(current_user, job_id):
+    job = import_jobs.get(job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != 'admin'):
+        return jsonify({'message': 'Задача импорта не найдена!'}), 404
 
-            # Вариант 2: Сохранение в базу данных
-            # Здесь можно добавить код для сохранения в БД, если нужно
+    if not job.cancel():
+        return jsonify({'message': 'Задача импорта уже завершена!', **job.to_dict()}), 409
 
-        return jsonify({
-            'message': f'Импорт завершен. Добавлено: {imported_count}, не удалось импортировать: {failed_count} занятий.',
-            'imported_count': imported_count,
-            'updated_count': updated_count,
-            'failed_count': failed_count,
-            'processed_groups': len(processed_groups),
-            'problem_lessons': problem_lessons,  # Возвращаем список проблемных пар
-            'problem_lessons_count': len(problem_lessons)
-        }), 200
+    return jsonify(job.to_dict()), 202
 
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'message': f'Ошибка при импорте расписания: {str(e)}'}), 500
+
+# Проблемы анализа или импорта постранично (автору и администраторам)
+@app.route('/api/import_runs/<int:run_id>/problems', methods=['GET'])
+@token_required
+def get_import_run_problems(current_user, run_id):
+    run = ImportRun.query.get(run_id)
+    if run is None or (run.user_id != current_user.id and current_user.role != 'admin'):
+        return jsonify({'message': 'Запуск импорта не найден!'}), 404
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+    file = request.args.get('file')
+    group_name = request.args.get('group')
+    week_number = request.args.get('week_number', type=int)
+    file_errors = request.args.get('file_errors')
+    search = request.args.get('search')
+
+    query = ImportProblem.query.filter_by(run_id=run.id)
+
+    # Применяем фильтры
+    if file:
+        query = query.filter_by(file=file)
+
+    if group_name:
+        query = query.filter(ImportProblem.group_name == group_name)
+
+    if week_number is not None:
+        query = query.filter_by(week_number=week_number)
+
+    if file_errors is not None:
+        query = query.filter_by(is_file_error=file_errors.lower() in ('1', 'true', 'yes'))
+
+    if search:
+        query = query.filter(
+            or_(
+                ImportProblem.error.ilike(f'%{search}%'),
+                ImportProblem.subject.ilike(f'%{search}%'),
+                ImportProblem.group_name.ilike(f'%{search}%')
+            )
+        )
+
+    total = query.count()
+    items = query.order_by(ImportProblem.id).offset((page - 1) * per_page).limit(per_page).all()
+
+    return jsonify({
+        'run': run.to_dict(),
+        'items': [item.to_dict() for item in items],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page
+    }), 200
 
 
 # Импорт расписания из JSON (старый метод)
@@ -2670,14 +5131,15 @@ def import_schedule(current_user):
     # Обрабатываем каждую запись
     imported_count = 0
     failed_count = 0
+    writer = ScheduleBulkWriter()
 
     for item_data in data:
         try:
             # Преобразуем дату из строки в объект Date
             date = datetime.strptime(item_data['date'], '%Y-%m-%d').date()
 
-            # Создаем новую запись
-            new_item = Schedule(
+            # Значения новой записи
+            row = dict(
                 semester=item_data['semester'],
                 week_number=item_data['week_number'],
                 group_name=item_data['group_name'],
@@ -2693,20 +5155,22 @@ def import_schedule(current_user):
                 teacher_name=item_data.get('teacher_name', ''),
                 auditory=item_data.get('auditory', '')
             )
-
-            db.session.add(new_item)
-            imported_count += 1
         except Exception as e:
             failed_count += 1
             continue
 
+        writer.add(**row)
+        imported_count += 1
+
     # Сохраняем изменения
+    writer.flush()
     db.session.commit()
 
     return jsonify({
         'message': f'Импорт завершен. Успешно импортировано: {imported_count}, не удалось импортировать: {failed_count} записей.',
         'imported_count': imported_count,
-        'failed_count': failed_count
+        'failed_count': failed_count,
+        'write_stats': writer.stats()
     }), 200
 
 
@@ -2721,6 +5185,14 @@ def delete_schedule(current_user, id):
     return jsonify({'message': 'Запись успешно удалена!'}), 200
 
 
+# Статистика кеша ответов (только для администраторов)
+@app.route('/api/cache/stats', methods=['GET'])
+@token_required
+@admin_required
+def get_cache_stats(current_user):
+    return jsonify(response_cache.stats()), 200
+
+
 # CRUD для пользователей (только для администраторов)
 @app.route('/api/users', methods=['GET'])
 @token_required
@@ -2779,6 +5251,7 @@ def update_user(current_user, id):
         user.full_name = data['fullName']
 
     db.session.commit()
+    user_cache.invalidate(user.id)
 
     return jsonify(user.to_dict()), 200
 
@@ -2799,6 +5272,7 @@ def delete_user(current_user, id):
 
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(id)
 
     return jsonify({'message': 'Пользователь успешно удален!'}), 200
 
@@ -2835,6 +5309,7 @@ def create_lesson_type(current_user):
 
     db.session.add(new_lesson_type)
     db.session.commit()
+    reset_lesson_type_registry()
 
     return jsonify(new_lesson_type.to_dict()), 201
 
@@ -2868,6 +5343,7 @@ def update_lesson_type(current_user, id):
 
     lesson_type.updated_at = datetime.utcnow()
     db.session.commit()
+    reset_lesson_type_registry()
 
     return jsonify(lesson_type.to_dict()), 200
 
@@ -2881,6 +5357,7 @@ def delete_lesson_type(current_user, id):
 
     db.session.delete(lesson_type)
     db.session.commit()
+    reset_lesson_type_registry()
 
     return jsonify({'message': 'Тип занятия успешно удален!'}), 200
 
@@ -2949,6 +5426,7 @@ def import_lesson_types(current_user):
             imported_count += 1
 
         db.session.commit()
+        reset_lesson_type_registry()
 
         return jsonify({
             'message': f'Успешно импортировано {imported_count} типов занятий!',
@@ -2959,10 +5437,127 @@ def import_lesson_types(current_user):
         return jsonify({'message': f'Ошибка при импорте: {str(e)}'}), 500
 
 
+# Версионированные миграции схемы: (версия, название, функция)
+MIGRATIONS = []
+
+
+def migration(version, name):
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+
+    return register
+
+
+def add_missing_columns(table_name, columns):
+    """Добавляет в существующую таблицу колонки, которых в ней еще нет (create_all этого не делает)"""
+    existing = {column['name'] for column in sa_inspect(db.engine).get_columns(table_name)}
+    for column_name, column_ddl in columns:
+        if column_name not in existing:
+            db.session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}'))
+
+
+@migration(1, 'schedule_minute_columns')
+def migrate_schedule_minute_columns():
+    add_missing_columns('schedule', [
+        ('start_min', 'INTEGER'),
+        ('end_min', 'INTEGER'),
+        ('slot_id', 'INTEGER REFERENCES time_slot(id)')
+    ])
+
+    # Заполняем минуты пачками, чтобы не держать всю таблицу в памяти
+    table = Schedule.__table__
+    statement = table.update().where(table.c.id == bindparam('row_id')).values(
+        start_min=bindparam('row_start_min'),
+        end_min=bindparam('row_end_min')
+    )
+    last_id = 0
+    while True:
+        rows = db.session.query(Schedule.id, Schedule.time_start, Schedule.time_end).filter(
+            Schedule.id > last_id
+        ).order_by(Schedule.id).limit(5000).all()
+        if not rows:
+            break
+
+        db.session.execute(statement, [{
+            'row_id': row.id,
+            'row_start_min': time_to_minutes(row.time_start),
+            'row_end_min': time_to_minutes(row.time_end)
+        } for row in rows])
+        last_id = rows[-1].id
+
+    refresh_schedule_slot_ids()
+
+
+def create_schedule_indexes(*names):
+    """Создает объявленные в модели Schedule индексы, если их еще нет в базе"""
+    for index in Schedule.__table__.indexes:
+        if index.name in names:
+            index.create(bind=db.session.connection(), checkfirst=True)
+
+
+@migration(2, 'schedule_composite_indexes')
+def migrate_schedule_composite_indexes():
+    create_schedule_indexes('ix_schedule_group_week', 'ix_schedule_teacher_week', 'ix_schedule_auditory_week',
+                            'ix_schedule_semester_week', 'ix_schedule_date_time')
+
+
+@migration(3, 'schedule_dimension_tables')
+def migrate_schedule_dimension_tables():
+    add_missing_columns('schedule', [
+        ('group_id', 'INTEGER REFERENCES study_group(id)'),
+        ('teacher_id', 'INTEGER REFERENCES teacher(id)'),
+        ('auditory_id', 'INTEGER REFERENCES auditory(id)')
+    ])
+    create_schedule_indexes('ix_schedule_group_id', 'ix_schedule_teacher_id', 'ix_schedule_auditory_id')
+
+    # Заполняем справочники уникальными значениями из расписания
+    for kind, (model, name_attribute, id_attribute) in DIMENSIONS.items():
+        name_column = getattr(Schedule, name_attribute)
+        existing = {name for (name,) in db.session.query(model.name)}
+
+        if kind == 'group':
+            rows = db.session.query(name_column, db.func.min(Schedule.course), db.func.min(Schedule.faculty)) \
+                .group_by(name_column).all()
+            values = [{'name': name, 'course': course, 'faculty': faculty}
+                      for name, course, faculty in rows if name and name not in existing]
+        else:
+            rows = db.session.query(name_column).filter(name_column != '').distinct().all()
+            values = [{'name': name} for (name,) in rows if name and name not in existing]
+
+        if values:
+            db.session.execute(model.__table__.insert(), values)
+
+        # Проставляем ссылки одним UPDATE с коррелированным подзапросом
+        db.session.execute(
+            Schedule.__table__.update().values({
+                id_attribute: db.select(model.id).where(model.name == name_column).scalar_subquery()
+            })
+        )
+
+
+def run_migrations():
+    applied = {item.version for item in SchemaMigration.query.all()}
+
+    for version, name, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+
+        try:
+            func()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+            print(f"Применена миграция {version}: {name}")
+        except Exception:
+            db.session.rollback()
+            raise
+
+
 # Создаем функцию для инициализации базы данных
 def init_db():
     with app.app_context():
         db.create_all()
+        run_migrations()
 
         # Check if time slots already exist
         if TimeSlot.query.count() == 0:
@@ -2982,6 +5577,7 @@ def init_db():
                 slot = TimeSlot(**slot_data)
                 db.session.add(slot)
 
+            refresh_schedule_slot_ids()
             db.session.commit()
 
 
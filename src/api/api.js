@@ -42,6 +42,11 @@ export const scheduleApi = {
         return api.get(`/auditories?search=${encodeURIComponent(search)}`);
     },
 
+    // Подсказки поиска по группам, преподавателям и аудиториям (types - через запятую)
+    suggest: (query, types = '', limit = 20) => {
+        return api.get('/search/suggest', {params: {q: query, types, limit}});
+    },
+
     // Получение расписания для группы
     getGroupSchedule: (groupName, semester, week) => {
         return api.get(`/schedule/group/${groupName}?semester=${semester}&week=${week}`);
@@ -223,6 +228,41 @@ export const scheduleApi = {
         });
     },
 
+    // Экспорт диапазона недель в Excel: лист на неделю (layout = 'sheets') или один общий лист ('single')
+    exportWeeksToExcel: (type, id, semester, weekFrom, weekTo, layout = 'sheets') => {
+        return api.get(`/schedule/${type}/${id}/export/weeks`, {
+            params: { semester, week_from: weekFrom, week_to: weekTo, layout },
+            responseType: 'blob'
+        }).then(response => {
+            saveAs(new Blob([response.data]), `${type}_${id}_schedule_${semester}_weeks_${weekFrom}-${weekTo}.xlsx`);
+        });
+    },
+
+    // Адрес ленты iCalendar на семестр для подписки в календаре
+    getCalendarFeedUrl: (type, id, semester) => {
+        return `${API_URL}/schedule/${type}/${encodeURIComponent(id)}/calendar.ics?semester=${semester}`;
+    },
+
+    // Потоковая выгрузка расписания: те же фильтры, что у getAllSchedule, плюс week_from/week_to и date_from/date_to
+    exportScheduleStream: (params = {}, format = 'csv') => {
+        return api.get('/schedule/export/stream', {
+            params: { ...params, format },
+            responseType: 'blob'
+        }).then(response => {
+            saveAs(new Blob([response.data]), `schedule.${format}`);
+        });
+    },
+
+    // Массовый экспорт недели: ZIP-архив с книгой на каждую группу, преподавателя или аудиторию
+    exportBulkToZip: (type, semester, week, faculty = '', course = '') => {
+        return api.get(`/schedule/${type}/export/bulk`, {
+            params: { semester, week, faculty: faculty || undefined, course: course || undefined },
+            responseType: 'blob'
+        }).then(response => {
+            saveAs(new Blob([response.data]), `${type}_schedule_${semester}_${week}.zip`);
+        });
+    },
+
     // CRUD операции для авторизованных пользователей
     createScheduleItem: (data) => {
         return api.post('/schedule', data);
@@ -273,6 +313,20 @@ export const scheduleApi = {
     // Получение всех данных расписания (для админов)
     getAllSchedule: (filters = {}) => {
         return api.get('/schedule', {params: filters});
+    },
+
+    // Состояние и отмена фонового импорта (upload с background=true)
+    getImportJob: (jobId) => {
+        return api.get(`/import_jobs/${jobId}`);
+    },
+
+    cancelImportJob: (jobId) => {
+        return api.post(`/import_jobs/${jobId}/cancel`);
+    },
+
+    // Проблемы анализа/импорта постранично (params: page, per_page, file, group, week_number, search)
+    getImportRunProblems: (runId, params = {}) => {
+        return api.get(`/import_runs/${runId}/problems`, {params});
     }, analyzeScheduleFiles: (formData) => {
         return api.post('/schedule/analyze', formData, {
             headers: {
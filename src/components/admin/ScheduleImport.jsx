@@ -416,13 +416,21 @@ const ScheduleImport = () => {
   const [importing, setImporting] = useState(false);
   const [analyzed, setAnalyzed] = useState(false);
   const [weeks, setWeeks] = useState([]);
+  // Токен разобранных при анализе файлов: импорт по нему не загружает файлы повторно
+  const [importToken, setImportToken] = useState(null);
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(null);
   const [importProgress, setImportProgress] = useState(0);
+  // Фоновая задача импорта: идентификатор и последнее известное состояние
+  const [importJob, setImportJob] = useState(null);
 
   // Состояния для отображения проблем
   const [problemFiles, setProblemFiles] = useState([]);
-  const [problemLessons, setProblemLessons] = useState([]);
+  // Запуск импорта с проблемными парами: id, число проблем и сводка по группам
+  const [problemRun, setProblemRun] = useState(null);
+  // Текущая страница проблемных пар, загружаемая с сервера
+  const [problemPage, setProblemPage] = useState({ items: [], page: 1, pages: 0, total: 0 });
+  const [loadingProblems, setLoadingProblems] = useState(false);
   const [showProblemFilesModal, setShowProblemFilesModal] = useState(false);
   const [showProblemLessonsModal, setShowProblemLessonsModal] = useState(false);
   const [activeTab, setActiveTab] = useState('files');
@@ -442,6 +450,13 @@ const ScheduleImport = () => {
     fetchLoadedWeeks();
   }, [semester]);
 
+  // Загрузка первой страницы проблемных пар при открытии окна
+  useEffect(() => {
+    if (showProblemLessonsModal && problemRun) {
+      fetchProblemPage(1);
+    }
+  }, [showProblemLessonsModal, problemRun]);
+
   // Обновление списка загруженных недель после успешного импорта
   useEffect(() => {
     if (importSuccess) {
@@ -449,6 +464,19 @@ const ScheduleImport = () => {
     }
   }, [importSuccess]);
 
+  // Загрузка страницы проблемных пар последнего импорта
+  const fetchProblemPage = async (page) => {
+    setLoadingProblems(true);
+    try {
+      const response = await scheduleApi.getImportRunProblems(problemRun.id, { page, per_page: 50 });
+      setProblemPage(response.data);
+    } catch (err) {
+      console.error('Ошибка при загрузке проблемных пар:', err);
+    } finally {
+      setLoadingProblems(false);
+    }
+  };
+
   // Функция для загрузки списка недель, уже загруженных в базу данных
   const fetchLoadedWeeks = async () => {
     setLoadingLoadedWeeks(true);
@@ -597,6 +625,7 @@ const ScheduleImport = () => {
     setFiles(prev => prev.filter((_, i) => i !== index));
     setAnalyzed(false);
     setWeeks([]);
+    setImportToken(null);
   };
 
   // Обработчик сброса всех выбранных файлов
@@ -604,6 +633,7 @@ const ScheduleImport = () => {
     setFiles([]);
     setAnalyzed(false);
     setWeeks([]);
+    setImportToken(null);
     setError(null);
   };
 
@@ -643,6 +673,7 @@ const ScheduleImport = () => {
         }));
 
         setWeeks(weeksWithSelection);
+        setImportToken(response.data.import_token || null);
         setAnalyzed(true);
 
         // Проверяем и сохраняем информацию о проблемных файлах
@@ -689,36 +720,93 @@ const ScheduleImport = () => {
     setImporting(true);
     setImportProgress(0);
     setError(null);
-    setProblemLessons([]);
+    setProblemRun(null);
     setImportSuccess(false);
 
-    try {
-      // Создаем FormData для отправки файлов и выбранных недель
+    // Создаем FormData для импорта: по токену анализа или с файлами, если токена нет
+    const buildFormData = (token) => {
       const formData = new FormData();
       formData.append('semester', semester);
 
-      // Добавляем все файлы в FormData
-      files.forEach((file, index) => {
-        formData.append(`files[${index}]`, file);
-      });
+      if (token) {
+        formData.append('import_token', token);
+      } else {
+        // Добавляем все файлы в FormData
+        files.forEach((file, index) => {
+          formData.append(`files[${index}]`, file);
+        });
+      }
 
       // Добавляем выбранные недели
       formData.append('weeks', JSON.stringify(selectedWeeks.map(week => week.week_number)));
 
-      // Отправляем файлы на сервер для импорта
-      const response = await scheduleApi.uploadSchedule(formData, {
-        onUploadProgress: (progressEvent) => {
-          const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-          setImportProgress(percentCompleted);
+      // Импорт выполняется в фоне, чтобы большой файл не упирался в таймаут запроса
+      formData.append('background', 'true');
+      return formData;
+    };
+
+    // Опрашивает фоновую задачу до завершения и возвращает итог импорта
+    const waitForImportJob = async (job) => {
+      while (true) {
+        setImportJob(job);
+        if (job.files_total > 0) {
+          setImportProgress(Math.round((job.files_processed * 100) / job.files_total));
         }
-      });
+
+        if (job.status === 'done') {
+          return job.result;
+        }
+        if (job.status === 'cancelled') {
+          throw new Error('Импорт отменен');
+        }
+        if (job.status === 'failed') {
+          throw new Error(`Ошибка при импорте расписания: ${job.error}`);
+        }
+
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        job = (await scheduleApi.getImportJob(job.id)).data;
+      }
+    };
+
+    const uploadConfig = {
+      onUploadProgress: (progressEvent) => {
+        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+        setImportProgress(percentCompleted);
+      }
+    };
+
+    // Прогресс загрузки файлов сменяется прогрессом обработки задачи
+    const runImport = async (token) => {
+      const response = await scheduleApi.uploadSchedule(buildFormData(token), uploadConfig);
+      if (response.status !== 202) {
+        return response;
+      }
+      setImportProgress(0);
+      return { data: await waitForImportJob(response.data) };
+    };
+
+    try {
+      let response;
+      try {
+        response = await runImport(importToken);
+      } catch (err) {
+        // Результаты анализа устарели - отправляем файлы заново
+        if (!importToken || err.response?.status !== 410) {
+          throw err;
+        }
+        response = await runImport(null);
+      }
 
       // Проверяем наличие проблемных пар
-      if (response.data && response.data.problem_lessons && response.data.problem_lessons.length > 0) {
-        setProblemLessons(response.data.problem_lessons);
+      if (response.data && response.data.problem_lessons_count > 0) {
+        setProblemRun({
+          id: response.data.import_run_id,
+          count: response.data.problem_lessons_count,
+          summary: response.data.problems_summary
+        });
 
         // Показываем уведомление о проблемных парах
-        setError(`Импорт выполнен, но обнаружено ${response.data.problem_lessons.length} проблемных пар. Проверьте подробности.`);
+        setError(`Импорт выполнен, но обнаружено ${response.data.problem_lessons_count} проблемных пар. Проверьте подробности.`);
       } else {
         setImportSuccess(true);
       }
@@ -731,17 +819,50 @@ const ScheduleImport = () => {
       setFiles([]);
       setAnalyzed(false);
       setWeeks([]);
+      setImportToken(null);
 
       // Обновляем список загруженных недель
       fetchLoadedWeeks();
     } catch (err) {
       console.error('Ошибка при импорте расписания:', err);
-      setError(err.response?.data?.message || 'Произошла ошибка при импорте расписания');
+      setError(err.response?.data?.message || err.message || 'Произошла ошибка при импорте расписания');
     } finally {
       setImporting(false);
+      setImportJob(null);
+    }
+  };
+
+  // Обработчик отмены фонового импорта: изменения откатываются, если еще не сохранены
+  const handleCancelImport = async () => {
+    if (!importJob) return;
+
+    try {
+      await scheduleApi.cancelImportJob(importJob.id);
+    } catch (err) {
+      console.error('Ошибка при отмене импорта:', err);
     }
   };
 
+  // Группы недели, у которых число занятий в файлах отличается от сохраненного в базе
+  const renderGroupChanges = (week) => {
+    const changedGroups = (week.groups || []).filter(group => group.incoming_count !== group.existing_count);
+
+    if (changedGroups.length === 0) {
+      return <p style={{ color: '#666' }}>Число занятий по группам не изменилось</p>;
+    }
+
+    const shownGroups = changedGroups.slice(0, 5)
+      .map(group => `${group.group_name} (${group.existing_count} → ${group.incoming_count})`)
+      .join(', ');
+
+    return (
+      <p style={{ color: '#666' }}>
+        Изменится у групп: {shownGroups}
+        {changedGroups.length > 5 && ` и еще ${changedGroups.length - 5}`}
+      </p>
+    );
+  };
+
   // Функция для форматирования российской даты (DD-MM-YYYY) для отображения
   const formatDate = (dateStr) => {
     if (!dateStr) return '';
@@ -1094,7 +1215,13 @@ const ScheduleImport = () => {
                         Групп: {week.groups_count}
                       </span>
                     )}
+                    {week.existing_lessons_count > 0 && (
+                      <span style={{ marginLeft: '10px' }}>
+                        В базе: {week.existing_lessons_count}
+                      </span>
+                    )}
                   </p>
+                  {week.status === 'exists' && renderGroupChanges(week)}
                 </WeekInfo>
                 {week.status && (
                   <StatusBadge
@@ -1127,6 +1254,21 @@ const ScheduleImport = () => {
               <div></div>
             </ProgressBar>
           )}
+
+          {importing && importJob && (
+            <div style={{ marginTop: '10px', fontSize: '14px', color: '#666' }}>
+              Обработано файлов: {importJob.files_processed} из {importJob.files_total},
+              занятий: {importJob.rows_processed} ({importJob.rows_per_second} в секунду)
+              <Button
+                secondary
+                onClick={handleCancelImport}
+                disabled={importJob.cancel_requested}
+                style={{ marginLeft: '15px' }}
+              >
+                {importJob.cancel_requested ? 'Отмена...' : 'Отменить импорт'}
+              </Button>
+            </div>
+          )}
         </StepCard>
       )}
 
@@ -1155,13 +1297,13 @@ const ScheduleImport = () => {
       )}
 
       {/* Кнопка для просмотра проблемных пар */}
-      {problemLessons.length > 0 && (
+      {problemRun && (
         <Card style={{ marginTop: '20px', padding: '16px' }}>
           <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
             <div>
               <h4 style={{ margin: 0 }}>Обнаружены проблемные пары</h4>
               <p style={{ color: colors.gray, margin: '8px 0 0 0' }}>
-                При импорте не удалось обработать {problemLessons.length} занятий.
+                При импорте не удалось обработать {problemRun.count} занятий.
                 Проверьте детали проблемных пар для исправления.
               </p>
             </div>
@@ -1214,7 +1356,7 @@ const ScheduleImport = () => {
         <ModalOverlay onClick={() => setShowProblemLessonsModal(false)}>
           <ModalContent onClick={(e) => e.stopPropagation()}>
             <ModalHeader>
-              <ModalTitle>Проблемные пары ({problemLessons.length})</ModalTitle>
+              <ModalTitle>Проблемные пары ({problemRun.count})</ModalTitle>
               <CloseButton onClick={() => setShowProblemLessonsModal(false)}>×</CloseButton>
             </ModalHeader>
 
@@ -1240,8 +1382,8 @@ const ScheduleImport = () => {
                     </tr>
                   </thead>
                   <tbody>
-                    {problemLessons.map((problem, index) => (
-                      <tr key={index}>
+                    {problemPage.items.map((problem) => (
+                      <tr key={problem.id}>
                         <Td>{problem.file || '-'}</Td>
                         <Td>{problem.group || '-'}</Td>
                         <Td>{problem.subject || '-'}</Td>
@@ -1261,23 +1403,13 @@ const ScheduleImport = () => {
                     </tr>
                   </thead>
                   <tbody>
-                    {Array.from(
-                      problemLessons.reduce((map, problem) => {
-                        const group = problem.group || 'Не указана';
-                        if (!map.has(group)) {
-                          map.set(group, { count: 0, errors: new Set() });
-                        }
-                        map.get(group).count++;
-                        map.get(group).errors.add(problem.error || 'Неизвестная ошибка');
-                        return map;
-                      }, new Map())
-                    ).map(([group, data], index) => (
+                    {(problemRun.summary?.by_group || []).map((data, index) => (
                       <tr key={index}>
-                        <Td>{group}</Td>
+                        <Td>{data.group}</Td>
                         <Td>{data.count}</Td>
                         <Td>
                           <ul style={{ margin: 0, paddingLeft: '16px' }}>
-                            {Array.from(data.errors).map((error, i) => (
+                            {data.errors.map((error, i) => (
                               <li key={i}>{error}</li>
                             ))}
                           </ul>
@@ -1289,6 +1421,26 @@ const ScheduleImport = () => {
               )}
             </div>
 
+            {activeTab === 'files' && problemPage.pages > 1 && (
+              <div style={{ display: 'flex', alignItems: 'center', justifyContent: 'center', gap: '12px', marginTop: '12px' }}>
+                <Button
+                  secondary
+                  onClick={() => fetchProblemPage(problemPage.page - 1)}
+                  disabled={loadingProblems || problemPage.page <= 1}
+                >
+                  Назад
+                </Button>
+                <span>Страница {problemPage.page} из {problemPage.pages}</span>
+                <Button
+                  secondary
+                  onClick={() => fetchProblemPage(problemPage.page + 1)}
+                  disabled={loadingProblems || problemPage.page >= problemPage.pages}
+                >
+                  Вперед
+                </Button>
+              </div>
+            )}
+
             <ButtonRow>
               <ActionModalButton onClick={() => setShowProblemLessonsModal(false)}>
                 Закрыть
@@ -14,6 +14,13 @@ import SearchBar from '../common/SearchBar';
 import TabView from '../common/TabView';
 import { scheduleApi } from '../../api/api';
 
+// Тип расписания (group, teacher, auditory) для каждой вкладки
+const TAB_SCHEDULE_TYPES = {
+  groups: 'group',
+  teachers: 'teacher',
+  auditories: 'auditory'
+};
+
 // Переопределяем PageContainer с адаптивными отступами
 const PageContainer = styled.div`
   padding: 10px 16px;
@@ -269,7 +276,7 @@ const HomePage = () => {
 
     // Просто переходим к расписанию без указания семестра и недели,
     // чтобы SchedulePage автоматически определил текущую неделю
-    navigate(`/schedule/${activeTab.slice(0, -1)}/${itemId}`);
+    navigate(`/schedule/${TAB_SCHEDULE_TYPES[activeTab]}/${itemId}`);
   };
 
   return (
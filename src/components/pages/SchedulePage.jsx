@@ -365,6 +365,25 @@ const SchedulePage = () => {
     }
   };
 
+  // Экспорт всех доступных недель семестра, по листу на неделю
+  const handleExportSemesterToExcel = async () => {
+    if (availableWeeks.length === 0) return;
+    setExporting(true);
+    try {
+      await scheduleApi.exportWeeksToExcel(
+        type, decodedId, semester, availableWeeks[0], availableWeeks[availableWeeks.length - 1]
+      );
+      setSuccess('Расписание за семестр успешно экспортировано');
+      setTimeout(() => setSuccess(null), 3000);
+    } catch (err) {
+      console.error('Ошибка при экспорте расписания за семестр:', err);
+      setError('Произошла ошибка при экспорте расписания. Пожалуйста, попробуйте снова.');
+      setTimeout(() => setError(null), 5000);
+    } finally {
+      setExporting(false);
+    }
+  };
+
   // Возврат на главную страницу
   const handleBack = () => {
     navigate('/');
@@ -498,6 +517,30 @@ const SchedulePage = () => {
               </Button>
             </FormGroup>
           </Column>
+          <Column>
+            <FormGroup>
+              <label>&nbsp;</label>
+              <Button
+                onClick={handleExportSemesterToExcel}
+                disabled={loading || exporting || availableWeeks.length === 0}
+              >
+                Экспорт семестра
+              </Button>
+            </FormGroup>
+          </Column>
+          <Column>
+            <FormGroup>
+              <label>&nbsp;</label>
+              <Button
+                as="a"
+                href={scheduleApi.getCalendarFeedUrl(type, decodedId, semester)}
+                title="Ссылка для подписки на расписание в приложении календаря"
+                style={{textDecoration: 'none'}}
+              >
+                Подписка (iCal)
+              </Button>
+            </FormGroup>
+          </Column>
         </Row>
       </Card>
 